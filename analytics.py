@@ -0,0 +1,157 @@
+"""
+Indicateurs techniques et reechantillonnage sur l'historique OHLCV en
+colonnes (records.HistorySeries) : barres hebdomadaires / mensuelles /
+trimestrielles, SMA, EMA, RSI et volatilite, calcules cote serveur.
+"""
+import numpy as np
+
+from records import HistorySeries
+
+INTERVALS = ("D", "W", "M", "Q")
+BAR_FIELDS = ("open", "high", "low", "close", "volume", "qty", "trades")
+MAX_WINDOW = 250
+TRADING_DAYS = 252
+
+
+def chronological(series: HistorySeries) -> HistorySeries:
+    """Series triee de la seance la plus ancienne a la plus recente"""
+    order = np.argsort(series.dates, kind="stable")
+    return HistorySeries(series.dates[order], {name: col[order] for name, col in series.columns.items()})
+
+
+def _period_keys(dates, interval: str):
+    days = dates.astype("datetime64[D]").astype(np.int64)
+    if interval == "D":
+        return days
+    if interval == "W":
+        # Le 1970-01-01 (jour 0) est un jeudi : semaines du lundi au dimanche
+        return days - (days + 3) % 7
+    months = dates.astype("datetime64[M]").astype(np.int64)
+    return months if interval == "M" else months // 3
+
+
+def resample(series: HistorySeries, interval: str) -> dict:
+    """Barres OHLCV par periode (D, W, M, Q) d'une series chronologique :
+    {"date": derniere seance de chaque periode, "sessions": nb de seances, colonnes...}"""
+    if interval not in INTERVALS:
+        raise ValueError(f"intervalle inconnu: {interval}")
+    if not len(series):
+        return {"date": series.dates, "sessions": np.array([], dtype=np.int64),
+                **{name: np.array([]) for name in BAR_FIELDS}}
+    keys = _period_keys(series.dates, interval)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)] - 1
+    col = series.columns
+    # Cloture absente : dernier cours de la seance
+    close = np.where(np.isnan(col["close"]), col["last"], col["close"])
+    summed = {name: np.add.reduceat(np.nan_to_num(col[name]), starts) for name in ("volume", "qty", "trades")}
+    return {
+        "date": series.dates[ends],
+        "sessions": ends - starts + 1,
+        "open": col["open"][starts],
+        "high": np.fmax.reduceat(col["high"], starts),
+        "low": np.fmin.reduceat(col["low"], starts),
+        "close": close[ends],
+        **summed,
+    }
+
+
+# ─── INDICATEURS (tableaux alignes sur les barres, NaN pendant l'amorce) ─────
+def sma(values, window: int):
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        total = np.cumsum(np.r_[0.0, values])
+        out[window - 1:] = (total[window:] - total[:-window]) / window
+    return out
+
+
+def ema(values, window: int):
+    """Moyenne exponentielle (alpha = 2 / (window + 1)), amorcee par la SMA des
+    `window` premieres valeurs"""
+    out = np.full(len(values), np.nan)
+    if len(values) < window:
+        return out
+    alpha = 2 / (window + 1)
+    current = values[:window].mean()
+    out[window - 1] = current
+    for i in range(window, len(values)):
+        current += alpha * (values[i] - current)
+        out[i] = current
+    return out
+
+
+def rsi(values, window: int):
+    """RSI de Wilder sur `window` periodes"""
+    out = np.full(len(values), np.nan)
+    if len(values) <= window:
+        return out
+    deltas = np.diff(values)
+    gains, losses = np.clip(deltas, 0, None), np.clip(-deltas, 0, None)
+    avg_gain, avg_loss = gains[:window].mean(), losses[:window].mean()
+    for i in range(window, len(values)):
+        if i > window:
+            avg_gain = (avg_gain * (window - 1) + gains[i - 1]) / window
+            avg_loss = (avg_loss * (window - 1) + losses[i - 1]) / window
+        if avg_loss == 0:
+            # Aucune variation sur la fenetre (titre sans transactions) : pas de signal
+            out[i] = np.nan if avg_gain == 0 else 100.0
+        else:
+            out[i] = 100 - 100 / (1 + avg_gain / avg_loss)
+    return out
+
+
+def volatility(values, window: int, periods_per_year: float = TRADING_DAYS):
+    """Volatilite annualisee (ecart-type glissant des rendements logarithmiques)"""
+    out = np.full(len(values), np.nan)
+    if len(values) <= window:
+        return out
+    returns = np.diff(np.log(values))
+    windows = np.lib.stride_tricks.sliding_window_view(returns, window)
+    out[window:] = windows.std(axis=1, ddof=1) * np.sqrt(periods_per_year)
+    return out
+
+
+INDICATORS = {"sma": sma, "ema": ema, "rsi": rsi, "volatility": volatility}
+# Periodes par an selon l'intervalle des barres (annualisation de la volatilite)
+PERIODS_PER_YEAR = {"D": TRADING_DAYS, "W": 52, "M": 12, "Q": 4}
+
+
+def parse_indicators(spec: str):
+    """'sma:20,rsi:14' -> [("sma", 20), ("rsi", 14)] ; ValueError si invalide"""
+    parsed = []
+    for item in (spec or "").split(","):
+        item = item.strip().lower()
+        if not item:
+            continue
+        name, _, window = item.partition(":")
+        if name not in INDICATORS:
+            raise ValueError(f"indicateur inconnu: {name}")
+        window = int(window) if window else 14
+        if not 2 <= window <= MAX_WINDOW:
+            raise ValueError(f"periode hors limites (2-{MAX_WINDOW}): {window}")
+        parsed.append((name, window))
+    return list(dict.fromkeys(parsed))
+
+
+def compute(name: str, window: int, bars: dict, interval: str = "D"):
+    """Un indicateur sur les cours de cloture des barres"""
+    if name == "volatility":
+        return volatility(bars["close"], window, PERIODS_PER_YEAR[interval])
+    return INDICATORS[name](bars["close"], window)
+
+
+def to_list(values, digits: int = 4):
+    """Tableau -> liste JSON (NaN -> None)"""
+    return [None if v != v else round(v, digits) for v in np.asarray(values, dtype=np.float64).tolist()]
+
+
+def bar_rows(bars: dict):
+    """Barres -> lignes JSON"""
+    columns = {name: to_list(bars[name]) for name in BAR_FIELDS}
+    for name in ("qty", "trades"):
+        columns[name] = bars[name].astype(np.int64).tolist()
+    return [
+        {"date": day, "sessions": sessions, **{name: columns[name][i] for name in BAR_FIELDS}}
+        for i, (day, sessions) in enumerate(zip(np.datetime_as_string(bars["date"], unit="D").tolist(),
+                                                bars["sessions"].tolist()))
+    ]
@@ -0,0 +1,255 @@
+"""
+Benchmarks de charge contre le simulateur BVC local : demarre le simulateur
+et l'API (uvicorn, sous-processus), joue les scenarios et affiche par
+scenario p50 / p99, requetes/s et appels upstream par requete client.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --scenario history --concurrency 32 --json results.json
+
+Les resultats sont reproductibles a configuration egale (payloads
+deterministes, graine SIM_SEED) ; comparer deux commits avec les memes
+options et le meme --latency-ms.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def _server(target: str, env: dict):
+    """Serveur uvicorn en sous-processus, pret quand le port repond"""
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env={**os.environ, **env},
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"{target} s'est arrete au demarrage")
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                    break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{target} ne repond pas")
+                time.sleep(0.1)
+        yield url
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+
+def _wait_ready(url: str, timeout: float = 60):
+    """Attend la fin du prechauffage (/health/ready), pour que ses appels
+    upstream ne soient pas comptes dans le premier scenario"""
+    deadline = time.monotonic() + timeout
+    while httpx.get(f"{url}/health/ready").status_code != 200:
+        if time.monotonic() > deadline:
+            raise RuntimeError("l'API n'est pas prete")
+        time.sleep(0.1)
+
+
+@contextmanager
+def _app(simulator_url: str, **env):
+    """API pointee sur le simulateur, sans poller, avec un DATA_DIR vierge,
+    prete (prechauffage termine) a la sortie"""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            "BVC_BASE_URL": simulator_url,
+            "DATA_DIR": tmp,
+            "POLLER_ENABLED": "0",
+            "LOG_LEVEL": os.getenv("LOG_LEVEL", "warning"),
+            **env,
+        }
+        with _server("main:app", env) as url:
+            _wait_ready(url)
+            yield url
+
+
+# ─── SCENARIOS ───────────────────────────────────────────────────────────────
+def _history_range(years: int):
+    end = date.today() - timedelta(days=1)
+    return (end - timedelta(days=365 * years)).isoformat(), end.isoformat()
+
+
+def market_fanout(tickers):
+    """Lectures du snapshot marche sous toutes ses formes"""
+    paths = ["/api/v1/market", "/api/v1/market/summary", "/api/v1/indices",
+             f"/api/v1/stocks?tickers={','.join(tickers[:5])}"]
+    paths += [f"/api/v1/stocks/{t}" for t in tickers[:10]]
+    return paths
+
+
+def top_lists(tickers):
+    return [f"/api/v1/top/{name}?limit=10" for name in ("gainers", "losers", "active", "capitalisation", "trades")]
+
+
+def screener(tickers):
+    return ["/api/v1/screener?filter=variation_pct:gt:0,volume:gte:100000&sort=-capitalisation&limit=20",
+            "/api/v1/screener?filter=sector:eq:Banques&sort=-variation_pct&fields=ticker,variation_pct",
+            "/api/v1/sectors"]
+
+
+def history(tickers, years: int = 5):
+    """Historique pluriannuel de quelques titres (pagination instrument_history)"""
+    start, end = _history_range(years)
+    return [f"/api/v1/historical/{t}?from_date={start}&to_date={end}" for t in tickers[:4]]
+
+
+SCENARIOS = {"market_fanout": market_fanout, "top_lists": top_lists, "screener": screener, "history": history}
+
+
+class Stats:
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.elapsed = 0.0
+        self.upstream_calls = 0
+
+    def report(self) -> dict:
+        ordered = sorted(self.latencies)
+        count = len(ordered)
+
+        def pct(p):
+            return round(ordered[min(count - 1, int(p * count))] * 1000, 2) if count else None
+        return {
+            "scenario": self.name,
+            "requests": count,
+            "errors": self.errors,
+            "p50_ms": pct(0.50),
+            "p99_ms": pct(0.99),
+            "rps": round(count / self.elapsed, 1) if self.elapsed else None,
+            "upstream_per_request": round(self.upstream_calls / count, 3) if count else None,
+        }
+
+
+async def _upstream_calls(client: httpx.AsyncClient, simulator_url: str, **config) -> int:
+    """Appels recus par le simulateur ; remet ses compteurs a zero"""
+    total = (await client.get(f"{simulator_url}/_stats")).json()["total"]
+    await client.post(f"{simulator_url}/_config", params=config)
+    return total
+
+
+async def _load(app_url: str, simulator_url: str, name: str, paths, requests: int, concurrency: int):
+    """`requests` requetes reparties sur `concurrency` clients, en cycle sur `paths`"""
+    stats = Stats(name)
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(paths[i % len(paths)])
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=120) as client:
+        await _upstream_calls(client, simulator_url)
+
+        async def worker():
+            while not queue.empty():
+                path = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    r = await client.get(path)
+                    await r.aread()
+                    if r.status_code >= 400:
+                        stats.errors += 1
+                except httpx.HTTPError:
+                    stats.errors += 1
+                stats.latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        stats.elapsed = time.perf_counter() - start
+        stats.upstream_calls = await _upstream_calls(client, simulator_url)
+    return stats
+
+
+async def _cold_symbols(simulator_url: str, tickers, iterations: int):
+    """Premiere requete d'historique sur une API neuve : buildId, listing,
+    fiches symboles puis une page d'historique, sans index ni cache (donc
+    sans prechauffage)"""
+    stats = Stats("cold_symbols")
+    start_date, end_date = _history_range(1)
+    for i in range(iterations):
+        with _app(simulator_url, WARMUP_ENABLED="0") as app_url:
+            async with httpx.AsyncClient(timeout=120) as client:
+                await _upstream_calls(client, simulator_url)
+                ticker = tickers[i % len(tickers)]
+                start = time.perf_counter()
+                r = await client.get(f"{app_url}/api/v1/historical/{ticker}",
+                                     params={"from_date": start_date, "to_date": end_date})
+                elapsed = time.perf_counter() - start
+                stats.latencies.append(elapsed)
+                stats.elapsed += elapsed
+                stats.errors += r.status_code >= 400
+                stats.upstream_calls += await _upstream_calls(client, simulator_url)
+    return stats
+
+
+async def run(args):
+    sim_env = {
+        "SIM_LATENCY_MS": str(args.latency_ms),
+        "SIM_JITTER_MS": str(args.jitter_ms),
+        "SIM_FAILURE_RATE": str(args.failure_rate),
+        "SIM_INSTRUMENTS": str(args.instruments),
+    }
+    results = []
+    with _server("benchmarks.simulator:app", sim_env) as simulator_url:
+        async with httpx.AsyncClient() as client:
+            listing = (await client.get(f"{simulator_url}/api/proxy/fr/api/bourse/dashboard/ticker")).json()
+        tickers = [row["ticker"] for row in listing["data"]["values"]]
+        selected = [args.scenario] if args.scenario != "all" else [*SCENARIOS, "cold_symbols"]
+        with _app(simulator_url) as app_url:
+            for name in selected:
+                if name in SCENARIOS:
+                    stats = await _load(app_url, simulator_url, name, SCENARIOS[name](tickers),
+                                        args.requests, args.concurrency)
+                    results.append(stats.report())
+        if "cold_symbols" in selected:
+            results.append((await _cold_symbols(simulator_url, tickers, args.cold_iterations)).report())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de charge contre le simulateur BVC")
+    parser.add_argument("--scenario", default="all", choices=["all", *SCENARIOS, "cold_symbols"])
+    parser.add_argument("--requests", type=int, default=500, help="requetes par scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--cold-iterations", type=int, default=3)
+    parser.add_argument("--instruments", type=int, default=75)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--failure-rate", type=float, default=0)
+    parser.add_argument("--json", metavar="FILE", help="ecrit aussi les resultats en JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    header = ("scenario", "requests", "errors", "p50_ms", "p99_ms", "rps", "upstream_per_request")
+    print("  ".join(f"{h:>20}" for h in header))
+    for row in results:
+        print("  ".join(f"{str(row[h]):>20}" for h in header))
+    if args.json:
+        Path(args.json).write_text(json.dumps({"config": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Simulateur local de l'upstream BVC pour les benchmarks : rejoue des payloads
+au format casablanca-bourse.com (ticker, grouped_index_watch, listing
+_next/data, fiches symboles, instrument_history) avec une latence et un
+taux d'echec configurables, et compte les appels recus par endpoint.
+
+Les payloads sont lus dans SIM_FIXTURES_DIR (captures reelles ou jeu
+genere par `python -m benchmarks.simulator --record DIR`), sinon generes
+de maniere deterministe (graine SIM_SEED).
+
+    uvicorn benchmarks.simulator:app --port 9000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+from collections import Counter
+from datetime import date, timedelta
+from functools import lru_cache
+from pathlib import Path
+
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+
+SIM_FIXTURES_DIR = os.getenv("SIM_FIXTURES_DIR", "")
+SIM_SEED = int(os.getenv("SIM_SEED", "42"))
+SIM_INSTRUMENTS = int(os.getenv("SIM_INSTRUMENTS", "75"))
+SIM_HISTORY_YEARS = int(os.getenv("SIM_HISTORY_YEARS", "10"))
+BUILD_ID = "sim-build"
+
+SECTORS = ("Banques", "Telecoms", "Assurances", "Immobilier", "Mines", "Agroalimentaire",
+           "Batiment", "Distribution", "Energie", "Transport")
+INDEX_CATEGORIES = {
+    "Indices generaux": ("MASI", "MSI20", "MASI ESG"),
+    "Indices sectoriels": tuple(s.upper()[:6] for s in SECTORS),
+}
+
+
+# ─── PAYLOADS (format upstream) ──────────────────────────────────────────────
+def _instruments(count: int, seed: int):
+    rng = random.Random(seed)
+    return [
+        {
+            "id": 500 + i,
+            "ticker": f"S{i:03d}",
+            "name": f"Societe {i:03d}",
+            "sector": SECTORS[i % len(SECTORS)],
+            "price": round(rng.uniform(20, 3000), 2),
+        }
+        for i in range(count)
+    ]
+
+
+def generate(count: int = SIM_INSTRUMENTS, seed: int = SIM_SEED) -> dict:
+    """Payloads ticker / grouped_index_watch / fiches symboles, deterministes"""
+    rng = random.Random(seed)
+    values, symbols = [], {}
+    for inst in _instruments(count, seed):
+        ref = inst["price"]
+        last = round(ref * (1 + rng.uniform(-0.06, 0.06)), 2)
+        qty = rng.randint(0, 50000)
+        values.append({
+            "ticker": inst["ticker"],
+            "label": inst["name"],
+            "sous_secteur": inst["sector"],
+            "field_cours_courant": str(last),
+            "field_static_reference_price": str(ref),
+            "field_opening_price": str(ref),
+            "field_high_price": str(max(ref, last)),
+            "field_low_price": str(min(ref, last)),
+            "field_var_veille": str(round((last / ref - 1) * 100, 2)),
+            "field_cumul_volume_echange": str(round(qty * last, 2)),
+            "field_cumul_titres_echanges": str(qty),
+            "field_total_trades": str(rng.randint(0, 400)),
+            "field_capitalisation": str(round(last * rng.randint(10 ** 6, 10 ** 8), 2)),
+            "field_etat_cot_val": "T",
+            "field_best_bid_price": str(round(last * 0.998, 2)),
+            "field_best_ask_price": str(round(last * 1.002, 2)),
+        })
+        symbols[str(inst["id"])] = {"data": {"attributes": {
+            "symbol": inst["ticker"], "libelleFR": inst["name"], "drupal_internal__id": inst["id"],
+        }}}
+    indices = []
+    for title, codes in INDEX_CATEGORIES.items():
+        items = []
+        for code in codes:
+            value = rng.uniform(1000, 20000)
+            items.append({
+                "index": code, "index_url": f"/fr/live-market/indices/{code}",
+                "field_index_value": str(round(value, 2)), "veille": str(round(value * 0.998, 2)),
+                "field_var_veille": str(round(rng.uniform(-2, 2), 2)),
+                "field_var_year": str(round(rng.uniform(-15, 25), 2)),
+                "field_index_high_value": str(round(value * 1.01, 2)),
+                "field_index_low_value": str(round(value * 0.99, 2)),
+                "field_market_capitalisation": str(round(value * 10 ** 8, 2)),
+            })
+        indices.append({"title": title, "items": items})
+    return {
+        "ticker": {"data": {"values": values}},
+        "grouped_index_watch": {"data": indices},
+        "symbols": symbols,
+    }
+
+
+def history_items(symbol_id: str, years: int = SIM_HISTORY_YEARS, seed: int = SIM_SEED):
+    """Seances (jours ouvres) d'un instrument, de la plus recente a la plus ancienne"""
+    rng = random.Random(f"{seed}:{symbol_id}")
+    day = date.today() - timedelta(days=1)
+    start = day - timedelta(days=365 * years)
+    price = rng.uniform(20, 3000)
+    items = []
+    while day >= start:
+        if day.weekday() < 5:
+            close = price
+            price = max(1.0, price * (1 + rng.gauss(0, 0.015)))
+            qty = rng.randint(0, 20000)
+            items.append({"attributes": {
+                "symbol": symbol_id,
+                "created": f"{day.isoformat()}T00:00:00+01:00",
+                "openingPrice": str(round(price, 2)),
+                "closingPrice": str(round(close, 2)),
+                "coursCourant": str(round(close, 2)),
+                "highPrice": str(round(max(price, close) * 1.005, 2)),
+                "lowPrice": str(round(min(price, close) * 0.995, 2)),
+                "cumulTitresEchanges": str(qty),
+                "cumulVolumeEchange": str(round(qty * close, 2)),
+                "totalTrades": str(rng.randint(0, 300)),
+                "capitalisation": str(round(close * 10 ** 7, 2)),
+            }})
+        day -= timedelta(days=1)
+    return items
+
+
+def record(directory: str, count: int = SIM_INSTRUMENTS, seed: int = SIM_SEED):
+    """Ecrit un jeu de payloads rejouable (memes noms de fichiers que des captures reelles)"""
+    root = Path(directory)
+    (root / "symbols").mkdir(parents=True, exist_ok=True)
+    (root / "history").mkdir(exist_ok=True)
+    payloads = generate(count, seed)
+    for name in ("ticker", "grouped_index_watch"):
+        (root / f"{name}.json").write_text(json.dumps(payloads[name]), encoding="utf-8")
+    for symbol_id, payload in payloads["symbols"].items():
+        (root / "symbols" / f"{symbol_id}.json").write_text(json.dumps(payload), encoding="utf-8")
+        (root / "history" / f"{symbol_id}.json").write_text(
+            json.dumps({"data": history_items(symbol_id, seed=seed)}), encoding="utf-8")
+
+
+def load(directory: str) -> dict:
+    """Payloads enregistres dans `directory` (ticker.json, grouped_index_watch.json, symbols/*.json)"""
+    root = Path(directory)
+    return {
+        "ticker": json.loads((root / "ticker.json").read_text(encoding="utf-8")),
+        "grouped_index_watch": json.loads((root / "grouped_index_watch.json").read_text(encoding="utf-8")),
+        "symbols": {p.stem: json.loads(p.read_text(encoding="utf-8")) for p in (root / "symbols").glob("*.json")},
+    }
+
+
+@lru_cache(maxsize=None)
+def _history(symbol_id: str):
+    recorded = Path(SIM_FIXTURES_DIR, "history", f"{symbol_id}.json") if SIM_FIXTURES_DIR else None
+    if recorded is not None and recorded.exists():
+        return json.loads(recorded.read_text(encoding="utf-8"))["data"]
+    return history_items(symbol_id)
+
+
+# ─── SERVEUR ─────────────────────────────────────────────────────────────────
+app = FastAPI(title="Simulateur BVC", docs_url=None, redoc_url=None)
+PAYLOADS = load(SIM_FIXTURES_DIR) if SIM_FIXTURES_DIR else generate()
+state = {
+    "latency_ms": float(os.getenv("SIM_LATENCY_MS", "50")),
+    "jitter_ms": float(os.getenv("SIM_JITTER_MS", "20")),
+    "failure_rate": float(os.getenv("SIM_FAILURE_RATE", "0")),
+    "calls": Counter(),
+}
+_rng = random.Random(SIM_SEED)
+
+
+async def _upstream(endpoint: str):
+    """Compte l'appel, applique la latence ; reponse 503 si echec simule"""
+    state["calls"][endpoint] += 1
+    delay = max(0.0, _rng.gauss(state["latency_ms"], state["jitter_ms"])) / 1000
+    await asyncio.sleep(delay)
+    if _rng.random() < state["failure_rate"]:
+        return Response(status_code=503)
+    return None
+
+
+@app.get("/fr")
+async def home():
+    failed = await _upstream("home")
+    next_data = json.dumps({"buildId": BUILD_ID, "page": "/"})
+    return failed or HTMLResponse(
+        f'<html><body><script id="__NEXT_DATA__" type="application/json">{next_data}</script></body></html>')
+
+
+@app.get("/api/proxy/fr/api/bourse/dashboard/ticker")
+async def ticker():
+    return await _upstream("market") or JSONResponse(PAYLOADS["ticker"])
+
+
+@app.get("/api/proxy/fr/api/bourse/dashboard/grouped_index_watch")
+async def grouped_index_watch():
+    return await _upstream("indices") or JSONResponse(PAYLOADS["grouped_index_watch"])
+
+
+@app.get("/_next/data/{build_id}/fr/live-market/marche-actions-listing.json")
+async def listing(build_id: str, request: Request):
+    failed = await _upstream("listing")
+    if failed:
+        return failed
+    base = str(request.base_url).rstrip("/")
+    instruments = [
+        {"relationships": {"symbol": {"links": {"related": {"href": f"{base}/api/symbol/{symbol_id}"}}}}}
+        for symbol_id in PAYLOADS["symbols"]
+    ]
+    widget = {"extra_field": {"collection": {"data": {"data": instruments}}}}
+    return JSONResponse({"pageProps": {"node": {"field_vactory_paragraphs": [
+        {"field_vactory_component": {"widget_id": "bourse_data_listing:marches-actions",
+                                     "widget_data": json.dumps(widget)}},
+    ]}}})
+
+
+@app.get("/api/symbol/{symbol_id}")
+async def symbol(symbol_id: str):
+    failed = await _upstream("symbol")
+    if failed:
+        return failed
+    payload = PAYLOADS["symbols"].get(symbol_id)
+    return JSONResponse(payload) if payload else Response(status_code=404)
+
+
+@app.get("/api/proxy/fr/api/bourse_data/instrument_history")
+async def instrument_history(request: Request):
+    failed = await _upstream("history")
+    if failed:
+        return failed
+    q = request.query_params
+    symbol_id = q.get("filter[filter-historique-instrument-emetteur][condition][value]", "")
+    start = q.get("filter[filter-date-start-vh][condition][value]", "0000")
+    end = q.get("filter[filter-date-end-vh][condition][value]", "9999")
+    offset, limit = int(q.get("page[offset]", "0")), int(q.get("page[limit]", "50"))
+    rows = [item for item in _history(symbol_id) if start <= item["attributes"]["created"][:10] <= end]
+    return JSONResponse({"data": rows[offset:offset + limit]})
+
+
+@app.get("/_stats")
+async def stats():
+    """Appels recus par endpoint depuis le dernier /_config"""
+    return {"total": sum(state["calls"].values()), "calls": dict(state["calls"])}
+
+
+@app.post("/_config")
+async def configure(latency_ms: float = None, jitter_ms: float = None, failure_rate: float = None):
+    """Latence / taux d'echec modifiables entre deux scenarios ; remet les compteurs a zero"""
+    for key, value in (("latency_ms", latency_ms), ("jitter_ms", jitter_ms), ("failure_rate", failure_rate)):
+        if value is not None:
+            state[key] = value
+    state["calls"].clear()
+    return {k: v for k, v in state.items() if k != "calls"}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ecrit un jeu de payloads BVC simules")
+    parser.add_argument("--record", metavar="DIR", required=True)
+    parser.add_argument("--instruments", type=int, default=SIM_INSTRUMENTS)
+    args = parser.parse_args()
+    record(args.record, args.instruments)
@@ -0,0 +1,320 @@
+"""
+Cache des snapshots de la Bourse de Casablanca (marche live, indices,
+buildId, index des symboles, pages d'historique), sur deux niveaux :
+
+- en memoire, par processus, avec TTL et coalescence des requetes
+  concurrentes sur une meme cle (un seul appel upstream, les autres attendent) ;
+- optionnellement partage entre workers / replicas via Redis
+  (CACHE_BACKEND=redis), avec un verrou distribue pour qu'un seul d'entre
+  eux rafraichisse une cle donnee.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+
+from http_client import UPSTREAM_DEADLINE, UpstreamUnavailable
+
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+REDIS_URL = os.getenv("REDIS_URL", "")
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "redis" if REDIS_URL else "memory")
+CACHE_LOCK_TTL = float(os.getenv("CACHE_LOCK_TTL", "30"))
+CACHE_LOCK_POLL = 0.05
+# Attente maximale de la valeur publiee par le worker qui tient le verrou
+CACHE_LOCK_WAIT = min(CACHE_LOCK_TTL, UPSTREAM_DEADLINE)
+# Duree de vie de la trace d'un fetch en echec, lue par les workers en attente
+CACHE_FAILURE_TTL = 5
+# Fenetre (secondes apres expiration) pendant laquelle l'ancienne valeur est
+# servie immediatement pendant son rafraichissement en arriere-plan
+CACHE_STALE_WHILE_REVALIDATE = float(os.getenv("CACHE_STALE_WHILE_REVALIDATE", "30"))
+KEY_PREFIX = "bourse:"
+
+log = logging.getLogger(__name__)
+
+
+class RedisBackend:
+    """Stockage partage : valeurs JSON avec TTL et verrou distribue (SET NX PX)"""
+
+    name = "redis"
+
+    def __init__(self, client):
+        self.redis = client
+
+    @classmethod
+    def from_url(cls, url: str):
+        import redis.asyncio as aioredis
+        return cls(aioredis.from_url(url))
+
+    async def get(self, key: str):
+        """(valeur, secondes restantes) ou None"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            raw, pttl = await pipe.get(KEY_PREFIX + key).pttl(KEY_PREFIX + key).execute()
+        if raw is None:
+            return None
+        return json.loads(raw), max(pttl, 0) / 1000
+
+    async def set(self, key: str, value, ttl: float):
+        await self.redis.set(KEY_PREFIX + key, json.dumps(value, default=str), px=max(int(ttl * 1000), 1))
+
+    async def acquire(self, key: str, ttl: float = CACHE_LOCK_TTL):
+        """Jeton du verrou si on l'obtient, None s'il est deja tenu"""
+        token = uuid.uuid4().hex
+        locked = await self.redis.set(f"{KEY_PREFIX}lock:{key}", token, nx=True, px=max(int(ttl * 1000), 1))
+        return token if locked else None
+
+    async def locked(self, key: str) -> bool:
+        return bool(await self.redis.exists(f"{KEY_PREFIX}lock:{key}"))
+
+    async def release(self, key: str, token: str):
+        """Libere le verrou seulement s'il nous appartient encore"""
+        lock_key = f"{KEY_PREFIX}lock:{key}"
+        async with self.redis.pipeline() as pipe:
+            await pipe.watch(lock_key)
+            current = await pipe.get(lock_key)
+            if current is not None and current.decode() == token:
+                pipe.multi()
+                pipe.delete(lock_key)
+                await pipe.execute()
+            else:
+                await pipe.unwatch()
+
+
+def make_backend():
+    """Backend partage selon CACHE_BACKEND (None = cache en memoire seulement)"""
+    if CACHE_BACKEND != "redis":
+        return None
+    try:
+        return RedisBackend.from_url(REDIS_URL or "redis://localhost:6379/0")
+    except ImportError:
+        log.error("paquet redis non installe, cache en memoire seulement")
+        return None
+
+
+class SnapshotCache:
+    """Cache cle -> (valeur, timestamp, ttl) avec TTL et compteurs hit/miss,
+    adosse a un backend partage optionnel. max_entries > 0 : au plus
+    max_entries entrees en memoire, les moins recemment lues sont evincees"""
+
+    def __init__(self, ttl: float = CACHE_TTL, backend=None, max_entries: int = 0):
+        self.ttl = ttl
+        self.backend = backend
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self.stale_hits = 0
+        self._entries = {}
+        self._flights = {}
+        self._codecs = {}
+
+    def register(self, prefix: str, encode, decode):
+        """Conversion objet <-> JSON pour les cles `prefix` ou `prefix:...`
+        stockees dans le backend partage (par defaut : valeur JSON telle quelle)"""
+        self._codecs[prefix] = (encode, decode)
+
+    def _codec(self, key):
+        return self._codecs.get(key.split(":", 1)[0], (None, None))
+
+    def _fresh(self, key, now):
+        entry = self._entries.get(key)
+        if entry and (now - entry[1]) < entry[2]:
+            return entry
+        return None
+
+    async def get_or_fetch(self, key, fetch, ttl: float = None, local: bool = True, swr: float = 0):
+        """Retourne la valeur en cache, ou attend fetch() une seule fois
+        pour tous les appelants concurrents. Les resultats vides ne sont
+        pas mis en cache. local=False : pas de copie en memoire (valeurs
+        volumineuses deja persistees ailleurs), seulement le backend partage.
+        swr : pendant `swr` secondes apres expiration, l'ancienne valeur est
+        renvoyee sans attendre et rafraichie en arriere-plan."""
+        if local:
+            now = time.time()
+            entry = self._fresh(key, now)
+            if entry:
+                self.hits += 1
+                if self.max_entries:
+                    self._entries[key] = self._entries.pop(key)
+                return entry[0]
+            entry = self._entries.get(key)
+            if entry and swr and (now - entry[1]) < entry[2] + swr:
+                self.stale_hits += 1
+                self._flight(key, fetch, ttl, local)
+                return entry[0]
+        return (await asyncio.shield(self._flight(key, fetch, ttl, local)))[0]
+
+    def _flight(self, key, fetch, ttl, local):
+        """Chargement en cours de la cle, demarre s'il n'y en a pas"""
+        flight = self._flights.get(key)
+        if flight is None:
+            self.misses += 1
+            flight = self._flights[key] = asyncio.ensure_future(
+                self._load(key, fetch, self.ttl if ttl is None else ttl))
+            flight.add_done_callback(lambda f: self._land(key, f, local))
+        return flight
+
+    async def _load(self, key, fetch, ttl):
+        """(valeur, ttl) depuis le backend partage, sinon depuis fetch() sous
+        verrou distribue ; pendant ce temps les autres workers attendent la
+        publication de la valeur plutot que d'appeler l'upstream. Ils ne
+        rejouent pas l'appel quand le verrou est libere sans valeur : ils
+        renvoient le meme resultat vide, ou levent UpstreamUnavailable si le
+        fetch a leve une exception ou apres CACHE_LOCK_WAIT (attente bornee
+        quand l'upstream est degrade, sans confondre echec et resultat vide)."""
+        if self.backend is None:
+            return await fetch(), ttl
+        shared = await self._shared_get(key)
+        if shared is not None:
+            return shared
+        token = await self._acquire(key)
+        if token is None:
+            deadline = time.monotonic() + CACHE_LOCK_WAIT
+            while time.monotonic() < deadline:
+                await asyncio.sleep(CACHE_LOCK_POLL)
+                # Verrou lu avant la valeur : une publication suivie de la
+                # liberation du verrou entre les deux lectures n'est pas manquee
+                locked = await self._locked(key)
+                shared = await self._shared_get(key)
+                if shared is not None:
+                    return shared
+                if not locked:
+                    failure = await self._failure(key)
+                    if failure is not None:
+                        raise UpstreamUnavailable(failure)
+                    return None, ttl
+            raise UpstreamUnavailable(f"{key}: attente du verrou depassee")
+        try:
+            value = await fetch()
+            if value:
+                await self._shared_set(key, value, ttl)
+            return value, ttl
+        except Exception as e:
+            # Publie avant la liberation du verrou, pour les workers en attente
+            await self._mark_failed(key, e)
+            raise
+        finally:
+            if token:
+                await self._release(key, token)
+
+    def _land(self, key, flight, local):
+        """Fin d'un fetch : libere la cle et stocke le resultat non vide"""
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if local and not flight.cancelled() and flight.exception() is None and flight.result()[0]:
+            self.set(key, *flight.result())
+
+    # ─── Backend partage (une erreur Redis equivaut a un cache manquant) ─────
+    async def _shared_get(self, key):
+        try:
+            found = await self.backend.get(key)
+        except Exception as e:
+            log.warning("cache partage indisponible", extra={"op": "get", "key": key, "error": str(e)})
+            return None
+        if found is None:
+            return None
+        self.shared_hits += 1
+        decode = self._codec(key)[1]
+        return (decode(found[0]) if decode else found[0]), found[1]
+
+    async def _shared_set(self, key, value, ttl):
+        encode = self._codec(key)[0]
+        try:
+            await self.backend.set(key, encode(value) if encode else value, ttl)
+        except Exception as e:
+            log.warning("cache partage indisponible", extra={"op": "set", "key": key, "error": str(e)})
+
+    async def _mark_failed(self, key, error):
+        try:
+            await self.backend.set(f"failed:{key}", f"{key}: {error}", CACHE_FAILURE_TTL)
+        except Exception as e:
+            log.warning("cache partage indisponible", extra={"op": "set", "key": key, "error": str(e)})
+
+    async def _failure(self, key):
+        """Message du dernier fetch en echec de la cle (None si aucun)"""
+        try:
+            found = await self.backend.get(f"failed:{key}")
+        except Exception as e:
+            log.warning("cache partage indisponible", extra={"op": "get", "key": key, "error": str(e)})
+            return None
+        return found[0] if found else None
+
+    async def _acquire(self, key, ttl: float = CACHE_LOCK_TTL):
+        try:
+            return await self.backend.acquire(key, ttl)
+        except Exception as e:
+            log.warning("verrou partage indisponible", extra={"op": "acquire", "key": key, "error": str(e)})
+            return "local"
+
+    async def _locked(self, key) -> bool:
+        try:
+            return await self.backend.locked(key)
+        except Exception as e:
+            log.warning("verrou partage indisponible", extra={"op": "locked", "key": key, "error": str(e)})
+            return False
+
+    async def _release(self, key, token):
+        if token == "local":
+            return
+        try:
+            await self.backend.release(key, token)
+        except Exception as e:
+            log.warning("verrou partage indisponible", extra={"op": "release", "key": key, "error": str(e)})
+
+    # ─── Publication directe (poller) ────────────────────────────────────────
+    def set(self, key, value, ttl: float = None):
+        """Stocke une valeur en memoire, avec un TTL propre optionnel"""
+        self._entries.pop(key, None)
+        self._entries[key] = (value, time.time(), self.ttl if ttl is None else ttl)
+        while self.max_entries and len(self._entries) > self.max_entries:
+            del self._entries[next(iter(self._entries))]
+
+    async def publish(self, key, value, ttl: float = None):
+        """Stocke une valeur en memoire et dans le backend partage"""
+        self.set(key, value, ttl)
+        if self.backend is not None:
+            await self._shared_set(key, value, self.ttl if ttl is None else ttl)
+
+    async def lease(self, key, ttl: float) -> bool:
+        """Bail exclusif de `ttl` secondes entre workers (toujours accorde sans
+        backend partage) : un seul poller actif a la fois"""
+        if self.backend is None:
+            return True
+        return await self._acquire(f"lease:{key}", ttl) is not None
+
+    def peek(self, key):
+        """Derniere valeur connue, meme expiree (None si jamais chargee)"""
+        entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    def expires_in(self, key) -> float:
+        """Secondes avant expiration de l'entree (0 si absente ou expiree)"""
+        entry = self._entries.get(key)
+        if not entry:
+            return 0.0
+        return max(0.0, entry[2] - (time.time() - entry[1]))
+
+    def clear(self):
+        self._entries.clear()
+        self._flights.clear()
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self.stale_hits = 0
+
+    def stats(self):
+        """Compteurs hit/miss et age (secondes) de chaque entree"""
+        now = time.time()
+        return {
+            "backend": self.backend.name if self.backend else "memory",
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared_hits": self.shared_hits,
+            "stale_hits": self.stale_hits,
+            "entries": {k: round(now - ts, 1) for k, (_, ts, _) in self._entries.items()},
+        }
+
+
+snapshots = SnapshotCache(backend=make_backend())
@@ -0,0 +1,179 @@
+"""
+Archive de fin de seance : apres la cloture, les snapshots marche et indices
+sont captures pour tous les instruments et ecrits dans des fichiers CSV
+compresses par jour (EOD_DIR/YYYY-MM-DD.market.csv.gz, .indices.csv.gz).
+Une lecture de fichier sert tout le marche pour une date, au lieu d'un appel
+d'historique par ticker.
+
+Lancement manuel (archive de la seance du jour) : python -m eod
+"""
+import asyncio
+import csv
+import gzip
+import io
+import logging
+import os
+import tempfile
+import zlib
+from dataclasses import fields
+from datetime import date, datetime, time as dtime, timedelta, timezone
+from functools import lru_cache
+
+import http_client
+import observability
+import poller
+import scraper
+from cache import snapshots
+from records import IndexQuote, StockQuote
+
+EOD_ENABLED = os.getenv("EOD_ENABLED", "0") == "1"
+EOD_DIR = os.getenv("EOD_DIR", os.path.join(os.getenv("DATA_DIR", "data"), "eod"))
+# Heure de capture (Casablanca), apres la cloture et la publication des cours
+EOD_TIME = dtime.fromisoformat(os.getenv("EOD_TIME", "16:00"))
+EOD_RETRY = float(os.getenv("EOD_RETRY", "300"))
+
+KINDS = {"market": StockQuote, "indices": IndexQuote}
+COLUMNS = {kind: tuple(f.name for f in fields(cls)) for kind, cls in KINDS.items()}
+
+log = logging.getLogger(__name__)
+
+_state = {"task": None, "last_archive": None, "last_error": None}
+
+
+def path(day: str, kind: str) -> str:
+    return os.path.join(EOD_DIR, f"{day}.{kind}.csv.gz")
+
+
+# ─── ECRITURE ────────────────────────────────────────────────────────────────
+def write(day: str, kind: str, rows):
+    """Ecrit l'archive d'une seance (fichier temporaire propre a l'appel +
+    rename : plusieurs workers peuvent archiver la meme seance)"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(COLUMNS[kind])
+    writer.writerows([row.get(c) for c in COLUMNS[kind]] for row in rows)
+    os.makedirs(EOD_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=EOD_DIR, prefix=f".{day}.{kind}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(gzip.compress(buf.getvalue().encode("utf-8"), compresslevel=9, mtime=0))
+        os.replace(tmp, path(day, kind))
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+async def archive(day: str = None) -> bool:
+    """Capture les snapshots marche et indices (fetch direct, pas de cache)
+    et les archive pour la seance `day` ; False si l'upstream n'a rien renvoye"""
+    day = day or datetime.now(poller.BVC_TZ).date().isoformat()
+    market, indices = await asyncio.gather(scraper._fetch_market_snapshot(), scraper._fetch_index_snapshot())
+    if not market or not indices:
+        return False
+    write(day, "market", market.rows())
+    write(day, "indices", indices.rows())
+    _state["last_archive"] = day
+    log.info("seance archivee", extra={"day": day, "instruments": len(market), "indices": len(indices)})
+    return True
+
+
+# ─── LECTURE ─────────────────────────────────────────────────────────────────
+@lru_cache(maxsize=32)
+def _load(file: str, mtime: float, kind: str):
+    cls = KINDS[kind]
+    with gzip.open(file, "rt", encoding="utf-8", newline="") as f:
+        return [cls.from_dict(row) for row in csv.DictReader(f)]
+
+
+def read(day: str, kind: str = "market"):
+    """Lignes typees archivees d'une seance (None si absente ou illisible)"""
+    file = path(date.fromisoformat(day).isoformat(), kind)
+    try:
+        return _load(file, os.path.getmtime(file), kind)
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, zlib.error, csv.Error) as e:
+        log.error("archive de fin de seance illisible", extra={"file": file, "error": str(e)})
+        return None
+
+
+def days(from_date: str = None, to_date: str = None):
+    """Seances archivees (YYYY-MM-DD) de la periode, chronologiques"""
+    start = date.fromisoformat(from_date).isoformat() if from_date else ""
+    end = date.fromisoformat(to_date).isoformat() if to_date else "9999"
+    try:
+        names = os.listdir(EOD_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(n[:10] for n in names if n.endswith(".market.csv.gz") and start <= n[:10] <= end)
+
+
+def iter_range(from_date: str, to_date: str, kind: str = "market"):
+    """(seance, lignes) pour chaque archive de la periode ; un fichier lu a la fois"""
+    for day in days(from_date, to_date):
+        rows = read(day, kind)
+        if rows is not None:
+            yield day, rows
+
+
+# ─── PLANIFICATION ───────────────────────────────────────────────────────────
+def seconds_until_next(now: datetime = None) -> float:
+    """Delai jusqu'a la prochaine capture (jours de semaine a EOD_TIME)"""
+    now = (now or datetime.now(poller.BVC_TZ)).astimezone(poller.BVC_TZ)
+    day = now.date()
+    while True:
+        moment = datetime.combine(day, EOD_TIME, tzinfo=poller.BVC_TZ)
+        if day.weekday() < 5 and moment > now:
+            return (moment - now).total_seconds()
+        day += timedelta(days=1)
+
+
+async def _run():
+    while True:
+        await asyncio.sleep(seconds_until_next())
+        day = datetime.now(poller.BVC_TZ).date().isoformat()
+        # Un seul worker/replica archive chaque seance ; nouvel essai si l'upstream
+        # ne repond pas, jusqu'a la fin de la journee
+        while datetime.now(poller.BVC_TZ).date().isoformat() == day:
+            try:
+                if not await snapshots.lease(f"eod:{day}", EOD_RETRY) or await archive(day):
+                    break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.exception("archive de fin de seance en echec", extra={"day": day, "error": str(e)})
+            _state["last_error"] = datetime.now(timezone.utc).isoformat()
+            await asyncio.sleep(EOD_RETRY)
+
+
+def start():
+    if _state["task"] is None:
+        _state["task"] = asyncio.ensure_future(_run())
+
+
+async def stop():
+    task, _state["task"] = _state["task"], None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+def status():
+    """Etat de l'archive pour /health"""
+    return {"enabled": _state["task"] is not None, "last_archive": _state["last_archive"],
+            "last_error": _state["last_error"]}
+
+
+async def _main():
+    try:
+        return await archive()
+    finally:
+        await http_client.aclose()
+
+
+if __name__ == "__main__":
+    observability.configure_logging()
+    raise SystemExit(0 if asyncio.run(_main()) else 1)
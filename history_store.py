@@ -0,0 +1,137 @@
+"""
+Stockage local (SQLite) de l'historique OHLCV par ticker et date de seance.
+Les plages deja recuperees sont memorisees : seules les dates manquantes
+sont redemandees a l'upstream.
+"""
+import os
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", os.path.join(os.getenv("DATA_DIR", "data"), "history.sqlite"))
+
+# Colonnes d'une ligne d'historique, dans l'ordre renvoye par l'API
+COLUMNS = ("date", "open", "close", "last", "high", "low", "volume", "qty", "trades", "market_cap")
+_COLUMNS_SQL = ", ".join(f'"{c}"' for c in COLUMNS)
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS history (
+    ticker TEXT NOT NULL,
+    session TEXT NOT NULL,
+    {_COLUMNS_SQL},
+    PRIMARY KEY (ticker, session)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS coverage (
+    ticker TEXT NOT NULL,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL,
+    PRIMARY KEY (ticker, start)
+);
+"""
+
+
+def _day(value: str) -> date:
+    return date.fromisoformat(value[:10])
+
+
+class HistoryStore:
+    """Historique OHLCV persiste + plages de dates deja couvertes par ticker"""
+
+    def __init__(self, path: str = HISTORY_DB_PATH):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def _coverage(self, ticker: str):
+        rows = self._db().execute(
+            "SELECT start, end FROM coverage WHERE ticker = ? ORDER BY start", (ticker,)
+        ).fetchall()
+        return [(date.fromisoformat(s), date.fromisoformat(e)) for s, e in rows]
+
+    def missing_ranges(self, ticker: str, from_date: str, to_date: str):
+        """Plages [debut, fin] (YYYY-MM-DD) de la periode absentes du store"""
+        start, end = _day(from_date), _day(to_date)
+        gaps = []
+        with self._lock:
+            coverage = self._coverage(ticker)
+        for cov_start, cov_end in coverage:
+            if cov_end < start:
+                continue
+            if cov_start > end:
+                break
+            if cov_start > start:
+                gaps.append((start, cov_start - timedelta(days=1)))
+            start = max(start, cov_end + timedelta(days=1))
+        if start <= end:
+            gaps.append((start, end))
+        return [(s.isoformat(), e.isoformat()) for s, e in gaps]
+
+    def save(self, ticker: str, rows, from_date: str, to_date: str, complete: bool = True):
+        """Enregistre les lignes et, si la periode a ete entierement recuperee,
+        la marque comme couverte. La seance du jour n'est jamais marquee :
+        elle peut encore changer."""
+        with self._lock:
+            db = self._db()
+            with db:
+                db.executemany(
+                    f"INSERT OR REPLACE INTO history VALUES (?, ?, {', '.join('?' * len(COLUMNS))})",
+                    [(ticker, row["date"][:10], *(row[c] for c in COLUMNS)) for row in rows if row.get("date")],
+                )
+                start = _day(from_date)
+                end = min(_day(to_date), date.today() - timedelta(days=1))
+                if complete and start <= end:
+                    self._merge_coverage(db, ticker, start, end)
+
+    def _merge_coverage(self, db, ticker: str, start: date, end: date):
+        merged = []
+        for cov_start, cov_end in sorted(self._coverage(ticker) + [(start, end)]):
+            if merged and cov_start <= merged[-1][1] + timedelta(days=1):
+                merged[-1] = (merged[-1][0], max(merged[-1][1], cov_end))
+            else:
+                merged.append((cov_start, cov_end))
+        db.execute("DELETE FROM coverage WHERE ticker = ?", (ticker,))
+        db.executemany(
+            "INSERT INTO coverage VALUES (?, ?, ?)",
+            [(ticker, s.isoformat(), e.isoformat()) for s, e in merged],
+        )
+
+    def iter_rows(self, ticker: str, from_date: str, to_date: str, chunk_size: int = 500):
+        """Lignes stockees de la periode par blocs, de la plus recente a la
+        plus ancienne (pagination par cle : le verrou n'est tenu que par bloc)"""
+        upper = to_date[:10]
+        op = "<="
+        while True:
+            with self._lock:
+                rows = self._db().execute(
+                    f"SELECT session, {_COLUMNS_SQL} FROM history "
+                    f"WHERE ticker = ? AND session >= ? AND session {op} ? ORDER BY session DESC LIMIT ?",
+                    (ticker, from_date[:10], upper, chunk_size),
+                ).fetchall()
+            if rows:
+                # La date renvoyee est celle de la seance (YYYY-MM-DD)
+                yield [dict(zip(COLUMNS, (row[0],) + row[2:])) for row in rows]
+            if len(rows) < chunk_size:
+                return
+            upper, op = rows[-1][0], "<"
+
+    def rows(self, ticker: str, from_date: str, to_date: str):
+        """Lignes stockees de la periode, de la plus recente a la plus ancienne"""
+        return [row for chunk in self.iter_rows(ticker, from_date, to_date) for row in chunk]
+
+
+_default = None
+
+
+def default_store() -> HistoryStore:
+    global _default
+    if _default is None:
+        _default = HistoryStore()
+    return _default
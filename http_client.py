@@ -0,0 +1,198 @@
+"""
+Client HTTP asynchrone partage vers casablanca-bourse.com :
+pool de connexions keep-alive, concurrence bornee (globale et par hote),
+et couche de resilience par endpoint upstream (disjoncteur, retries avec
+backoff + jitter, delai maximal par appel).
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+from observability import UPSTREAM_LATENCY, UPSTREAM_REQUESTS
+
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "8"))
+# Essais supplementaires sur erreur reseau / 429 / 5xx, et duree maximale
+# d'un appel upstream, attente des connexions et retries compris
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+UPSTREAM_DEADLINE = float(os.getenv("UPSTREAM_DEADLINE", "12"))
+RETRY_BACKOFF = 0.25
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Disjoncteur : ouvert apres BREAKER_FAILURES appels en echec, pendant BREAKER_RESET secondes
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "30"))
+
+log = logging.getLogger(__name__)
+
+class RateLimiter:
+    """Espace les appels d'au moins 1/rate seconde, tous appelants confondus"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+# Le client et les semaphores sont lies a la boucle asyncio qui les a crees
+_state = {"loop": None, "client": None, "global": None, "hosts": {}}
+
+
+def _current():
+    loop = asyncio.get_running_loop()
+    if _state["loop"] is not loop:
+        _state.update(
+            loop=loop,
+            client=httpx.AsyncClient(
+                verify=False,
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE,
+                    keepalive_expiry=30,
+                ),
+            ),
+            hosts={},
+        )
+        _state["global"] = asyncio.Semaphore(MAX_CONNECTIONS)
+    return _state
+
+
+async def get(url: str, params=None, headers=None, timeout: float = 15) -> httpx.Response:
+    """GET via le pool partage, au plus MAX_PER_HOST requetes simultanees par hote"""
+    state = _current()
+    host = urlsplit(url).hostname
+    host_slots = state["hosts"].setdefault(host, asyncio.Semaphore(MAX_PER_HOST))
+    async with state["global"], host_slots:
+        return await state["client"].get(url, params=params, headers=headers, timeout=timeout)
+
+
+class UpstreamUnavailable(Exception):
+    """Endpoint upstream indisponible (circuit ouvert, erreurs ou delai depasse)"""
+
+
+class CircuitBreaker:
+    """Ouvert apres `failures` appels en echec consecutifs : les appels
+    echouent alors immediatement pendant `reset` secondes, puis un seul appel
+    d'essai decide de la fermeture (succes) ou d'une nouvelle ouverture"""
+
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, reset: float = BREAKER_RESET):
+        self.name = name
+        self.failures = failures
+        self.reset = reset
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def failure(self):
+        self.consecutive_failures += 1
+        if self._probing or self.consecutive_failures >= self.failures:
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def abandon(self):
+        """Appel d'essai annule sans resultat : un autre pourra le refaire"""
+        self._probing = False
+
+    def status(self):
+        return {"state": self.state, "consecutive_failures": self.consecutive_failures}
+
+
+_breakers = {}
+
+
+def breaker(endpoint: str) -> CircuitBreaker:
+    if endpoint not in _breakers:
+        _breakers[endpoint] = CircuitBreaker(endpoint)
+    return _breakers[endpoint]
+
+
+def breakers_status():
+    """Etat des disjoncteurs par endpoint upstream (pour /health)"""
+    return {name: b.status() for name, b in _breakers.items()}
+
+
+async def fetch(endpoint: str, url: str, params=None, headers=None, timeout: float = 15,
+                deadline: float = UPSTREAM_DEADLINE, retries: int = UPSTREAM_RETRIES) -> httpx.Response:
+    """GET resilient : disjoncteur propre a `endpoint`, retries avec backoff
+    exponentiel et jitter sur erreur reseau / 429 / 5xx, le tout borne a
+    `deadline` secondes. Les autres statuts sont renvoyes tels quels.
+    Leve UpstreamUnavailable si le circuit est ouvert ou si tous les essais echouent."""
+    cb = breaker(endpoint)
+    if not cb.allow():
+        UPSTREAM_REQUESTS.labels(endpoint, "circuit_open").inc()
+        raise UpstreamUnavailable(f"{endpoint}: circuit ouvert")
+    end = time.monotonic() + deadline
+    error = "delai depasse"
+    settled = False
+    try:
+        for attempt in range(retries + 1):
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            start = time.perf_counter()
+            try:
+                r = await asyncio.wait_for(get(url, params, headers, min(timeout, remaining)), remaining)
+                UPSTREAM_LATENCY.labels(endpoint).observe(time.perf_counter() - start)
+                if r.status_code not in RETRY_STATUSES:
+                    UPSTREAM_REQUESTS.labels(endpoint, "ok").inc()
+                    cb.success()
+                    settled = True
+                    return r
+                UPSTREAM_REQUESTS.labels(endpoint, "http_error").inc()
+                error = f"HTTP {r.status_code}"
+            except (httpx.HTTPError, asyncio.TimeoutError) as e:
+                UPSTREAM_LATENCY.labels(endpoint).observe(time.perf_counter() - start)
+                timed_out = isinstance(e, (asyncio.TimeoutError, httpx.TimeoutException))
+                UPSTREAM_REQUESTS.labels(endpoint, "timeout" if timed_out else "network_error").inc()
+                error = f"{type(e).__name__}: {e}"
+            delay = random.uniform(0, RETRY_BACKOFF * 2 ** attempt)
+            if attempt == retries or time.monotonic() + delay >= end:
+                break
+            await asyncio.sleep(delay)
+        cb.failure()
+        settled = True
+        log.warning("upstream en echec", extra={"endpoint": endpoint, "error": error, "circuit": cb.state})
+        raise UpstreamUnavailable(f"{endpoint}: {error}")
+    finally:
+        if not settled:
+            cb.abandon()
+
+
+async def aclose():
+    """Ferme le pool de connexions (arret de l'application)"""
+    client = _state["client"]
+    _state.update({"loop": None, "client": None, "global": None, "hosts": {}})
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,275 @@
+"""
+Enregistreur intraday : chaque snapshot du marche live publie par le poller
+est ajoute au fichier de sa seance (INTRADAY_DIR/YYYY-MM-DD.ticks), en ne
+gardant que les titres dont un champ suivi a change depuis le tick precedent.
+
+Les fichiers sont en append seul, en enregistrements binaires de taille
+fixe (TICK_DTYPE, prix en float32) : une seance se relit par np.memmap sans
+parsing, et les ticks d'un titre sont trouves par recherche dichotomique sur
+l'horodatage. Les tickers d'une seance sont numerotes dans un fichier
+compagnon (YYYY-MM-DD.symbols, un ticker par ligne, en append seul aussi).
+Les ecritures de plusieurs workers sur une meme seance sont serialisees par
+flock sur le fichier ticks.
+"""
+import fcntl
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, time as dtime, timezone
+
+import numpy as np
+
+from analytics import to_list
+
+INTRADAY_DIR = os.getenv("INTRADAY_DIR", os.path.join(os.getenv("DATA_DIR", "data"), "intraday"))
+INTRADAY_ENABLED = os.getenv("INTRADAY_ENABLED", "1") == "1"
+# Seances gardees en memoire (memmap + positions par titre)
+INTRADAY_CACHE_DAYS = int(os.getenv("INTRADAY_CACHE_DAYS", "8"))
+
+# Champs suivis : un tick est ecrit des que l'un d'eux change
+TICK_FIELDS = ("last_price", "high", "low", "bid_price", "ask_price", "variation_pct",
+               "volume", "qty_traded", "nb_trades")
+TICK_DTYPE = np.dtype([
+    ("ts", "<i8"),             # horodatage du snapshot, ms epoch UTC
+    ("sym", "<u2"),            # numero du ticker dans le fichier .symbols
+    ("last_price", "<f4"),
+    ("high", "<f4"),
+    ("low", "<f4"),
+    ("bid_price", "<f4"),
+    ("ask_price", "<f4"),
+    ("variation_pct", "<f4"),
+    ("volume", "<f8"),         # cumuls de la seance
+    ("qty_traded", "<u4"),
+    ("nb_trades", "<u4"),
+])
+_INT_FIELDS = ("qty_traded", "nb_trades")
+INTERVALS = {"1m": 1, "5m": 5, "15m": 15, "30m": 30, "60m": 60}
+
+
+def _values(row):
+    """Champs suivis d'une ligne du snapshot, tels qu'ils seront stockes"""
+    return tuple(
+        (getattr(row, f) or 0) if f in _INT_FIELDS else
+        (np.nan if getattr(row, f) is None else getattr(row, f))
+        for f in TICK_FIELDS
+    )
+
+
+def _same(a, b) -> bool:
+    # Prix compares apres passage en float32, comme stockes (NaN == NaN) :
+    # un champ inchange ne doit pas produire de tick a chaque snapshot
+    return (np.array_equal(np.float32(a[:6]), np.float32(b[:6]), equal_nan=True)
+            and np.array_equal(a[6], b[6], equal_nan=True) and a[7:] == b[7:])
+
+
+def to_ms(day: str, clock: str, tz) -> int:
+    """'YYYY-MM-DD' + 'HH:MM[:SS]' en heure locale `tz` -> ms epoch UTC"""
+    moment = datetime.combine(datetime.fromisoformat(day).date(), dtime.fromisoformat(clock), tzinfo=tz)
+    return int(moment.timestamp() * 1000)
+
+
+class _Day:
+    """Seance relue : ticks en memmap, tickers et positions des ticks par titre"""
+
+    __slots__ = ("size", "ticks", "symbols", "positions")
+
+    def __init__(self, path: str, symbols):
+        self.size = os.path.getsize(path)
+        count = self.size // TICK_DTYPE.itemsize
+        self.ticks = np.memmap(path, dtype=TICK_DTYPE, mode="r", shape=(count,)) if count else \
+            np.empty(0, dtype=TICK_DTYPE)
+        self.symbols = {ticker: i for i, ticker in enumerate(symbols)}
+        # Tri stable par titre : les ticks de chaque titre restent chronologiques
+        order = np.argsort(self.ticks["sym"], kind="stable")
+        bounds = np.searchsorted(self.ticks["sym"][order], np.arange(len(symbols) + 1))
+        self.positions = [order[bounds[i]:bounds[i + 1]] for i in range(len(symbols))]
+
+
+class IntradayStore:
+    """Fichiers de ticks par seance : ecriture par le poller, lecture par l'API"""
+
+    def __init__(self, root: str = INTRADAY_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        self._writer = None        # (seance, fichier ticks, fichier symbols)
+        self._symbols = {}         # ticker -> numero, seance en cours d'ecriture
+        self._last = {}            # numero -> derniers champs ecrits
+        self._offset = 0           # octets du fichier ticks deja relus ou ecrits
+        self._days = OrderedDict()
+
+    def _path(self, day: str, ext: str) -> str:
+        return os.path.join(self.root, f"{day}.{ext}")
+
+    def _read_symbols(self, day: str):
+        try:
+            with open(self._path(day, "symbols"), encoding="utf-8") as f:
+                return f.read().splitlines()
+        except FileNotFoundError:
+            return []
+
+    # ─── ECRITURE ────────────────────────────────────────────────────────
+    def _open(self, day: str):
+        """Ouvre le fichier de la seance ; son contenu est relu par _sync"""
+        self.close()
+        os.makedirs(self.root, exist_ok=True)
+        self._symbols = {}
+        self._last = {}
+        self._offset = 0
+        self._writer = (day, open(self._path(day, "ticks"), "ab"),
+                        open(self._path(day, "symbols"), "a", encoding="utf-8"))
+
+    def _sync(self, day: str, ticks_file):
+        """Rattrape les tickers et ticks ajoutes par un autre processus (ou
+        avant un redemarrage) depuis notre derniere ecriture ; sous flock"""
+        size = os.fstat(ticks_file.fileno()).st_size
+        if size % TICK_DTYPE.itemsize:
+            # Un enregistrement partiel (arret pendant une ecriture) est ecarte
+            size -= size % TICK_DTYPE.itemsize
+            ticks_file.truncate(size)
+        symbols = self._read_symbols(day)
+        for ticker in symbols[len(self._symbols):]:
+            self._symbols[ticker] = len(self._symbols)
+        if size > self._offset:
+            ticks = np.fromfile(self._path(day, "ticks"), dtype=TICK_DTYPE,
+                                count=(size - self._offset) // TICK_DTYPE.itemsize, offset=self._offset)
+            for tick in ticks[ticks["sym"] < len(self._symbols)]:
+                self._last[int(tick["sym"])] = tuple(tick[f].item() for f in TICK_FIELDS)
+        self._offset = size
+
+    def record(self, snapshot, day: str) -> int:
+        """Ajoute les titres modifies du snapshot a la seance `day` ; nombre de ticks ecrits.
+        Plusieurs workers peuvent enregistrer tour a tour la meme seance : chaque
+        ecriture se fait sous verrou de fichier, apres relecture de ce que les
+        autres ont ajoute (derniers cours, numeros des tickers)."""
+        ts = int(snapshot.fetched_at * 1000)
+        with self._lock:
+            if self._writer is None or self._writer[0] != day:
+                self._open(day)
+            _, ticks_file, symbols_file = self._writer
+            fcntl.flock(ticks_file.fileno(), fcntl.LOCK_EX)
+            try:
+                self._sync(day, ticks_file)
+                rows = []
+                for row in snapshot.stocks:
+                    if not row.ticker:
+                        continue
+                    ticker = row.ticker.upper()
+                    sym = self._symbols.get(ticker)
+                    if sym is None:
+                        sym = self._symbols[ticker] = len(self._symbols)
+                        symbols_file.write(ticker + "\n")
+                    values = _values(row)
+                    last = self._last.get(sym)
+                    if last is not None and _same(last, values):
+                        continue
+                    self._last[sym] = values
+                    rows.append((ts, sym, *values))
+                # Les tickers sont ecrits avant les ticks qui les referencent
+                symbols_file.flush()
+                if rows:
+                    data = np.array(rows, dtype=TICK_DTYPE).tobytes()
+                    ticks_file.write(data)
+                    ticks_file.flush()
+                    self._offset += len(data)
+            finally:
+                fcntl.flock(ticks_file.fileno(), fcntl.LOCK_UN)
+            return len(rows)
+
+    def close(self):
+        if self._writer is not None:
+            for f in self._writer[1:]:
+                f.close()
+            self._writer = None
+
+    # ─── LECTURE ─────────────────────────────────────────────────────────
+    def _day(self, day: str):
+        """Seance en cache, relue si le fichier a grandi (seance en cours)"""
+        path = self._path(day, "ticks")
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            cached = self._days.get(day)
+            if cached is not None and cached.size == size:
+                self._days.move_to_end(day)
+                return cached
+        loaded = _Day(path, self._read_symbols(day))
+        with self._lock:
+            self._days[day] = loaded
+            self._days.move_to_end(day)
+            while len(self._days) > INTRADAY_CACHE_DAYS:
+                self._days.popitem(last=False)
+        return loaded
+
+    def ticks(self, ticker: str, day: str, start_ms: int = None, end_ms: int = None):
+        """(ticks du titre entre start_ms et end_ms inclus, tick precedent ou None) ;
+        None si le titre n'a pas de ticks ce jour-la"""
+        loaded = self._day(day)
+        sym = loaded.symbols.get(ticker.upper()) if loaded is not None else None
+        if sym is None:
+            return None
+        ticks = loaded.ticks[loaded.positions[sym]]
+        if not len(ticks):
+            return None
+        ts = ticks["ts"]
+        lo = np.searchsorted(ts, start_ms, side="left") if start_ms is not None else 0
+        hi = np.searchsorted(ts, end_ms, side="right") if end_ms is not None else len(ts)
+        return ticks[lo:hi], (ticks[lo - 1] if lo > 0 else None)
+
+    def days(self):
+        """Seances enregistrees (YYYY-MM-DD), de la plus ancienne a la plus recente"""
+        try:
+            return sorted(name[:-6] for name in os.listdir(self.root) if name.endswith(".ticks"))
+        except FileNotFoundError:
+            return []
+
+
+# ─── FORMATS DE SORTIE ───────────────────────────────────────────────────────
+def _iso(ms):
+    return [datetime.fromtimestamp(v / 1000, timezone.utc).isoformat().replace("+00:00", "Z") for v in ms.tolist()]
+
+
+def tick_rows(ticks):
+    """Ticks bruts -> lignes JSON"""
+    columns = {f: (ticks[f].tolist() if f in _INT_FIELDS else to_list(ticks[f])) for f in TICK_FIELDS}
+    return [{"time": t, **{f: columns[f][i] for f in TICK_FIELDS}} for i, t in enumerate(_iso(ticks["ts"]))]
+
+
+def bar_rows(ticks, previous, minutes: int):
+    """Barres de `minutes` minutes sur le dernier cours ; volume, quantite et
+    transactions = variation des cumuls de la seance sur la barre"""
+    if not len(ticks):
+        return []
+    width = minutes * 60000
+    buckets = ticks["ts"] // width
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(ticks)] - 1
+    price = ticks["last_price"].astype(np.float64)
+    bars = {
+        "open": price[starts],
+        "high": np.fmax.reduceat(price, starts),
+        "low": np.fmin.reduceat(price, starts),
+        "close": price[ends],
+    }
+    for name, field in (("volume", "volume"), ("qty", "qty_traded"), ("trades", "nb_trades")):
+        cumul = ticks[field].astype(np.float64)[ends]
+        base = float(previous[field]) if previous is not None else 0.0
+        bars[name] = np.clip(np.diff(np.r_[base, cumul]), 0, None)
+    columns = {name: to_list(values) for name, values in bars.items()}
+    for name in ("qty", "trades"):
+        columns[name] = bars[name].astype(np.int64).tolist()
+    return [
+        {"time": t, "ticks": n, **{name: columns[name][i] for name in bars}}
+        for i, (t, n) in enumerate(zip(_iso(buckets[starts] * width), (ends - starts + 1).tolist()))
+    ]
+
+
+_default = None
+
+
+def default_store() -> IntradayStore:
+    global _default
+    if _default is None:
+        _default = IntradayStore()
+    return _default
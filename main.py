@@ -1,8 +1,45 @@
-from fastapi import FastAPI, HTTPException, Query
+import asyncio
+import csv
+import io
+import itertools
+from contextlib import asynccontextmanager
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from datetime import date
+from fastapi.responses import FileResponse, ORJSONResponse, Response, StreamingResponse
+from datetime import date, datetime
+import orjson
+import analytics
+import eod
+import http_client
+import intraday
+import observability
+import poller
 import scraper
+import screener
+import warmup
+from cache import snapshots
+from snapshot import COMPRESS_MIN_SIZE, ENCODINGS
+from stream import broadcaster
+from history_store import COLUMNS as HISTORY_COLUMNS
+from records import HistorySeries
+
+observability.configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup.start()
+    if poller.POLLER_ENABLED:
+        poller.start()
+    if eod.EOD_ENABLED:
+        eod.start()
+    yield
+    await warmup.stop()
+    await eod.stop()
+    await poller.stop()
+    await http_client.aclose()
+
 
 app = FastAPI(
     title="Bourse de Casablanca API",
@@ -10,6 +47,8 @@ app = FastAPI(
     version="2.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -19,11 +58,66 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(observability.RouteMetricsMiddleware)
+
+@app.exception_handler(http_client.UpstreamUnavailable)
+async def upstream_unavailable(request: Request, exc: http_client.UpstreamUnavailable):
+    """Donnee introuvable faute d'upstream (ex: index des symboles) : 503, pas 404"""
+    return ORJSONResponse({"detail": "Upstream indisponible, reessayer plus tard"}, status_code=503)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# REQUETES CONDITIONNELLES (ETag / Last-Modified / 304)
+# ─────────────────────────────────────────────────────────────────────────────
+def _not_modified(request: Request, snapshot) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [t.strip().removeprefix("W/").strip('"') for t in if_none_match.split(",")]
+        return "*" in tags or snapshot.etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(if_modified_since).timestamp() >= int(snapshot.fetched_at)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _accepted_encoding(request: Request):
+    """Premier encodage de ENCODINGS accepte par le client (None = identite)"""
+    accepted = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = params.strip().removeprefix("q=") if params.strip().startswith("q=") else "1"
+        try:
+            accepted[name.strip().lower()] = float(quality)
+        except ValueError:
+            continue
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+def _snapshot_response(request: Request, snapshot, cache_key: str):
+    """Corps JSON precalcule d'un snapshot (compresse si le client l'accepte)
+    avec ETag, Last-Modified et Cache-Control (max-age = duree de vie restante
+    du snapshot) ; 304 si le client est a jour"""
+    headers = {
+        "ETag": f'"{snapshot.etag}"',
+        "Last-Modified": formatdate(snapshot.fetched_at, usegmt=True),
+        "Cache-Control": f"public, max-age={int(snapshots.expires_in(cache_key))}",
+        "Vary": "Accept-Encoding",
+    }
+    if _not_modified(request, snapshot):
+        return Response(status_code=304, headers=headers)
+    encoding = _accepted_encoding(request) if len(snapshot.body) >= COMPRESS_MIN_SIZE else None
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(snapshot.encoded(encoding), media_type="application/json", headers=headers)
+
 # ─────────────────────────────────────────────────────────────────────────────
 # ROOT
 # ─────────────────────────────────────────────────────────────────────────────
 @app.get("/", tags=["Info"])
-def root():
+async def root():
     return {
         "name": "Bourse de Casablanca API",
         "version": "2.0.0",
@@ -32,12 +126,26 @@ def root():
             "/api/v1/market",
             "/api/v1/market/summary",
             "/api/v1/stocks/{ticker}",
+            "/api/v1/stocks?tickers=ATW,IAM",
             "/api/v1/indices",
             "/api/v1/indices/{code}",
             "/api/v1/top/gainers",
             "/api/v1/top/losers",
             "/api/v1/top/active",
+            "/api/v1/top/capitalisation",
+            "/api/v1/top/trades",
+            "/api/v1/screener?filter=sector:eq:Banques&sort=-capitalisation",
+            "/api/v1/sectors",
+            "/api/v1/sectors/{name}",
             "/api/v1/historical/{ticker}",
+            "/api/v1/historical?tickers=ATW,IAM",
+            "/api/v1/analytics/{ticker}",
+            "/api/v1/intraday/{ticker}",
+            "/api/v1/eod/{date}",
+            "/api/v1/eod?from_date=...&to_date=...",
+            "/api/v1/stream",
+            "/metrics",
+            "/health/ready",
             "/docs",
         ]
     }
@@ -46,25 +154,36 @@ def root():
 # MARCHE LIVE
 # ─────────────────────────────────────────────────────────────────────────────
 @app.get("/api/v1/market", tags=["Marche Live"])
-def get_all_stocks():
+async def get_all_stocks(request: Request):
     """Toutes les actions cotees en temps reel"""
-    data = scraper.get_market_live()
-    if not data:
+    snapshot = await scraper.get_market_snapshot()
+    if not snapshot:
         raise HTTPException(status_code=503, detail="Donnees indisponibles")
-    return {"count": len(data), "data": data}
+    return _snapshot_response(request, snapshot, "market")
 
 @app.get("/api/v1/market/summary", tags=["Marche Live"])
-def get_summary():
+async def get_summary():
     """Resume global du marche (nombre hausse/baisse, volume total)"""
-    data = scraper.get_market_summary()
+    data = await scraper.get_market_summary()
     if not data:
         raise HTTPException(status_code=503, detail="Donnees indisponibles")
     return data
 
+@app.get("/api/v1/stocks", tags=["Marche Live"])
+async def get_stocks(tickers: str = Query(description="Tickers ou noms separes par des virgules (ex: ATW,IAM)")):
+    """Plusieurs actions en un seul appel, resolues sur le meme snapshot"""
+    wanted = [t.strip() for t in tickers.split(",") if t.strip()]
+    if not wanted:
+        raise HTTPException(status_code=422, detail="Au moins un ticker attendu")
+    data, missing, stale = await scraper.get_stocks(wanted)
+    if data is None:
+        raise HTTPException(status_code=503, detail="Donnees indisponibles")
+    return {"count": len(data), "missing": missing, "stale": stale, "data": data}
+
 @app.get("/api/v1/stocks/{ticker}", tags=["Marche Live"])
-def get_stock(ticker: str):
+async def get_stock(ticker: str):
     """Donnees d'une action par son ticker (ex: IAM, ATW, COSUMAR, CIH)"""
-    data = scraper.get_stock_by_ticker(ticker)
+    data = await scraper.get_stock_by_ticker(ticker)
     if not data:
         raise HTTPException(status_code=404, detail=f"Ticker '{ticker}' non trouve")
     return data
@@ -73,17 +192,17 @@ def get_stock(ticker: str):
 # INDICES
 # ─────────────────────────────────────────────────────────────────────────────
 @app.get("/api/v1/indices", tags=["Indices"])
-def get_all_indices():
+async def get_all_indices(request: Request):
     """Tous les indices (MASI, MSI20, MASI ESG, indices sectoriels)"""
-    data = scraper.get_indices()
-    if not data:
+    snapshot = await scraper.get_index_snapshot()
+    if not snapshot:
         raise HTTPException(status_code=503, detail="Donnees indisponibles")
-    return {"count": len(data), "data": data}
+    return _snapshot_response(request, snapshot, "indices")
 
 @app.get("/api/v1/indices/{code}", tags=["Indices"])
-def get_index(code: str):
+async def get_index(code: str):
     """Donnees d'un indice specifique (ex: MASI, MSI20, BANK, ASSUR)"""
-    data = scraper.get_index_by_code(code)
+    data = await scraper.get_index_by_code(code)
     if not data:
         raise HTTPException(status_code=404, detail=f"Indice '{code}' non trouve")
     return data
@@ -91,42 +210,361 @@ def get_index(code: str):
 # ─────────────────────────────────────────────────────────────────────────────
 # TOP LISTES
 # ─────────────────────────────────────────────────────────────────────────────
+SECTOR_QUERY = Query(default=None, description="Restreindre a un secteur (ex: Banques)")
+
 @app.get("/api/v1/top/gainers", tags=["Top Listes"])
-def top_gainers(limit: int = Query(default=10, ge=1, le=50)):
+async def top_gainers(limit: int = Query(default=10, ge=1, le=50), sector: str = SECTOR_QUERY):
     """Les N actions avec la plus forte hausse"""
-    data = scraper.get_top_gainers(limit)
-    return {"count": len(data), "data": data}
+    data, stale = await scraper.get_top_gainers(limit, sector)
+    return {"count": len(data), "stale": stale, "data": data}
 
 @app.get("/api/v1/top/losers", tags=["Top Listes"])
-def top_losers(limit: int = Query(default=10, ge=1, le=50)):
+async def top_losers(limit: int = Query(default=10, ge=1, le=50), sector: str = SECTOR_QUERY):
     """Les N actions avec la plus forte baisse"""
-    data = scraper.get_top_losers(limit)
-    return {"count": len(data), "data": data}
+    data, stale = await scraper.get_top_losers(limit, sector)
+    return {"count": len(data), "stale": stale, "data": data}
 
 @app.get("/api/v1/top/active", tags=["Top Listes"])
-def most_active(limit: int = Query(default=10, ge=1, le=50)):
+async def most_active(limit: int = Query(default=10, ge=1, le=50), sector: str = SECTOR_QUERY):
     """Les N actions les plus actives (par volume)"""
-    data = scraper.get_most_active(limit)
-    return {"count": len(data), "data": data}
+    data, stale = await scraper.get_most_active(limit, sector)
+    return {"count": len(data), "stale": stale, "data": data}
+
+@app.get("/api/v1/top/capitalisation", tags=["Top Listes"])
+async def top_capitalisation(limit: int = Query(default=10, ge=1, le=50), sector: str = SECTOR_QUERY):
+    """Les N plus grosses capitalisations"""
+    data, stale = await scraper.get_top("capitalisation", limit, sector)
+    return {"count": len(data), "stale": stale, "data": data}
+
+@app.get("/api/v1/top/trades", tags=["Top Listes"])
+async def top_trades(limit: int = Query(default=10, ge=1, le=50), sector: str = SECTOR_QUERY):
+    """Les N actions avec le plus de transactions"""
+    data, stale = await scraper.get_top("trades", limit, sector)
+    return {"count": len(data), "stale": stale, "data": data}
+
+# ─────────────────────────────────────────────────────────────────────────────
+# SCREENER
+# ─────────────────────────────────────────────────────────────────────────────
+@app.get("/api/v1/screener", tags=["Screener"])
+async def screen(
+    filters: str = Query(default=None, alias="filter",
+                         description="champ:operateur:valeur separes par des virgules "
+                                     "(ex: sector:eq:Banques,variation_pct:gt:2,volume:gte:1000000)"),
+    sort: str = Query(default=None, description="Champ de tri, prefixe - pour decroissant (ex: -capitalisation)"),
+    fields: str = Query(default=None, description="Champs renvoyes (ex: ticker,name,variation_pct)"),
+    limit: int = Query(default=50, ge=1, le=screener.SCREENER_MAX_LIMIT),
+):
+    """Filtre, tri et projection sur toutes les actions du snapshot live
+    (operateurs eq, ne, gt, gte, lt, lte ; in pour les textes ; set = renseigne)"""
+    try:
+        plan = screener.compile_plan(filters, sort, fields, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    data, stale = await scraper.screen(plan)
+    if data is None:
+        raise HTTPException(status_code=503, detail="Donnees indisponibles")
+    return {"count": len(data), "stale": stale, "data": data}
+
+# ─────────────────────────────────────────────────────────────────────────────
+# SECTEURS
+# ─────────────────────────────────────────────────────────────────────────────
+@app.get("/api/v1/sectors", tags=["Secteurs"])
+async def get_sectors():
+    """Agregats par secteur : hausses / baisses, volume, capitalisation,
+    variation ponderee par la capitalisation et meilleures variations"""
+    data, stale = await scraper.get_sectors()
+    if data is None:
+        raise HTTPException(status_code=503, detail="Donnees indisponibles")
+    return {"count": len(data), "stale": stale, "data": data}
+
+@app.get("/api/v1/sectors/{name}", tags=["Secteurs"])
+async def get_sector(name: str):
+    """Agregats d'un secteur (ex: Banques)"""
+    data, unavailable = await scraper.get_sector(name)
+    if unavailable:
+        raise HTTPException(status_code=503, detail="Donnees indisponibles")
+    if not data:
+        raise HTTPException(status_code=404, detail=f"Secteur '{name}' non trouve")
+    return data
 
 # ─────────────────────────────────────────────────────────────────────────────
 # HISTORIQUE
 # ─────────────────────────────────────────────────────────────────────────────
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+async def _prepend(first, chunks):
+    yield first
+    async for chunk in chunks:
+        yield chunk
+
+async def _ndjson_stream(chunks):
+    """Une ligne JSON par enregistrement, un bloc ecrit par page recue"""
+    async for chunk in chunks:
+        yield b"".join(orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE) for row in chunk)
+
+async def _csv_stream(chunks, columns):
+    """En-tete puis lignes CSV, un bloc ecrit par page recue"""
+    yield ",".join(columns) + "\r\n"
+    async for chunk in chunks:
+        buf = io.StringIO()
+        csv.writer(buf).writerows([row.get(c) for c in columns] for row in chunk)
+        yield buf.getvalue()
+
+def _stream_response(fmt: str, chunks, columns, filename: str):
+    body = _ndjson_stream(chunks) if fmt == "ndjson" else _csv_stream(chunks, columns)
+    headers = {"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'} if fmt == "csv" else None
+    return StreamingResponse(body, media_type=STREAM_MEDIA_TYPES[fmt], headers=headers)
+
+def _json_by_ticker(header, series):
+    """Document JSON {...header, "data": {ticker: [lignes]}} ecrit ticker par
+    ticker : seules les lignes d'un titre existent a la fois sous forme de dicts"""
+    yield orjson.dumps(header)[:-1] + b',"data":{'
+    for i, (ticker, rows) in enumerate(series.items()):
+        yield (b"," if i else b"") + orjson.dumps(ticker) + b":" + orjson.dumps(list(rows.rows()))
+    yield b"}}"
+
+async def _tagged(batch):
+    """(ticker, bloc) -> bloc de lignes portant leur ticker. Un historique
+    incomplet interrompt le flux : le client recoit une reponse tronquee en
+    erreur plutot qu'un fichier d'apparence complete."""
+    async for ticker, chunk in batch:
+        if chunk is None:
+            raise scraper.IncompleteHistory(f"historique incomplet pour {ticker}")
+        yield [{"ticker": ticker, **row} for row in chunk]
+
+@app.get("/api/v1/historical", tags=["Historique"])
+async def get_historical_batch(
+    tickers: str = Query(description="Tickers separes par des virgules (ex: ATW,IAM) ou 'all'"),
+    from_date: str = Query(description="Date debut YYYY-MM-DD"),
+    to_date: str = Query(description="Date fin YYYY-MM-DD"),
+    fmt: str = Query(default="json", alias="format", pattern="^(json|ndjson|csv)$",
+                     description="json (par ticker) ou ndjson / csv (streaming)"),
+):
+    """Historique OHLCV de plusieurs titres, recupere en parallele"""
+    wanted = [t.strip() for t in tickers.split(",") if t.strip()]
+    if not wanted:
+        raise HTTPException(status_code=422, detail="Au moins un ticker attendu")
+    try:
+        batch, missing = await scraper.iter_historical_batch(wanted, from_date, to_date)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Dates attendues au format YYYY-MM-DD")
+    if fmt != "json":
+        return _stream_response(fmt, _tagged(batch), ("ticker",) + HISTORY_COLUMNS,
+                                f"historical_{from_date}_{to_date}")
+    # Blocs accumules en colonnes NumPy par ticker pendant la recuperation ;
+    # un historique incomplet est signale et jamais renvoye comme complet
+    parts, incomplete = {}, []
+    async for ticker, chunk in batch:
+        if chunk is None:
+            parts.pop(ticker, None)
+            incomplete.append(ticker)
+        else:
+            parts.setdefault(ticker, []).append(HistorySeries.from_rows(chunk))
+    series = {ticker: HistorySeries.concat(p) for ticker, p in parts.items()}
+    header = {"from_date": from_date, "to_date": to_date, "count": len(series), "missing": missing,
+              "incomplete": incomplete}
+    return StreamingResponse(_json_by_ticker(header, series), media_type="application/json")
+
 @app.get("/api/v1/historical/{ticker}", tags=["Historique"])
-def get_historical(
+async def get_historical(
     ticker: str,
     from_date: str = Query(description="Date debut YYYY-MM-DD"),
     to_date: str = Query(description="Date fin YYYY-MM-DD"),
+    fmt: str = Query(default="json", alias="format", pattern="^(json|ndjson|csv)$",
+                     description="json (document unique) ou ndjson / csv (streaming)"),
 ):
     """Historique OHLCV d'un titre sur une periode donnee"""
-    data = scraper.get_historical(ticker, from_date, to_date)
+    try:
+        if fmt != "json":
+            chunks = await scraper.iter_historical(ticker, from_date, to_date)
+            first = await anext(chunks, None) if chunks is not None else None
+            data = None if first is None else _prepend(first, chunks)
+        else:
+            data = await scraper.get_historical(ticker, from_date, to_date)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Dates attendues au format YYYY-MM-DD")
+    except scraper.IncompleteHistory:
+        raise HTTPException(status_code=503, detail="Historique incomplet (upstream indisponible), reessayer plus tard")
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"Historique introuvable pour '{ticker}'")
+    if fmt != "json":
+        return _stream_response(fmt, data, HISTORY_COLUMNS, f"{ticker.upper()}_{from_date}_{to_date}")
+    # Renvoye tel quel : pas de passage par jsonable_encoder sur des milliers de lignes
+    return ORJSONResponse({"ticker": ticker.upper(), "count": len(data), "data": data})
+
+@app.get("/api/v1/analytics/{ticker}", tags=["Historique"])
+async def get_analytics(
+    ticker: str,
+    from_date: str = Query(description="Date debut YYYY-MM-DD"),
+    to_date: str = Query(description="Date fin YYYY-MM-DD"),
+    interval: str = Query(default="D", pattern="^[DWMQ]$",
+                          description="Barres journalieres (D), hebdomadaires (W), mensuelles (M), trimestrielles (Q)"),
+    indicators: str = Query(default=None,
+                            description="Indicateurs sur la cloture (ex: sma:20,ema:50,rsi:14,volatility:20)"),
+):
+    """Barres reechantillonnees et indicateurs techniques calcules cote serveur"""
+    try:
+        wanted = analytics.parse_indicators(indicators)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    try:
+        data = await scraper.get_analytics(ticker, from_date, to_date, interval, wanted)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Dates attendues au format YYYY-MM-DD")
+    except scraper.IncompleteHistory:
+        raise HTTPException(status_code=503, detail="Historique incomplet (upstream indisponible), reessayer plus tard")
     if data is None:
         raise HTTPException(status_code=404, detail=f"Historique introuvable pour '{ticker}'")
-    return {"ticker": ticker.upper(), "count": len(data), "data": data}
+    return ORJSONResponse({"from_date": from_date, "to_date": to_date, **data})
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ARCHIVE DE FIN DE SEANCE
+# ─────────────────────────────────────────────────────────────────────────────
+EOD_KIND = Query(default="market", pattern="^(market|indices)$", description="market (actions) ou indices")
+
+async def _eod_chunks(archives):
+    for day, rows in archives:
+        yield [{"date": day, **row.to_dict()} for row in rows]
+
+@app.get("/api/v1/eod", tags=["Historique"])
+async def get_eod_range(
+    from_date: str = Query(description="Date debut YYYY-MM-DD"),
+    to_date: str = Query(description="Date fin YYYY-MM-DD"),
+    kind: str = EOD_KIND,
+    fmt: str = Query(default="csv", alias="format", pattern="^(ndjson|csv)$"),
+):
+    """Telechargement groupe des seances archivees de la periode (streaming, une seance a la fois)"""
+    try:
+        archives = eod.iter_range(from_date, to_date, kind)
+        first = next(archives, None)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Dates attendues au format YYYY-MM-DD")
+    if first is None:
+        raise HTTPException(status_code=404, detail="Aucune seance archivee sur la periode")
+    archives = itertools.chain([first], archives)
+    return _stream_response(fmt, _eod_chunks(archives), ("date",) + eod.COLUMNS[kind],
+                            f"eod_{kind}_{from_date}_{to_date}")
+
+@app.get("/api/v1/eod/{day}", tags=["Historique"])
+async def get_eod(
+    day: str,
+    kind: str = EOD_KIND,
+    fmt: str = Query(default="json", alias="format", pattern=r"^(json|csv\.gz)$",
+                     description="json, ou csv.gz (fichier d'archive tel quel)"),
+):
+    """Cloture de tous les instruments (ou indices) d'une seance archivee"""
+    try:
+        day = date.fromisoformat(day).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Date attendue au format YYYY-MM-DD")
+    missing = HTTPException(status_code=404, detail=f"Seance {day} non archivee")
+    if fmt == "csv.gz":
+        if eod.read(day, kind) is None:
+            raise missing
+        return FileResponse(eod.path(day, kind), media_type="application/gzip", filename=f"{day}.{kind}.csv.gz")
+    rows = eod.read(day, kind)
+    if rows is None:
+        raise missing
+    return ORJSONResponse({"date": day, "kind": kind, "count": len(rows), "data": rows})
+
+# ─────────────────────────────────────────────────────────────────────────────
+# INTRADAY (ticks enregistres par le poller)
+# ─────────────────────────────────────────────────────────────────────────────
+@app.get("/api/v1/intraday/{ticker}", tags=["Historique"])
+async def get_intraday(
+    ticker: str,
+    day: str = Query(default=None, alias="date", description="Seance YYYY-MM-DD (defaut : aujourd'hui)"),
+    start: str = Query(default=None, description="Heure de debut HH:MM (heure de Casablanca)"),
+    end: str = Query(default=None, description="Heure de fin HH:MM (heure de Casablanca)"),
+    interval: str = Query(default="1m", pattern="^(raw|1m|5m|15m|30m|60m)$",
+                          description="Barres de N minutes, ou raw pour les ticks bruts"),
+):
+    """Cours intraday d'un titre, enregistres a chaque poll pendant la seance"""
+    day = day or datetime.now(poller.BVC_TZ).date().isoformat()
+    try:
+        date.fromisoformat(day)
+        start_ms = intraday.to_ms(day, start, poller.BVC_TZ) if start else None
+        end_ms = intraday.to_ms(day, end, poller.BVC_TZ) if end else None
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Date YYYY-MM-DD et heures HH:MM attendues")
+    found = intraday.default_store().ticks(ticker, day, start_ms, end_ms)
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"Aucun tick enregistre pour '{ticker}' le {day}")
+    ticks, previous = found
+    if interval == "raw":
+        data = intraday.tick_rows(ticks)
+    else:
+        data = intraday.bar_rows(ticks, previous, intraday.INTERVALS[interval])
+    return ORJSONResponse({"ticker": ticker.upper(), "date": day, "interval": interval,
+                           "count": len(data), "data": data})
+
+# ─────────────────────────────────────────────────────────────────────────────
+# STREAMING (WebSocket / Server-Sent Events)
+# ─────────────────────────────────────────────────────────────────────────────
+SSE_KEEPALIVE = 15
+
+def _split_tickers(tickers: str):
+    return [t.strip() for t in tickers.split(",") if t.strip()] if tickers else None
+
+@app.websocket("/api/v1/stream")
+async def stream_ws(websocket: WebSocket, tickers: str = None, sector: str = None):
+    """Snapshot initial puis deltas par ticker (filtres : tickers=ATW,IAM / sector=Banques)"""
+    await websocket.accept()
+    sub = await broadcaster.subscribe(_split_tickers(tickers), sector)
+
+    async def send_messages():
+        while True:
+            await websocket.send_json(await sub.get())
+
+    sender = asyncio.ensure_future(send_messages())
+    try:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        sender.cancel()
+        broadcaster.unsubscribe(sub)
+
+async def _sse_events(sub):
+    try:
+        while True:
+            try:
+                message = await asyncio.wait_for(sub.get(), timeout=SSE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {message['type']}\ndata: {orjson.dumps(message).decode()}\n\n"
+    finally:
+        broadcaster.unsubscribe(sub)
+
+@app.get("/api/v1/stream", tags=["Marche Live"])
+async def stream_sse(
+    tickers: str = Query(default=None, description="Tickers separes par des virgules (ex: ATW,IAM)"),
+    sector: str = Query(default=None, description="Restreindre a un secteur (ex: Banques)"),
+):
+    """Flux Server-Sent Events : snapshot initial puis deltas par ticker
+    (meme flux que le WebSocket /api/v1/stream)"""
+    sub = await broadcaster.subscribe(_split_tickers(tickers), sector)
+    return StreamingResponse(_sse_events(sub), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # ─────────────────────────────────────────────────────────────────────────────
 # HEALTH CHECK
 # ─────────────────────────────────────────────────────────────────────────────
+@app.get("/metrics", tags=["Info"])
+async def metrics():
+    """Metriques Prometheus (latences upstream / routes / scraper, cache, disjoncteurs)"""
+    body, content_type = observability.metrics_payload()
+    return Response(body, media_type=content_type)
+
 @app.get("/health", tags=["Info"])
-def health():
-    return {"status": "ok"}
+async def health():
+    """Test de vie : le processus repond (sans attendre le prechauffage)"""
+    return {"status": "ok", "ready": warmup.ready(), "cache": snapshots.stats(), "poller": poller.status(),
+            "eod": eod.status(), "upstream": http_client.breakers_status()}
+
+@app.get("/health/ready", tags=["Info"])
+async def health_ready():
+    """Disponibilite : 503 tant que le prechauffage (buildId, index des symboles,
+    premiers snapshots) n'est pas termine"""
+    status = warmup.status()
+    return ORJSONResponse(status, status_code=200 if status["ready"] else 503)
@@ -0,0 +1,169 @@
+"""
+Observabilite : logs structures (JSON par defaut, niveau LOG_LEVEL) et
+metriques Prometheus exposees sur /metrics (latence upstream par endpoint
+BVC, parsing JSON, fonctions du scraper, routes FastAPI, cache, disjoncteurs).
+"""
+import functools
+import json
+import logging
+import os
+import time
+
+import orjson
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Avec plusieurs workers uvicorn, metriques agregees via ce repertoire partage
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+# Attributs standard d'un LogRecord (le reste vient de extra={...})
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par log : ts, level, logger, msg et les champs extra"""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S%z"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in _RECORD_FIELDS})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging():
+    handler = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(LOG_LEVEL.upper())
+
+
+# ─── METRIQUES ───────────────────────────────────────────────────────────────
+UPSTREAM_LATENCY = Histogram(
+    "bvc_upstream_request_seconds", "Duree d'un appel HTTP upstream (par essai)", ["endpoint"])
+UPSTREAM_REQUESTS = Counter(
+    "bvc_upstream_requests_total",
+    "Essais upstream par resultat (ok, http_error, timeout, network_error, circuit_open)",
+    ["endpoint", "outcome"])
+JSON_PARSE = Histogram(
+    "bvc_json_parse_seconds", "Duree du parsing JSON des reponses upstream", ["endpoint"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+SCRAPER_CALLS = Histogram(
+    "bvc_scraper_call_seconds", "Duree des fonctions du scraper", ["function"])
+SCRAPER_ERRORS = Counter(
+    "bvc_scraper_errors_total", "Exceptions levees par les fonctions du scraper", ["function"])
+HISTORY_PAGES = Histogram(
+    "bvc_history_pages_per_call", "Blocs d'historique par appel, depuis l'upstream ou le store", ["source"],
+    buckets=(0, 1, 2, 4, 8, 16, 32, 64, 128))
+ROUTE_LATENCY = Histogram(
+    "bvc_http_request_seconds", "Duree des requetes par route (jusqu'aux en-tetes pour les flux)",
+    ["method", "route", "status"])
+
+
+def timed(function: str):
+    """Decorateur : duree et erreurs d'une fonction async du scraper"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                SCRAPER_ERRORS.labels(function).inc()
+                raise
+            finally:
+                SCRAPER_CALLS.labels(function).observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+class RouteMetricsMiddleware:
+    """Middleware ASGI : duree de chaque requete HTTP jusqu'a l'envoi des
+    en-tetes, par methode, gabarit de route (ex: /api/v1/stocks/{ticker}) et statut"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        observed = False
+
+        def observe(status):
+            route = scope.get("route")
+            ROUTE_LATENCY.labels(scope["method"], getattr(route, "path", "unmatched"), str(status)).observe(
+                time.perf_counter() - start)
+
+        async def send_observed(message):
+            nonlocal observed
+            if message["type"] == "http.response.start":
+                observed = True
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_observed)
+        finally:
+            if not observed:
+                observe(500)
+
+
+def parse_json(response, endpoint: str):
+    """Corps JSON d'une reponse upstream (orjson), parsing chronometre"""
+    start = time.perf_counter()
+    try:
+        return orjson.loads(response.content)
+    finally:
+        JSON_PARSE.labels(endpoint).observe(time.perf_counter() - start)
+
+
+class StateCollector:
+    """Etat lu au moment de la collecte : compteurs du cache des snapshots
+    et etat des disjoncteurs upstream"""
+
+    def describe(self):
+        # Pas de collecte a l'enregistrement (modules cache / http_client pas encore charges)
+        return []
+
+    def collect(self):
+        import http_client
+        from cache import snapshots
+
+        stats = snapshots.stats()
+        lookups = CounterMetricFamily("bvc_cache_lookups", "Lectures du cache des snapshots par resultat",
+                                      labels=["result"])
+        for result in ("hits", "misses", "shared_hits", "stale_hits"):
+            lookups.add_metric([result.removesuffix("s")], stats[result])
+        yield lookups
+        yield GaugeMetricFamily("bvc_cache_entries", "Entrees en memoire du cache", value=len(stats["entries"]))
+        breakers = GaugeMetricFamily("bvc_upstream_circuit_open", "Disjoncteur upstream ouvert (1) ou ferme (0)",
+                                     labels=["endpoint"])
+        for endpoint, status in http_client.breakers_status().items():
+            breakers.add_metric([endpoint], 0 if status["state"] == "closed" else 1)
+        yield breakers
+
+
+REGISTRY.register(StateCollector())
+
+
+def metrics_payload():
+    """(corps, content-type) du format d'exposition Prometheus"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(StateCollector())
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,140 @@
+"""
+Poller de fond optionnel : rafraichit les snapshots marche et indices
+selon les horaires de seance de la BVC, independamment des requetes.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, time as dtime, timedelta, timezone
+
+import intraday
+import scraper
+from cache import snapshots
+
+POLLER_ENABLED = os.getenv("POLLER_ENABLED", "0") == "1"
+POLL_INTERVAL_OPEN = float(os.getenv("POLL_INTERVAL_OPEN", "10"))
+# 0 = pause hors seance (reprise a l'ouverture suivante)
+POLL_INTERVAL_CLOSED = float(os.getenv("POLL_INTERVAL_CLOSED", "600"))
+SESSION_OPEN = dtime.fromisoformat(os.getenv("SESSION_OPEN", "09:30"))
+SESSION_CLOSE = dtime.fromisoformat(os.getenv("SESSION_CLOSE", "15:30"))
+
+try:
+    from zoneinfo import ZoneInfo
+    BVC_TZ = ZoneInfo("Africa/Casablanca")
+except Exception:
+    BVC_TZ = timezone(timedelta(hours=1))
+
+log = logging.getLogger(__name__)
+
+_state = {
+    "task": None,
+    "last_success": None,
+    "last_error": None,
+    "consecutive_failures": 0,
+    "next_interval": None,
+}
+
+
+def market_is_open(now: datetime = None) -> bool:
+    """Seance en cours (lundi-vendredi, SESSION_OPEN-SESSION_CLOSE heure de Casablanca)"""
+    now = (now or datetime.now(BVC_TZ)).astimezone(BVC_TZ)
+    return now.weekday() < 5 and SESSION_OPEN <= now.time() < SESSION_CLOSE
+
+
+def _seconds_until_open(now: datetime) -> float:
+    day = now
+    while True:
+        opening = datetime.combine(day.date(), SESSION_OPEN, tzinfo=BVC_TZ)
+        if day.weekday() < 5 and opening > now:
+            return (opening - now).total_seconds()
+        day = datetime.combine(day.date() + timedelta(days=1), dtime(), tzinfo=BVC_TZ)
+
+
+def next_interval(now: datetime = None) -> float:
+    """Delai avant le prochain poll : rapide en seance, lent (ou pause) sinon"""
+    now = (now or datetime.now(BVC_TZ)).astimezone(BVC_TZ)
+    if market_is_open(now):
+        return POLL_INTERVAL_OPEN
+    if POLL_INTERVAL_CLOSED > 0:
+        return min(POLL_INTERVAL_CLOSED, _seconds_until_open(now))
+    return _seconds_until_open(now)
+
+
+async def poll_once() -> float:
+    """Un cycle : fetch marche + indices, publication dans le cache partage.
+    Retourne le delai avant le cycle suivant."""
+    interval = next_interval()
+    # Avec un cache partage, un seul worker/replica poll a chaque cycle ;
+    # les autres lisent les snapshots qu'il publie
+    if not await snapshots.lease("poller", interval):
+        _state["next_interval"] = interval
+        return interval
+    market, indices = await asyncio.gather(scraper._fetch_market_snapshot(), scraper._fetch_index_snapshot())
+    # Les snapshots restent valides jusqu'au poll suivant (avec une marge) ;
+    # au-dela, les requetes retombent sur le fetch a la demande
+    ttl = interval * 2
+    if market:
+        await snapshots.publish("market", market, ttl)
+        if intraday.INTRADAY_ENABLED and market_is_open():
+            _record_ticks(market)
+    if indices:
+        await snapshots.publish("indices", indices, ttl)
+    if market and indices:
+        _state["last_success"] = datetime.now(timezone.utc).isoformat()
+        _state["consecutive_failures"] = 0
+    else:
+        _state["consecutive_failures"] += 1
+        _state["last_error"] = datetime.now(timezone.utc).isoformat()
+    _state["next_interval"] = interval
+    return interval
+
+
+def _record_ticks(market):
+    """Ajoute le snapshot a l'enregistrement intraday de la seance (un echec
+    d'ecriture n'interrompt pas le poller)"""
+    try:
+        day = datetime.fromtimestamp(market.fetched_at, BVC_TZ).date().isoformat()
+        intraday.default_store().record(market, day)
+    except Exception as e:
+        log.exception("enregistrement intraday en echec", extra={"error": str(e)})
+
+
+async def _run():
+    while True:
+        try:
+            interval = await poll_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.exception("cycle du poller en echec", extra={"error": str(e)})
+            _state["consecutive_failures"] += 1
+            _state["last_error"] = datetime.now(timezone.utc).isoformat()
+            interval = POLL_INTERVAL_OPEN
+        await asyncio.sleep(interval)
+
+
+def start():
+    if _state["task"] is None:
+        _state["task"] = asyncio.ensure_future(_run())
+
+
+async def stop():
+    task, _state["task"] = _state["task"], None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+def status():
+    """Etat du poller pour /health"""
+    return {
+        "enabled": _state["task"] is not None,
+        "market_open": market_is_open(),
+        "last_success": _state["last_success"],
+        "last_error": _state["last_error"],
+        "consecutive_failures": _state["consecutive_failures"],
+        "next_interval": _state["next_interval"],
+    }
@@ -0,0 +1,155 @@
+"""
+Enregistrements types des donnees BVC : chaque valeur numerique est parsee
+une seule fois a l'ingestion (float / int), au lieu de circuler sous forme
+de chaines dans des dicts.
+
+- StockQuote / IndexQuote : une ligne du ticker ou de grouped_index_watch,
+  en dataclass a __slots__ ;
+- HistorySeries : historique OHLCV en colonnes NumPy (une par champ), pour
+  les longues series et les lots multi-titres.
+"""
+from dataclasses import dataclass, fields
+from functools import cache
+
+import numpy as np
+
+
+def to_float(value):
+    """Valeur upstream (str, int, float ou None) -> float, None si absente/invalide"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_int(value):
+    """Valeur upstream -> int (accepte "258" comme "258.0"), None si absente/invalide"""
+    number = to_float(value)
+    return int(number) if number is not None and number == number else None
+
+
+def to_text(value):
+    return None if value is None else str(value)
+
+
+_PARSERS = {float: to_float, int: to_int, str: to_text}
+
+
+@cache
+def _parsers(cls):
+    """(champ, fonction de conversion) d'une classe d'enregistrement, selon ses annotations"""
+    return tuple((f.name, _PARSERS[f.type]) for f in fields(cls))
+
+
+class Record:
+    """Conversion dict <-> enregistrement type"""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, row):
+        """Enregistrement depuis un dict (cles = noms des champs), valeurs converties"""
+        return cls(**{name: parse(row.get(name)) for name, parse in _parsers(cls)})
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name, _ in _parsers(type(self))}
+
+
+@dataclass(slots=True)
+class StockQuote(Record):
+    """Une action du ticker BVC"""
+    ticker: str = ""
+    name: str = ""
+    sector: str = ""
+    last_price: float = None
+    ref_price: float = None
+    open: float = None
+    high: float = None
+    low: float = None
+    variation_pct: float = None
+    volume: float = None
+    qty_traded: int = None
+    nb_trades: int = None
+    capitalisation: float = None
+    status: str = None
+    bid_price: float = None
+    ask_price: float = None
+
+
+@dataclass(slots=True)
+class IndexQuote(Record):
+    """Un indice de grouped_index_watch"""
+    category: str = ""
+    name: str = ""
+    code: str = ""
+    value: float = None
+    previous: float = None
+    variation_pct: float = None
+    variation_ytd: float = None
+    high: float = None
+    low: float = None
+    capitalisation: float = None
+
+
+# ─── HISTORIQUE EN COLONNES ──────────────────────────────────────────────────
+# Colonnes numeriques d'une ligne d'historique (apres "date") ; les entiers
+# sont stockes en float64 pour representer les valeurs absentes par NaN
+HISTORY_VALUES = ("open", "close", "last", "high", "low", "volume", "qty", "trades", "market_cap")
+HISTORY_INTS = ("qty", "trades")
+
+
+class HistorySeries:
+    """Historique OHLCV d'un titre : un tableau datetime64[D] de seances et
+    un tableau float64 par colonne, dans l'ordre des lignes recues"""
+
+    __slots__ = ("dates", "columns")
+
+    def __init__(self, dates, columns):
+        self.dates = dates
+        self.columns = columns
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Series depuis des lignes d'historique (dicts)"""
+        dates = np.array([(row.get("date") or "")[:10] for row in rows], dtype="datetime64[D]")
+        columns = {
+            name: np.array([to_float(row.get(name)) for row in rows], dtype=np.float64)
+            for name in HISTORY_VALUES
+        }
+        return cls(dates, columns)
+
+    @classmethod
+    def concat(cls, parts):
+        parts = list(parts)
+        if not parts:
+            return cls.from_rows([])
+        return cls(
+            np.concatenate([p.dates for p in parts]),
+            {name: np.concatenate([p.columns[name] for p in parts]) for name in HISTORY_VALUES},
+        )
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def nbytes(self) -> int:
+        return self.dates.nbytes + sum(col.nbytes for col in self.columns.values())
+
+    def rows(self):
+        """Lignes d'historique (dicts, valeurs absentes -> None)"""
+        days = np.datetime_as_string(self.dates, unit="D").tolist()
+        values = {name: col.tolist() for name, col in self.columns.items()}
+        for i, day in enumerate(days):
+            row = {"date": day}
+            for name in HISTORY_VALUES:
+                value = values[name][i]
+                if value != value:
+                    value = None
+                elif name in HISTORY_INTS:
+                    value = int(value)
+                row[name] = value
+            yield row
@@ -1,12 +1,44 @@
-import requests
+import asyncio
 import json
+import logging
+import os
 import re
+import tempfile
 import time
-import warnings
-from urllib3.exceptions import InsecureRequestWarning
+from datetime import date, timedelta
+import analytics
+import history_store
+import http_client
+import screener
+from cache import CACHE_STALE_WHILE_REVALIDATE, SnapshotCache, snapshots
+from observability import HISTORY_PAGES, parse_json, timed
+from records import HistorySeries, IndexQuote, StockQuote, to_float, to_int
+from snapshot import IndexSnapshot, MarketSnapshot, normalize
 
-warnings.filterwarnings('ignore')
-requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+# Forme JSON des snapshots dans le cache partage (Redis)
+snapshots.register("market", MarketSnapshot.dump, MarketSnapshot.load)
+snapshots.register("indices", IndexSnapshot.dump, IndexSnapshot.load)
+
+# Racine de l'upstream (un simulateur local pour les benchmarks, voir benchmarks/)
+BVC_BASE_URL = os.getenv("BVC_BASE_URL", "https://www.casablanca-bourse.com").rstrip("/")
+DATA_DIR = os.getenv("DATA_DIR", "data")
+SYMBOL_INDEX_PATH = os.getenv("SYMBOL_INDEX_PATH", os.path.join(DATA_DIR, "symbols.json"))
+SYMBOL_WORKERS = int(os.getenv("SYMBOL_WORKERS", "8"))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+# Pages instrument_history par seconde, toutes requetes confondues
+HISTORY_RATE = float(os.getenv("HISTORY_RATE", "3"))
+# Duree de vie des index de symboles et des pages d'historique figees dans le cache partage
+SYMBOL_INDEX_TTL = float(os.getenv("SYMBOL_INDEX_TTL", "604800"))
+HISTORY_PAGE_TTL = float(os.getenv("HISTORY_PAGE_TTL", "86400"))
+# Duree de vie des resultats d'analytics (deja invalides par toute nouvelle seance)
+ANALYTICS_TTL = float(os.getenv("ANALYTICS_TTL", "86400"))
+# Resultats d'analytics gardes en memoire (LRU) : une cle par requete client et par seance
+ANALYTICS_CACHE_SIZE = int(os.getenv("ANALYTICS_CACHE_SIZE", "256"))
+
+log = logging.getLogger(__name__)
+
+# Cache borne des resultats d'analytics, separe des snapshots (et de /health)
+analytics_results = SnapshotCache(ttl=ANALYTICS_TTL, backend=snapshots.backend, max_entries=ANALYTICS_CACHE_SIZE)
 
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0.0.0 Safari/537.36',
@@ -14,42 +46,69 @@ HEADERS = {
 }
 
 # ─── BUILD ID CACHE (1h) ─────────────────────────────────────────────────────
-_build_id_cache = {"id": None, "ts": 0}
+BUILD_ID_TTL = 3600
+
+async def get_build_id():
+    """Recupere le buildId Next.js depuis la page d'accueil (cache 1h,
+    dernier buildId connu si la page est indisponible)"""
+    try:
+        build_id = await snapshots.get_or_fetch("build_id", _fetch_build_id, ttl=BUILD_ID_TTL)
+    except http_client.UpstreamUnavailable:
+        build_id = None
+    return build_id or snapshots.peek("build_id")
 
-def get_build_id():
-    """Recupere le buildId Next.js depuis la page d'accueil (cache 1h)"""
-    now = time.time()
-    if _build_id_cache["id"] and (now - _build_id_cache["ts"]) < 3600:
-        return _build_id_cache["id"]
+@timed("_fetch_build_id")
+async def _fetch_build_id():
     try:
-        r = requests.get("https://www.casablanca-bourse.com/fr",
-                         headers=HEADERS, verify=False, timeout=15)
+        r = await http_client.fetch("home", f"{BVC_BASE_URL}/fr",
+                                    headers=HEADERS, timeout=15)
         match = re.search(r'<script id="__NEXT_DATA__" type="application/json">(.*?)</script>',
                           r.text)
         if match:
-            build_id = json.loads(match.group(1)).get("buildId")
-            if build_id:
-                _build_id_cache["id"] = build_id
-                _build_id_cache["ts"] = now
-                return build_id
+            return json.loads(match.group(1)).get("buildId")
     except Exception as e:
-        print(f"Erreur buildId: {e}")
-    return _build_id_cache.get("id")
+        log.warning("buildId indisponible", extra={"error": str(e)})
+    return None
 
 # ─── MARCHE LIVE ─────────────────────────────────────────────────────────────
-def get_market_live():
+def _last_known(key: str):
+    """Dernier snapshot connu marque stale (upstream indisponible), None s'il n'y en a jamais eu"""
+    last = snapshots.peek(key)
+    return last.as_stale() if last else None
+
+async def get_market_snapshot():
+    """Snapshot du marche (lignes + classements precalcules), partage en
+    cache pendant CACHE_TTL secondes et rafraichi en arriere-plan juste
+    apres. Si l'upstream est indisponible, dernier snapshot connu marque
+    stale ; None s'il n'y en a jamais eu."""
+    try:
+        snapshot = await snapshots.get_or_fetch("market", _fetch_market_snapshot, swr=CACHE_STALE_WHILE_REVALIDATE)
+    except http_client.UpstreamUnavailable:
+        snapshot = None
+    return snapshot or _last_known("market")
+
+async def get_market_live():
     """Toutes les actions en live (cours, variation, volume, capitalisation)"""
+    snapshot = await get_market_snapshot()
+    return snapshot.stocks if snapshot else []
+
+@timed("_fetch_market_snapshot")
+async def _fetch_market_snapshot():
+    stocks = await _fetch_market_live()
+    return MarketSnapshot(stocks) if stocks else None
+
+async def _fetch_market_live():
     try:
-        r = requests.get(
-            "https://www.casablanca-bourse.com/api/proxy/fr/api/bourse/dashboard/ticker",
+        r = await http_client.fetch(
+            "market", f"{BVC_BASE_URL}/api/proxy/fr/api/bourse/dashboard/ticker",
             params={"marche": 59, "class[]": 50},
-            headers=HEADERS, verify=False, timeout=15
+            headers=HEADERS, timeout=15
         )
         if r.status_code == 200:
-            stocks = r.json()["data"]["values"]
+            stocks = parse_json(r, "market")["data"]["values"]
             result = []
             for s in stocks:
-                result.append({
+                result.append(StockQuote.from_dict({
                     "ticker":         s.get("ticker", ""),
                     "name":           s.get("label", ""),
                     "sector":         s.get("sous_secteur", ""),
@@ -66,38 +125,70 @@ def get_market_live():
                     "status":         s.get("field_etat_cot_val"),
                     "bid_price":      s.get("field_best_bid_price"),
                     "ask_price":      s.get("field_best_ask_price"),
-                })
+                }))
             return result
     except Exception as e:
-        print(f"Erreur market live: {e}")
+        log.warning("marche live indisponible", extra={"error": str(e)})
     return []
 
-def get_stock_by_ticker(ticker: str):
-    """Donnees d'une action par son ticker (ex: IAM, ATW, COSUMAR)"""
-    stocks = get_market_live()
-    ticker_upper = ticker.upper()
-    for s in stocks:
-        if s["ticker"] == ticker_upper or s["name"].upper() == ticker_upper:
-            return s
-    return None
+def _with_stale(row, snapshot):
+    """Ligne d'un snapshot avec son indicateur stale (None si absente)"""
+    return {**row.to_dict(), "stale": snapshot.stale} if row else None
+
+async def get_stock_by_ticker(ticker: str):
+    """Donnees d'une action par son ticker ou son nom (ex: IAM, ATW, COSUMAR)"""
+    snapshot = await get_market_snapshot()
+    return _with_stale(snapshot.lookup(ticker), snapshot) if snapshot else None
+
+async def get_stocks(tickers):
+    """Plusieurs actions resolues sur un meme snapshot : (trouvees, inconnues, stale)"""
+    snapshot = await get_market_snapshot()
+    if not snapshot:
+        return None, list(tickers), False
+    found, missing = [], []
+    for ticker in tickers:
+        row = snapshot.lookup(ticker)
+        if row:
+            found.append(row)
+        else:
+            missing.append(ticker)
+    return found, missing, snapshot.stale
 
 # ─── INDICES ─────────────────────────────────────────────────────────────────
-def get_indices():
+async def get_index_snapshot():
+    """Snapshot des indices (partage en cache), dernier connu marque stale
+    si l'upstream est indisponible, None s'il n'y en a jamais eu"""
+    try:
+        snapshot = await snapshots.get_or_fetch("indices", _fetch_index_snapshot, swr=CACHE_STALE_WHILE_REVALIDATE)
+    except http_client.UpstreamUnavailable:
+        snapshot = None
+    return snapshot or _last_known("indices")
+
+async def get_indices():
     """MASI, MASI20, MASI ESG, indices sectoriels"""
+    snapshot = await get_index_snapshot()
+    return snapshot.indices if snapshot else []
+
+@timed("_fetch_index_snapshot")
+async def _fetch_index_snapshot():
+    indices = await _fetch_indices()
+    return IndexSnapshot(indices) if indices else None
+
+async def _fetch_indices():
     try:
-        r = requests.get(
-            "https://www.casablanca-bourse.com/api/proxy/fr/api/bourse/dashboard/grouped_index_watch",
-            headers=HEADERS, verify=False, timeout=15
+        r = await http_client.fetch(
+            "indices", f"{BVC_BASE_URL}/api/proxy/fr/api/bourse/dashboard/grouped_index_watch",
+            headers=HEADERS, timeout=15
         )
         if r.status_code == 200:
-            raw = r.json().get("data", [])
+            raw = parse_json(r, "indices").get("data", [])
             result = []
             for category in raw:
                 cat_name = category.get("title", "")
                 for item in category.get("items", []):
                     index_url = item.get("index_url", "")
                     code = index_url.split("/")[-1] if index_url else ""
-                    result.append({
+                    result.append(IndexQuote.from_dict({
                         "category":      cat_name,
                         "name":          item.get("index", ""),
                         "code":          code,
@@ -108,138 +199,445 @@ def get_indices():
                         "high":          item.get("field_index_high_value"),
                         "low":           item.get("field_index_low_value"),
                         "capitalisation":item.get("field_market_capitalisation"),
-                    })
+                    }))
             return result
     except Exception as e:
-        print(f"Erreur indices: {e}")
+        log.warning("indices indisponibles", extra={"error": str(e)})
     return []
 
-def get_index_by_code(code: str):
+async def get_index_by_code(code: str):
     """Donnees d'un indice par son code (ex: MASI, MSI20)"""
-    indices = get_indices()
-    code_upper = code.upper()
-    for idx in indices:
-        if idx["code"].upper() == code_upper:
-            return idx
-    return None
+    snapshot = await get_index_snapshot()
+    return _with_stale(snapshot.lookup(code), snapshot) if snapshot else None
 
-# ─── HISTORIQUE ──────────────────────────────────────────────────────────────
-def get_symbol_id(ticker: str):
-    """Trouve le drupal_internal__id d'un ticker"""
-    build_id = get_build_id()
-    if not build_id:
-        return None
+# ─── INDEX DES SYMBOLES ──────────────────────────────────────────────────────
+# ticker / nom -> drupal_internal__id, persiste sur disque et reconstruit
+# uniquement quand le buildId Next.js change
+_symbol_index = {"build_id": None, "tickers": {}, "names": {}}
+_symbol_index_lock = asyncio.Lock()
+# Apres une reconstruction incomplete, delai avant la suivante (secondes)
+SYMBOL_INDEX_RETRY = 60
+_symbol_index_retry = {"at": 0.0}
+
+def _load_symbol_index():
+    """Charge l'index persiste (si present) dans _symbol_index"""
+    try:
+        with open(SYMBOL_INDEX_PATH, encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("tickers"):
+            _symbol_index.update(saved)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log.error("lecture de l'index des symboles impossible", extra={"error": str(e)})
+
+def _save_symbol_index():
+    """Ecrit l'index de maniere atomique (fichier temporaire propre au worker + rename)"""
+    tmp = None
+    try:
+        directory = os.path.dirname(SYMBOL_INDEX_PATH) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".symbols.", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(_symbol_index, f, ensure_ascii=False)
+        os.replace(tmp, SYMBOL_INDEX_PATH)
+    except Exception as e:
+        log.error("ecriture de l'index des symboles impossible", extra={"error": str(e)})
+        if tmp and os.path.exists(tmp):
+            os.unlink(tmp)
+
+async def _fetch_symbol(url: str, slots: asyncio.Semaphore):
+    """Attributs (symbol, nom, drupal_internal__id) d'un instrument"""
     try:
-        url = f"https://www.casablanca-bourse.com/_next/data/{build_id}/fr/live-market/marche-actions-listing.json"
-        r = requests.get(url, headers=HEADERS, verify=False, timeout=20)
+        async with slots:
+            r = await http_client.fetch("symbols", url, timeout=10)
         if r.status_code == 200:
-            data = r.json()
-            paragraphs = data["pageProps"]["node"]["field_vactory_paragraphs"]
-            for block in paragraphs:
-                widget_id = block.get("field_vactory_component", {}).get("widget_id", "")
-                if widget_id == "bourse_data_listing:marches-actions":
-                    raw = json.loads(block["field_vactory_component"]["widget_data"])
-                    instruments = raw["extra_field"]["collection"]["data"]["data"]
-                    for item in instruments:
-                        url_inst = item["relationships"]["symbol"]["links"]["related"]["href"]
-                        r2 = requests.get(url_inst, verify=False, timeout=10)
-                        if r2.status_code == 200:
-                            attrs = r2.json()["data"]["attributes"]
-                            if attrs.get("symbol", "").upper() == ticker.upper():
-                                return str(attrs.get("drupal_internal__id"))
+            attrs = parse_json(r, "symbols")["data"]["attributes"]
+            name = attrs.get("libelleFR") or attrs.get("name", "")
+            return attrs.get("symbol", ""), name, attrs.get("drupal_internal__id")
     except Exception as e:
-        print(f"Erreur symbol_id: {e}")
+        log.warning("fiche symbole indisponible", extra={"url": url, "error": str(e)})
     return None
 
-def get_historical(ticker: str, from_date: str, to_date: str):
-    """Historique OHLCV d'un titre. from_date/to_date : YYYY-MM-DD"""
-    symbol_id = get_symbol_id(ticker)
-    if not symbol_id:
+async def _fetch_symbol_urls(build_id: str):
+    """URLs des fiches symboles de toutes les actions du listing"""
+    url = f"{BVC_BASE_URL}/_next/data/{build_id}/fr/live-market/marche-actions-listing.json"
+    r = await http_client.fetch("symbols", url, headers=HEADERS, timeout=20)
+    if r.status_code != 200:
+        return []
+    paragraphs = parse_json(r, "symbols")["pageProps"]["node"]["field_vactory_paragraphs"]
+    for block in paragraphs:
+        widget_id = block.get("field_vactory_component", {}).get("widget_id", "")
+        if widget_id == "bourse_data_listing:marches-actions":
+            raw = json.loads(block["field_vactory_component"]["widget_data"])
+            instruments = raw["extra_field"]["collection"]["data"]["data"]
+            return [item["relationships"]["symbol"]["links"]["related"]["href"] for item in instruments]
+    return []
+
+@timed("_build_symbol_index")
+async def _build_symbol_index(build_id: str):
+    """Reconstruit l'index en recuperant les fiches symboles en parallele :
+    (index ou None si le listing est indisponible, nombre de fiches en echec)"""
+    try:
+        urls = await _fetch_symbol_urls(build_id)
+    except Exception as e:
+        log.warning("listing des symboles indisponible", extra={"build_id": build_id, "error": str(e)})
+        return None, 0
+    tickers, names, failed = {}, {}, 0
+    slots = asyncio.Semaphore(SYMBOL_WORKERS)
+    for found in await asyncio.gather(*(_fetch_symbol(url, slots) for url in urls)):
+        if found is None:
+            failed += 1
+        elif found[0] and found[2] is not None:
+            symbol, name, internal_id = found
+            tickers[symbol.upper()] = str(internal_id)
+            if name:
+                names[name.upper()] = str(internal_id)
+    if not tickers:
+        return None, failed
+    return {"build_id": build_id, "tickers": tickers, "names": names}, failed
+
+async def _build_complete_index(build_id: str, partial: dict):
+    """Index du buildId, seulement si toutes les fiches ont ete lues : un index
+    incomplet n'est ni publie ni marque du buildId (il resterait en place
+    jusqu'au buildId suivant) ; il est laisse dans `partial`"""
+    index, failed = await _build_symbol_index(build_id)
+    if index and failed:
+        log.warning("index des symboles incomplet", extra={"build_id": build_id, "failed": failed})
+        partial.update(index)
         return None
+    return index
+
+async def get_symbol_index():
+    """Index ticker/nom -> drupal_internal__id (disque, puis reconstruction si le buildId a change).
+    Leve UpstreamUnavailable s'il n'y a aucun index, ni sur disque ni recuperable."""
+    async with _symbol_index_lock:
+        if not _symbol_index["tickers"]:
+            _load_symbol_index()
+        build_id = await get_build_id()
+        stale = build_id and _symbol_index["build_id"] != build_id
+        retry = not _symbol_index["tickers"] or time.monotonic() >= _symbol_index_retry["at"]
+        if (stale or not _symbol_index["tickers"]) and retry:
+            # Un seul worker reconstruit l'index d'un buildId donne, les autres le lisent
+            partial = {}
+            try:
+                index = await snapshots.get_or_fetch(
+                    f"symbols:{build_id}", lambda: _build_complete_index(build_id, partial), ttl=SYMBOL_INDEX_TTL
+                ) if build_id else None
+            except http_client.UpstreamUnavailable:
+                index = None
+            if index:
+                _symbol_index.update(index)
+                _save_symbol_index()
+            else:
+                # L'index precedent est garde ; nouvel essai apres SYMBOL_INDEX_RETRY
+                _symbol_index_retry["at"] = time.monotonic() + SYMBOL_INDEX_RETRY
+                if partial and not _symbol_index["tickers"]:
+                    # Faute d'index precedent, l'index partiel sert en attendant (sans buildId)
+                    _symbol_index.update(partial, build_id=None)
+        if not _symbol_index["tickers"]:
+            # Un index vide ferait passer tous les tickers pour inconnus (404)
+            raise http_client.UpstreamUnavailable("index des symboles indisponible")
+        return _symbol_index
+
+@timed("get_symbol_id")
+async def get_symbol_id(ticker: str):
+    """Trouve le drupal_internal__id d'un ticker (ou d'un nom de societe)"""
+    index = await get_symbol_index()
+    key = ticker.upper()
+    return index["tickers"].get(key) or index["names"].get(key)
+
+# ─── HISTORIQUE ──────────────────────────────────────────────────────────────
+HISTORY_PAGE_SIZE = 250
+_history_rate = http_client.RateLimiter(HISTORY_RATE)
+
+class IncompleteHistory(Exception):
+    """La pagination instrument_history s'est interrompue avant la fin"""
+
+@timed("_fetch_history_page")
+async def _fetch_history_page(symbol_id: str, from_date: str, to_date: str, offset: int):
+    """Une page instrument_history (lignes, de la plus recente a la plus ancienne).
+    Leve IncompleteHistory si la page echoue."""
     h = {**HEADERS, "Accept": "application/vnd.api+json", "Content-Type": "application/vnd.api+json"}
-    all_data = []
+    params = [
+        ("fields[instrument_history]", "symbol,created,openingPrice,coursCourant,highPrice,lowPrice,"
+                                       "cumulTitresEchanges,cumulVolumeEchange,totalTrades,capitalisation,"
+                                       "closingPrice"),
+        ("sort[date-seance][path]", "created"),
+        ("sort[date-seance][direction]", "DESC"),
+        ("filter[published]", "1"),
+        ("page[offset]", str(offset)),
+        ("page[limit]", str(HISTORY_PAGE_SIZE)),
+        ("filter[filter-date-start-vh][condition][path]", "field_seance_date"),
+        ("filter[filter-date-start-vh][condition][operator]", ">="),
+        ("filter[filter-date-start-vh][condition][value]", from_date),
+        ("filter[filter-date-end-vh][condition][path]", "field_seance_date"),
+        ("filter[filter-date-end-vh][condition][operator]", "<="),
+        ("filter[filter-date-end-vh][condition][value]", to_date),
+        ("filter[filter-historique-instrument-emetteur][condition][path]",
+         "symbol.meta.drupal_internal__target_id"),
+        ("filter[filter-historique-instrument-emetteur][condition][operator]", "="),
+        ("filter[filter-historique-instrument-emetteur][condition][value]", symbol_id),
+    ]
+    await _history_rate.wait()
+    try:
+        r = await http_client.fetch(
+            "history", f"{BVC_BASE_URL}/api/proxy/fr/api/bourse_data/instrument_history",
+            params=params, headers=h, timeout=20
+        )
+        r.raise_for_status()
+        items = parse_json(r, "history").get("data") or []
+    except Exception as e:
+        raise IncompleteHistory(f"page offset={offset}: {e}") from e
+    page = []
+    for item in items:
+        a = item["attributes"]
+        page.append({
+            "date":       (a.get("created") or "")[:10] or None,
+            "open":       to_float(a.get("openingPrice")),
+            "close":      to_float(a.get("closingPrice")),
+            "last":       to_float(a.get("coursCourant")),
+            "high":       to_float(a.get("highPrice")),
+            "low":        to_float(a.get("lowPrice")),
+            "volume":     to_float(a.get("cumulVolumeEchange")),
+            "qty":        to_int(a.get("cumulTitresEchanges")),
+            "trades":     to_int(a.get("totalTrades")),
+            "market_cap": to_float(a.get("capitalisation")),
+        })
+    return page
+
+async def _iter_history_pages(symbol_id: str, from_date: str, to_date: str):
+    """Pagine instrument_history sur la periode et produit chaque page des son
+    arrivee. Les pages sont partagees entre workers via le cache (duree
+    HISTORY_PAGE_TTL si la periode est revolue, CACHE_TTL sinon)."""
+    ttl = HISTORY_PAGE_TTL if date.fromisoformat(to_date[:10]) < date.today() else None
     offset = 0
     while True:
-        params = [
-            ("fields[instrument_history]", "symbol,created,openingPrice,coursCourant,highPrice,lowPrice,cumulTitresEchanges,cumulVolumeEchange,totalTrades,capitalisation,closingPrice"),
-            ("sort[date-seance][path]", "created"),
-            ("sort[date-seance][direction]", "DESC"),
-            ("filter[published]", "1"),
-            ("page[offset]", str(offset)),
-            ("page[limit]", "250"),
-            ("filter[filter-date-start-vh][condition][path]", "field_seance_date"),
-            ("filter[filter-date-start-vh][condition][operator]", ">="),
-            ("filter[filter-date-start-vh][condition][value]", from_date),
-            ("filter[filter-date-end-vh][condition][path]", "field_seance_date"),
-            ("filter[filter-date-end-vh][condition][operator]", "<="),
-            ("filter[filter-date-end-vh][condition][value]", to_date),
-            ("filter[filter-historique-instrument-emetteur][condition][path]", "symbol.meta.drupal_internal__target_id"),
-            ("filter[filter-historique-instrument-emetteur][condition][operator]", "="),
-            ("filter[filter-historique-instrument-emetteur][condition][value]", symbol_id),
-        ]
         try:
-            r = requests.get(
-                "https://www.casablanca-bourse.com/api/proxy/fr/api/bourse_data/instrument_history",
-                params=params, headers=h, verify=False, timeout=20
+            page = await snapshots.get_or_fetch(
+                f"history:{symbol_id}:{from_date}:{to_date}:{offset}",
+                lambda: _fetch_history_page(symbol_id, from_date, to_date, offset),
+                ttl=ttl, local=False,
             )
-            if r.status_code == 200:
-                data = r.json()
-                if "data" in data and data["data"]:
-                    for item in data["data"]:
-                        a = item["attributes"]
-                        all_data.append({
-                            "date":       a.get("created"),
-                            "open":       a.get("openingPrice"),
-                            "close":      a.get("closingPrice"),
-                            "last":       a.get("coursCourant"),
-                            "high":       a.get("highPrice"),
-                            "low":        a.get("lowPrice"),
-                            "volume":     a.get("cumulVolumeEchange"),
-                            "qty":        a.get("cumulTitresEchanges"),
-                            "trades":     a.get("totalTrades"),
-                            "market_cap": a.get("capitalisation"),
-                        })
-                    if len(data["data"]) < 250:
-                        break
-                    offset += 250
-                    time.sleep(0.3)
-                else:
-                    break
-            else:
-                break
-        except Exception:
-            break
-    return all_data if all_data else None
+        except http_client.UpstreamUnavailable as e:
+            # Page en echec chez le worker qui la chargeait (ou attente trop
+            # longue) : la plage ne doit pas etre marquee couverte
+            raise IncompleteHistory(f"page offset={offset}: {e}") from e
+        if not page:
+            return
+        yield page
+        if len(page) < HISTORY_PAGE_SIZE:
+            return
+        offset += HISTORY_PAGE_SIZE
+
+def _history_segments(from_date: str, to_date: str, gaps):
+    """Decoupe la periode en segments (debut, fin, manquant), du plus recent
+    au plus ancien, pour produire les lignes dans l'ordre chronologique inverse"""
+    segments = []
+    upper = date.fromisoformat(to_date[:10])
+    for gap_start, gap_end in reversed(gaps):
+        gap_start, gap_end = date.fromisoformat(gap_start), date.fromisoformat(gap_end)
+        if gap_end < upper:
+            segments.append((gap_end + timedelta(days=1), upper, False))
+        segments.append((gap_start, gap_end, True))
+        upper = gap_start - timedelta(days=1)
+    if date.fromisoformat(from_date[:10]) <= upper:
+        segments.append((date.fromisoformat(from_date[:10]), upper, False))
+    return [(s.isoformat(), e.isoformat(), missing) for s, e, missing in segments]
+
+async def _history_chunks(ticker: str, symbol_id, store, from_date: str, to_date: str, gaps):
+    counts = {"store": 0, "upstream": 0}
+    try:
+        for start, end, missing in _history_segments(from_date, to_date, gaps):
+            if not missing:
+                for chunk in store.iter_rows(ticker, start, end):
+                    counts["store"] += 1
+                    yield chunk
+                continue
+            # Une pagination interrompue leve IncompleteHistory : les pages recues
+            # restent stockees mais la plage n'est pas marquee couverte
+            async for page in _iter_history_pages(symbol_id, start, end):
+                store.save(ticker, page, start, end, complete=False)
+                counts["upstream"] += 1
+                yield page
+            store.save(ticker, [], start, end)
+    finally:
+        for source, count in counts.items():
+            HISTORY_PAGES.labels(source).observe(count)
+
+async def iter_historical(ticker: str, from_date: str, to_date: str, symbol_id: str = None):
+    """Historique OHLCV par blocs (generateur asynchrone), du plus recent au
+    plus ancien : les plages deja stockees sont lues sur disque, les plages
+    manquantes sont paginees depuis l'upstream et stockees au passage.
+    Retourne None si le ticker est inconnu ; l'iteration leve
+    IncompleteHistory si l'upstream echoue en cours de route."""
+    ticker = ticker.upper()
+    store = history_store.default_store()
+    gaps = store.missing_ranges(ticker, from_date, to_date)
+    if gaps and not symbol_id:
+        symbol_id = await get_symbol_id(ticker)
+        if not symbol_id:
+            return None
+    return _history_chunks(ticker, symbol_id, store, from_date, to_date, gaps)
+
+@timed("get_historical")
+async def get_historical(ticker: str, from_date: str, to_date: str):
+    """Historique OHLCV d'un titre. from_date/to_date : YYYY-MM-DD"""
+    chunks = await iter_historical(ticker, from_date, to_date)
+    if chunks is None:
+        return None
+    return [row async for chunk in chunks for row in chunk] or None
+
+@timed("get_history_series")
+async def get_history_series(ticker: str, from_date: str, to_date: str, symbol_id: str = None):
+    """Historique d'un titre en colonnes NumPy (HistorySeries), du plus recent
+    au plus ancien ; None si le ticker est inconnu ou la periode vide"""
+    chunks = await iter_historical(ticker, from_date, to_date, symbol_id)
+    if chunks is None:
+        return None
+    series = HistorySeries.concat([HistorySeries.from_rows(chunk) async for chunk in chunks])
+    return series if len(series) else None
+
+async def _batch_chunks(symbols: dict, from_date: str, to_date: str):
+    queue = asyncio.Queue(maxsize=BATCH_WORKERS * 2)
+    slots = asyncio.Semaphore(BATCH_WORKERS)
+    done = object()
+
+    async def worker(ticker, symbol_id):
+        async with slots:
+            try:
+                chunks = await iter_historical(ticker, from_date, to_date, symbol_id)
+                async for chunk in chunks:
+                    await queue.put((ticker, chunk))
+            except Exception as e:
+                log.warning("historique incomplet", extra={"ticker": ticker, "error": str(e)})
+                await queue.put((ticker, None))
+
+    async def run_all():
+        try:
+            await asyncio.gather(*(worker(t, sid) for t, sid in symbols.items()))
+        finally:
+            await queue.put(done)
+
+    producer = asyncio.ensure_future(run_all())
+    try:
+        while (item := await queue.get()) is not done:
+            yield item
+    finally:
+        producer.cancel()
+
+async def iter_historical_batch(tickers, from_date: str, to_date: str):
+    """Historique de plusieurs titres (ou ["ALL"] pour tout le marche).
+    Les ids sont resolus une seule fois via l'index des symboles, puis au plus
+    BATCH_WORKERS titres sont pagines en parallele (sous la limite globale
+    HISTORY_RATE). Retourne (generateur de (ticker, bloc), tickers inconnus) ;
+    les blocs arrivent dans l'ordre de reception. Un bloc None signale que
+    l'historique du ticker est incomplet (upstream en echec) : les blocs
+    deja recus pour ce ticker ne couvrent pas toute la periode."""
+    date.fromisoformat(from_date)
+    date.fromisoformat(to_date)
+    index = await get_symbol_index()
+    tickers = [t.upper() for t in tickers]
+    if tickers == ["ALL"]:
+        tickers = sorted(index["tickers"])
+    symbols, missing = {}, []
+    for ticker in dict.fromkeys(tickers):
+        symbol_id = index["tickers"].get(ticker) or index["names"].get(ticker)
+        if symbol_id:
+            symbols[ticker] = symbol_id
+        else:
+            missing.append(ticker)
+    return _batch_chunks(symbols, from_date, to_date), missing
+
+# ─── ANALYTICS (barres reechantillonnees + indicateurs) ─────────────────────
+@timed("get_analytics")
+async def get_analytics(ticker: str, from_date: str, to_date: str, interval: str = "D", indicators=()):
+    """Barres OHLCV (D, W, M, Q) et indicateurs [(nom, periode), ...] d'un titre.
+    Chaque resultat est en cache par (ticker, periode, intervalle, indicateur)
+    et par version de la series (nombre de seances, contenu de la derniere
+    seance) : il n'est recalcule que lorsque de nouvelles seances arrivent
+    ou que la seance en cours evolue.
+    Retourne None si le ticker est inconnu ou la periode vide."""
+    ticker = ticker.upper()
+    series = await get_history_series(ticker, from_date, to_date)
+    if series is None:
+        return None
+    series = analytics.chronological(series)
+    # Version : nombre de seances et toute la derniere seance (en cours de seance
+    # la cloture est absente mais dernier cours, plus haut, volume... evoluent)
+    last_row = ",".join(str(column[-1]) for column in series.columns.values())
+    version = f"{len(series)}:{series.dates[-1]}:{last_row}"
+    key = f"analytics:{ticker}:{from_date}:{to_date}:{interval}:{version}"
+    bars = {}
+
+    def resampled():
+        if not bars:
+            bars.update(analytics.resample(series, interval))
+        return bars
+
+    async def fetch_bars():
+        return analytics.bar_rows(resampled())
+
+    async def fetch_indicator(name, window):
+        return analytics.to_list(analytics.compute(name, window, resampled(), interval))
+
+    data = await analytics_results.get_or_fetch(key, fetch_bars)
+    values = {}
+    for name, window in indicators:
+        values[f"{name}_{window}"] = await analytics_results.get_or_fetch(
+            f"{key}:{name}:{window}", lambda: fetch_indicator(name, window))
+    return {"ticker": ticker, "interval": interval, "count": len(data), "data": data, "indicators": values}
 
 # ─── TOP GAINERS / LOSERS / ACTIFS ───────────────────────────────────────────
-def get_top_gainers(limit: int = 10):
-    stocks = [s for s in get_market_live() if s["variation_pct"] is not None and float(s["variation_pct"]) > 0]
-    stocks.sort(key=lambda x: float(x["variation_pct"]), reverse=True)
-    return stocks[:limit]
+async def get_top(ranking: str, limit: int = 10, sector: str = None):
+    """Top N d'un classement (gainers, losers, active, capitalisation, trades),
+    classe une fois par snapshot ; (lignes, stale)"""
+    snapshot = await get_market_snapshot()
+    if not snapshot:
+        return [], False
+    return screener.top(ranking, limit, snapshot, sector), snapshot.stale
+
+async def get_top_gainers(limit: int = 10, sector: str = None):
+    return await get_top("gainers", limit, sector)
+
+async def get_top_losers(limit: int = 10, sector: str = None):
+    return await get_top("losers", limit, sector)
+
+async def get_most_active(limit: int = 10, sector: str = None):
+    return await get_top("active", limit, sector)
+
+# ─── SCREENER ────────────────────────────────────────────────────────────────
+async def screen(plan):
+    """Lignes du snapshot retenues par un plan screener : (lignes, stale), None si indisponible"""
+    snapshot = await get_market_snapshot()
+    if not snapshot:
+        return None, False
+    return screener.run(plan, snapshot), snapshot.stale
+
+# ─── SECTEURS ────────────────────────────────────────────────────────────────
+def _with_index(sector, indices):
+    """Agregats d'un secteur + son indice sectoriel (meme nom normalise) s'il existe"""
+    index = indices.by_name.get(normalize(sector["sector"])) if indices else None
+    return {**sector, "index": {"code": index.code, "value": index.value,
+                                "variation_pct": index.variation_pct} if index else None}
 
-def get_top_losers(limit: int = 10):
-    stocks = [s for s in get_market_live() if s["variation_pct"] is not None and float(s["variation_pct"]) < 0]
-    stocks.sort(key=lambda x: float(x["variation_pct"]))
-    return stocks[:limit]
+async def get_sectors():
+    """Agregats de tous les secteurs (precalcules par snapshot), par capitalisation decroissante"""
+    snapshot, indices = await asyncio.gather(get_market_snapshot(), get_index_snapshot())
+    if not snapshot:
+        return None, False
+    return [_with_index(sector, indices) for sector in snapshot.sector_list], snapshot.stale
 
-def get_most_active(limit: int = 10):
-    stocks = [s for s in get_market_live() if s["volume"] is not None]
-    stocks.sort(key=lambda x: float(x["volume"] or 0), reverse=True)
-    return stocks[:limit]
+async def get_sector(name: str):
+    """(agregats d'un secteur par son nom, ex: Banques, donnees indisponibles) ;
+    (None, False) si le secteur est inconnu, (None, True) sans snapshot du marche"""
+    snapshot, indices = await asyncio.gather(get_market_snapshot(), get_index_snapshot())
+    if not snapshot:
+        return None, True
+    sector = snapshot.sector(name)
+    return ({**_with_index(sector, indices), "stale": snapshot.stale} if sector else None), False
 
 # ─── RESUME MARCHE ────────────────────────────────────────────────────────────
-def get_market_summary():
-    stocks = get_market_live()
-    gainers = [s for s in stocks if s["variation_pct"] and float(s["variation_pct"]) > 0]
-    losers  = [s for s in stocks if s["variation_pct"] and float(s["variation_pct"]) < 0]
-    stable  = [s for s in stocks if s["variation_pct"] and float(s["variation_pct"]) == 0]
-    total_vol = sum(float(s["volume"] or 0) for s in stocks)
-    total_cap = sum(float(s["capitalisation"] or 0) for s in stocks)
-    return {
-        "total_instruments": len(stocks),
-        "gainers": len(gainers),
-        "losers":  len(losers),
-        "stable":  len(stable),
-        "total_volume_mad": round(total_vol, 2),
-        "total_capitalisation_mad": round(total_cap, 2),
-    }
+async def get_market_summary():
+    snapshot = await get_market_snapshot()
+    return {**snapshot.summary, "stale": snapshot.stale} if snapshot else None
@@ -0,0 +1,164 @@
+"""
+Screener sur le snapshot du marche : filtres, tri, projection et limite
+evalues sur la copie en colonnes NumPy du snapshot (MarketSnapshot.columns,
+construite une fois par snapshot). Chaque requete distincte est compilee une
+seule fois en plan (predicats, cle de tri, champs), garde en cache LRU.
+
+    filter=sector:eq:Banques,variation_pct:gt:2,volume:gte:1000000
+    sort=-capitalisation    fields=ticker,name,variation_pct    limit=20
+
+Les top listes sont des plans predefinis (RANKINGS), classes une fois par
+snapshot : chaque appel n'en prend qu'une tranche.
+"""
+import os
+from dataclasses import fields as dataclass_fields
+from functools import lru_cache
+
+import numpy as np
+
+from records import StockQuote
+from snapshot import normalize
+
+SCREENER_MAX_LIMIT = int(os.getenv("SCREENER_MAX_LIMIT", "500"))
+SCREENER_PLAN_CACHE = int(os.getenv("SCREENER_PLAN_CACHE", "256"))
+
+FIELDS = tuple(f.name for f in dataclass_fields(StockQuote))
+TEXT_FIELDS = tuple(f.name for f in dataclass_fields(StockQuote) if f.type is str)
+NUMERIC_FIELDS = tuple(name for name in FIELDS if name not in TEXT_FIELDS)
+
+# Operateurs : valeurs NaN (champ absent) jamais retenues, sauf par "ne"
+NUMERIC_OPS = {
+    "eq": np.equal, "ne": np.not_equal,
+    "gt": np.greater, "gte": np.greater_equal,
+    "lt": np.less, "lte": np.less_equal,
+}
+TEXT_OPS = ("eq", "ne", "in")
+# "set" : champ renseigne (sans valeur)
+
+# Top listes : nom -> (filtre, tri)
+RANKINGS = {
+    "gainers":        ("variation_pct:gt:0", "-variation_pct"),
+    "losers":         ("variation_pct:lt:0", "variation_pct"),
+    "active":         ("volume:set", "-volume"),
+    "capitalisation": ("capitalisation:set", "-capitalisation"),
+    "trades":         ("nb_trades:set", "-nb_trades"),
+}
+
+
+class Plan:
+    """Requete compilee : predicats (colonne, operateur, valeur), tri, champs, limite"""
+
+    __slots__ = ("predicates", "sort", "descending", "fields", "limit")
+
+    def __init__(self, predicates, sort, descending, fields, limit):
+        self.predicates = predicates
+        self.sort = sort
+        self.descending = descending
+        self.fields = fields
+        self.limit = limit
+
+
+def _predicate(item: str):
+    name, _, rest = item.strip().partition(":")
+    op, _, value = rest.partition(":")
+    name, op = name.strip().lower(), op.strip().lower()
+    if name not in FIELDS:
+        raise ValueError(f"champ inconnu: {name}")
+    if op == "set":
+        return name, op, None
+    if not value:
+        raise ValueError(f"filtre incomplet (champ:operateur:valeur): {item.strip()}")
+    if name in TEXT_FIELDS:
+        if op not in TEXT_OPS:
+            raise ValueError(f"operateur invalide pour {name}: {op} ({', '.join(TEXT_OPS)}, set)")
+        values = tuple(normalize(v) for v in value.split("|")) if op == "in" else normalize(value)
+        return name, op, values
+    if op not in NUMERIC_OPS:
+        raise ValueError(f"operateur invalide pour {name}: {op} ({', '.join(NUMERIC_OPS)}, set)")
+    try:
+        return name, op, float(value)
+    except ValueError:
+        raise ValueError(f"valeur numerique attendue pour {name}: {value}")
+
+
+@lru_cache(maxsize=SCREENER_PLAN_CACHE)
+def compile_plan(filters: str = None, sort: str = None, fields: str = None, limit: int = 50) -> Plan:
+    """Plan d'une requete (mis en cache par requete distincte) ; ValueError si invalide"""
+    predicates = tuple(_predicate(item) for item in (filters or "").split(",") if item.strip())
+    sort_field, descending = None, False
+    if sort:
+        sort = sort.strip().lower()
+        descending = sort.startswith("-")
+        sort_field = sort.lstrip("-+")
+        if sort_field not in FIELDS:
+            raise ValueError(f"champ de tri inconnu: {sort_field}")
+    projection = None
+    if fields:
+        projection = tuple(dict.fromkeys(f.strip().lower() for f in fields.split(",") if f.strip()))
+        unknown = [f for f in projection if f not in FIELDS]
+        if unknown:
+            raise ValueError(f"champs inconnus: {', '.join(unknown)}")
+    if not 1 <= limit <= SCREENER_MAX_LIMIT:
+        raise ValueError(f"limite hors bornes (1-{SCREENER_MAX_LIMIT}): {limit}")
+    return Plan(predicates, sort_field, descending, projection, limit)
+
+
+def _mask(columns, name: str, op: str, value):
+    column = columns[name]
+    if name in TEXT_FIELDS:
+        if op == "set":
+            return column != ""
+        if op == "in":
+            return np.isin(column, value)
+        return (column == value) if op == "eq" else (column != value)
+    if op == "set":
+        return ~np.isnan(column)
+    return NUMERIC_OPS[op](column, value)
+
+
+def select(plan: Plan, snapshot):
+    """Positions des lignes retenues, triees et limitees"""
+    columns = snapshot.columns()
+    selected = np.ones(len(snapshot), dtype=bool)
+    for name, op, value in plan.predicates:
+        selected &= _mask(columns, name, op, value)
+    positions = np.flatnonzero(selected)
+    if plan.sort is not None and len(positions):
+        keys = columns[plan.sort][positions]
+        if plan.sort in TEXT_FIELDS:
+            order = np.argsort(keys, kind="stable")
+            if plan.descending:
+                order = order[::-1]
+        else:
+            # Valeurs absentes (NaN) en fin de liste dans les deux sens
+            order = np.argsort(-keys if plan.descending else keys, kind="stable")
+        positions = positions[order]
+    return positions[:plan.limit].tolist()
+
+
+def run(plan: Plan, snapshot):
+    """Lignes retenues (StockQuote, ou dicts reduits aux champs demandes)"""
+    rows = [snapshot.stocks[i] for i in select(plan, snapshot)]
+    if plan.fields is None:
+        return rows
+    return [{name: getattr(row, name) for name in plan.fields} for row in rows]
+
+
+def top(ranking: str, limit: int, snapshot, sector: str = None):
+    """Top liste : classement complet calcule une fois par snapshot (par
+    classement et secteur), puis tranche des `limit` premieres lignes"""
+    if sector and snapshot.sector(sector) is None:
+        return []
+    key = (ranking, normalize(sector) if sector else None)
+    positions = snapshot.rankings.get(key)
+    if positions is None:
+        positions = snapshot.rankings[key] = select(ranking_plan(ranking, SCREENER_MAX_LIMIT, sector), snapshot)
+    return [snapshot.stocks[i] for i in positions[:limit]]
+
+
+def ranking_plan(ranking: str, limit: int, sector: str = None) -> Plan:
+    """Plan d'une top liste, optionnellement restreinte a un secteur"""
+    filters, sort = RANKINGS[ranking]
+    if sector:
+        filters = f"{filters},sector:eq:{sector.replace(',', ' ')}"
+    return compile_plan(filters, sort, None, limit)
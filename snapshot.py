@@ -0,0 +1,226 @@
+"""
+Snapshot du marche live : les lignes renvoyees par l'API (enregistrements
+types, voir records.py), et les agregats / index de recherche precalcules a
+l'ingestion (resume, secteurs, lookups O(1)). Le corps JSON de la reponse
+complete est serialise une seule fois par snapshot ; la copie en colonnes
+lue par le screener (top listes comprises) est construite a la premiere
+requete.
+"""
+import copy
+import gzip
+import hashlib
+import time
+import unicodedata
+from dataclasses import fields
+
+import numpy as np
+import orjson
+
+from records import IndexQuote, StockQuote
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Encodages proposes pour les corps precalcules, par ordre de preference
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+# En dessous de cette taille (octets), le corps est renvoye non compresse
+COMPRESS_MIN_SIZE = 1024
+
+
+def content_hash(raw: bytes) -> str:
+    """Empreinte du contenu d'un snapshot (sert d'ETag HTTP)"""
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+class SerializedPayload:
+    """Corps JSON {"count", "stale", "data"} serialise a la construction
+    (orjson), son ETag, et ses variantes compressees calculees a la premiere
+    demande. stale = dernier snapshot connu, servi faute d'upstream."""
+
+    stale = False
+
+    def _serialize(self, rows):
+        self._rows = rows
+        self.body = orjson.dumps({"count": len(rows), "stale": self.stale, "data": rows})
+        self.etag = content_hash(self.body)
+        self._encoded = {}
+        self._stale_copy = None
+
+    def as_stale(self):
+        """Copie marquee stale: true (partage les lignes et les index), creee une seule fois"""
+        if self.stale:
+            return self
+        if self._stale_copy is None:
+            stale = copy.copy(self)
+            stale.stale = True
+            stale._serialize(self._rows)
+            self._stale_copy = stale
+        return self._stale_copy
+
+    def encoded(self, encoding: str = None) -> bytes:
+        """Corps brut (encoding=None) ou compresse en gzip / br"""
+        if encoding is None:
+            return self.body
+        if encoding not in self._encoded:
+            if encoding == "br":
+                self._encoded[encoding] = brotli.compress(self.body, quality=5)
+            else:
+                self._encoded[encoding] = gzip.compress(self.body, compresslevel=6, mtime=0)
+        return self._encoded[encoding]
+
+
+def normalize(text) -> str:
+    """Cle de recherche : majuscules, sans accents ni espaces superflus"""
+    text = unicodedata.normalize("NFKD", str(text or ""))
+    return " ".join("".join(c for c in text if not unicodedata.combining(c)).upper().split())
+
+
+# Meilleures hausses / baisses reprises dans les agregats de chaque secteur
+SECTOR_TOP_MOVERS = 3
+
+
+def _mover(row):
+    return {"ticker": row.ticker, "name": row.name, "last_price": row.last_price,
+            "variation_pct": row.variation_pct}
+
+
+def _sector_aggregates(stocks):
+    """Agregats par secteur (cle normalisee) en une passe sur les lignes :
+    hausses / baisses, volumes, capitalisation et variation ponderee par la
+    capitalisation de la veille"""
+    groups = {}
+    for row in stocks:
+        key = normalize(row.sector)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {
+                "sector": row.sector or "", "instruments": 0, "advancers": 0, "decliners": 0, "unchanged": 0,
+                "volume_mad": 0.0, "qty_traded": 0, "trades": 0, "capitalisation_mad": 0.0,
+                "weighted_cap": 0.0, "previous_cap": 0.0, "movers": [],
+            }
+        group["instruments"] += 1
+        variation = row.variation_pct
+        if variation is not None:
+            if variation > 0:
+                group["advancers"] += 1
+            elif variation < 0:
+                group["decliners"] += 1
+            else:
+                group["unchanged"] += 1
+            if variation:
+                group["movers"].append(row)
+        group["volume_mad"] += row.volume or 0
+        group["qty_traded"] += row.qty_traded or 0
+        group["trades"] += row.nb_trades or 0
+        if row.capitalisation:
+            group["capitalisation_mad"] += row.capitalisation
+            if variation is not None and variation > -100:
+                group["weighted_cap"] += row.capitalisation
+                group["previous_cap"] += row.capitalisation / (1 + variation / 100)
+    for key, group in groups.items():
+        weighted, previous = group.pop("weighted_cap"), group.pop("previous_cap")
+        group["variation_pct"] = round((weighted / previous - 1) * 100, 2) if previous else None
+        group["volume_mad"] = round(group["volume_mad"], 2)
+        group["capitalisation_mad"] = round(group["capitalisation_mad"], 2)
+        movers = sorted(group.pop("movers"), key=lambda r: r.variation_pct, reverse=True)
+        group["top_gainers"] = [_mover(r) for r in movers[:SECTOR_TOP_MOVERS] if r.variation_pct > 0]
+        group["top_losers"] = [_mover(r) for r in movers[::-1][:SECTOR_TOP_MOVERS] if r.variation_pct < 0]
+    return groups
+
+
+class MarketSnapshot(SerializedPayload):
+    """Un fetch du ticker BVC, avec son resume et ses agregats par secteur
+    precalcules ; copie en colonnes pour le screener et top listes classees
+    a la premiere demande"""
+
+    def __init__(self, stocks, fetched_at: float = None):
+        # StockQuote, ou dicts de meme forme (cache partage, tests) convertis ici
+        stocks = [s if isinstance(s, StockQuote) else StockQuote.from_dict(s) for s in stocks]
+        self.stocks = stocks
+        self.fetched_at = fetched_at or time.time()
+        self._serialize(stocks)
+        self.sectors = _sector_aggregates(stocks)
+        self.sector_list = sorted(self.sectors.values(), key=lambda g: g["capitalisation_mad"], reverse=True)
+        self._columns = None
+        # Top listes classees (screener.top), calculees a la premiere demande
+        self.rankings = {}
+        # Index de recherche : ticker et nom normalise
+        self.by_key = {}
+        for row in stocks:
+            for key in (row.name, row.ticker):
+                if key:
+                    self.by_key[normalize(key)] = row
+        self.summary = {
+            "total_instruments": len(stocks),
+            "gainers": sum(g["advancers"] for g in self.sector_list),
+            "losers":  sum(g["decliners"] for g in self.sector_list),
+            "stable":  sum(g["unchanged"] for g in self.sector_list),
+            "total_volume_mad": round(sum(s.volume for s in stocks if s.volume), 2),
+            "total_capitalisation_mad": round(sum(s.capitalisation for s in stocks if s.capitalisation), 2),
+        }
+
+    def __len__(self):
+        return len(self.stocks)
+
+    def rows(self):
+        """Lignes sous forme de dicts (reponses JSON)"""
+        return [s.to_dict() for s in self.stocks]
+
+    def dump(self):
+        """Forme JSON pour le cache partage"""
+        return {"fetched_at": self.fetched_at, "rows": self.rows()}
+
+    @classmethod
+    def load(cls, data):
+        return cls(data["rows"], data["fetched_at"])
+
+    def lookup(self, symbol: str):
+        """Ligne d'une action par ticker ou nom (None si inconnue)"""
+        return self.by_key.get(normalize(symbol))
+
+    def sector(self, name: str):
+        """Agregats d'un secteur (None si inconnu)"""
+        return self.sectors.get(normalize(name))
+
+    def columns(self):
+        """Champs des lignes en colonnes NumPy (float64 avec NaN pour les valeurs
+        absentes, textes normalises), construites une fois par snapshot"""
+        if self._columns is None:
+            self._columns = {
+                f.name: np.array([normalize(getattr(s, f.name)) for s in self.stocks], dtype=object)
+                if f.type is str else
+                np.array([getattr(s, f.name) for s in self.stocks], dtype=np.float64)
+                for f in fields(StockQuote)
+            }
+        return self._columns
+
+
+class IndexSnapshot(SerializedPayload):
+    """Un fetch de grouped_index_watch, indexe par code d'indice"""
+
+    def __init__(self, indices, fetched_at: float = None):
+        indices = [i if isinstance(i, IndexQuote) else IndexQuote.from_dict(i) for i in indices]
+        self.indices = indices
+        self.fetched_at = fetched_at or time.time()
+        self._serialize(indices)
+        self.by_code = {normalize(idx.code): idx for idx in indices if idx.code}
+        # Rapprochement des indices sectoriels avec les secteurs du ticker
+        self.by_name = {normalize(idx.name): idx for idx in indices if idx.name}
+
+    def __len__(self):
+        return len(self.indices)
+
+    def rows(self):
+        return [i.to_dict() for i in self.indices]
+
+    def dump(self):
+        return {"fetched_at": self.fetched_at, "rows": self.rows()}
+
+    @classmethod
+    def load(cls, data):
+        return cls(data["rows"], data["fetched_at"])
+
+    def lookup(self, code: str):
+        return self.by_code.get(normalize(code))
@@ -0,0 +1,128 @@
+"""
+Diffusion en push (WebSocket / SSE) du marche live : un snapshot initial,
+puis uniquement les champs modifies par ticker a chaque nouveau snapshot.
+Un seul broadcaster partage : un fetch et un diff par snapshot, quel que
+soit le nombre d'abonnes.
+"""
+import asyncio
+import logging
+import os
+
+import scraper
+from snapshot import normalize
+
+STREAM_INTERVAL = float(os.getenv("STREAM_INTERVAL", "5"))
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "100"))
+
+log = logging.getLogger(__name__)
+
+# Champs surveilles pour les deltas (prix, volumes, carnet)
+DELTA_FIELDS = (
+    "last_price", "open", "high", "low", "variation_pct", "volume", "qty_traded",
+    "nb_trades", "capitalisation", "status", "bid_price", "ask_price",
+)
+
+
+def diff(previous, current):
+    """Champs modifies par ticker entre deux snapshots ; les nouveaux tickers
+    sont renvoyes en entier"""
+    changes = {}
+    for row in current.stocks:
+        ticker = row.ticker
+        before = previous.lookup(ticker) if previous is not None else None
+        if before is None:
+            changes[ticker] = row.to_dict()
+            continue
+        changed = {f: getattr(row, f) for f in DELTA_FIELDS if getattr(row, f) != getattr(before, f)}
+        if changed:
+            changes[ticker] = changed
+    return changes
+
+
+class Subscriber:
+    """File de messages d'un client, avec ses filtres (tickers, secteur)"""
+
+    def __init__(self, tickers=None, sector=None):
+        self.tickers = {normalize(t) for t in tickers} if tickers else None
+        self.sector = normalize(sector) if sector else None
+        self.queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+    def wants(self, row) -> bool:
+        if self.tickers is not None and normalize(row.ticker) not in self.tickers:
+            return False
+        return self.sector is None or normalize(row.sector) == self.sector
+
+    def snapshot_message(self, snapshot):
+        return {
+            "type": "snapshot",
+            "fetched_at": snapshot.fetched_at,
+            "stale": snapshot.stale,
+            "data": [row.to_dict() for row in snapshot.stocks if self.wants(row)],
+        }
+
+    def push(self, message, snapshot):
+        """Client trop lent : on vide sa file et on le resynchronise par un snapshot complet"""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(self.snapshot_message(snapshot))
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class Broadcaster:
+    """Lit le snapshot partage toutes les STREAM_INTERVAL secondes tant qu'il
+    y a des abonnes, calcule un diff par nouveau snapshot et le diffuse"""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.last = None
+        self._task = None
+
+    async def subscribe(self, tickers=None, sector=None) -> Subscriber:
+        sub = Subscriber(tickers, sector)
+        if self.last is None or self._task is None:
+            # Broadcaster au repos : le dernier snapshot diffuse peut etre perime
+            self.last = await scraper.get_market_snapshot()
+        if self.last:
+            sub.push(sub.snapshot_message(self.last), self.last)
+        self.subscribers.add(sub)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self.subscribers.discard(sub)
+        if not self.subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def publish(self, snapshot):
+        """Diffuse les deltas d'un nouveau snapshot (ignore si deja publie)"""
+        if snapshot is None or snapshot is self.last:
+            return
+        changes = diff(self.last, snapshot) if self.last is not None else {}
+        self.last = snapshot
+        if not changes:
+            return
+        rows = [(ticker, fields, snapshot.lookup(ticker)) for ticker, fields in changes.items()]
+        for sub in list(self.subscribers):
+            data = {ticker: fields for ticker, fields, row in rows if sub.wants(row)}
+            if data:
+                sub.push({"type": "delta", "fetched_at": snapshot.fetched_at, "data": data}, snapshot)
+
+    async def _run(self):
+        while True:
+            try:
+                self.publish(await scraper.get_market_snapshot())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.exception("diffusion du snapshot en echec", extra={"error": str(e)})
+            await asyncio.sleep(STREAM_INTERVAL)
+
+
+broadcaster = Broadcaster()
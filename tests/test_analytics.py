@@ -0,0 +1,108 @@
+"""
+Tests des indicateurs techniques et du reechantillonnage de l'historique
+"""
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+import analytics
+import scraper
+from records import HistorySeries
+
+
+def _series(closes, start="2024-01-01"):
+    """Series d'une seance par jour calendaire, la plus recente en premier (ordre du store)"""
+    days = np.arange(np.datetime64(start), np.datetime64(start) + len(closes))
+    rows = [{"date": str(day), "open": c - 1, "close": c, "last": c, "high": c + 2, "low": c - 2,
+             "volume": 100.0, "qty": 10, "trades": 1, "market_cap": None}
+            for day, c in zip(days, closes)]
+    return HistorySeries.from_rows(rows[::-1])
+
+
+def test_resample_weekly_and_monthly():
+    # 2024-01-01 est un lundi : 31 jours -> 5 semaines (la derniere incomplete), 1 mois
+    series = analytics.chronological(_series([float(i) for i in range(1, 32)]))
+    weekly = analytics.resample(series, "W")
+    assert weekly["sessions"].tolist() == [7, 7, 7, 7, 3]
+    assert weekly["open"][0] == 0.0 and weekly["close"][0] == 7.0
+    assert weekly["high"][1] == 16.0 and weekly["low"][1] == 6.0
+    assert weekly["volume"][0] == 700.0
+    monthly = analytics.resample(series, "M")
+    assert analytics.bar_rows(monthly)[0]["date"] == "2024-01-31"
+    assert monthly["trades"].tolist() == [31]
+
+
+def test_sma_ema_rsi():
+    closes = np.array([1.0, 2.0, 3.0, 4.0, 5.0])
+    assert analytics.to_list(analytics.sma(closes, 3)) == [None, None, 2.0, 3.0, 4.0]
+    assert analytics.to_list(analytics.ema(closes, 3)) == [None, None, 2.0, 3.0, 4.0]
+    assert analytics.to_list(analytics.rsi(closes, 3))[-1] == 100.0
+    assert np.isnan(analytics.volatility(closes, 3)[:3]).all()
+
+
+def test_rsi_undefined_on_flat_series():
+    closes = np.array([10.0, 10.0, 10.0, 10.0, 10.0, 11.0])
+    assert analytics.to_list(analytics.rsi(closes, 3)) == [None, None, None, None, None, 100.0]
+
+
+def test_parse_indicators():
+    assert analytics.parse_indicators("SMA:20, rsi,sma:20") == [("sma", 20), ("rsi", 14)]
+    with pytest.raises(ValueError):
+        analytics.parse_indicators("macd:12")
+    with pytest.raises(ValueError):
+        analytics.parse_indicators("sma:1")
+
+
+@pytest.mark.asyncio
+async def test_analytics_cached_until_new_session():
+    scraper.analytics_results.clear()
+    calls = []
+
+    def counting_sma(values, window):
+        calls.append(window)
+        return analytics.sma(values, window)
+
+    with patch.dict(analytics.INDICATORS, {"sma": counting_sma}):
+        with patch("scraper.get_history_series", return_value=_series([10.0, 11.0, 12.0])):
+            first = await scraper.get_analytics("atw", "2024-01-01", "2024-01-31", "D", [("sma", 2)])
+            second = await scraper.get_analytics("ATW", "2024-01-01", "2024-01-31", "D", [("sma", 2)])
+        with patch("scraper.get_history_series", return_value=_series([10.0, 11.0, 12.0, 13.0])):
+            third = await scraper.get_analytics("ATW", "2024-01-01", "2024-01-31", "D", [("sma", 2)])
+    assert first == second
+    assert first["indicators"]["sma_2"] == [None, 10.5, 11.5]
+    assert third["indicators"]["sma_2"][-1] == 12.5
+    assert calls == [2, 2]
+    scraper.analytics_results.clear()
+
+
+@pytest.mark.asyncio
+async def test_analytics_follow_session_in_progress():
+    """Seance en cours (cloture absente) : un nouveau dernier cours invalide le cache"""
+    scraper.analytics_results.clear()
+
+    def in_progress(last):
+        series = _series([10.0, 11.0, 12.0])
+        series.columns["close"][0] = np.nan
+        series.columns["last"][0] = last
+        return series
+
+    for last, expected in ((120.0, 65.5), (130.0, 70.5)):
+        with patch("scraper.get_history_series", return_value=in_progress(last)):
+            result = await scraper.get_analytics("ATW", "2024-01-01", "2024-01-31", "D", [("sma", 2)])
+        assert result["data"][-1]["close"] == last
+        assert result["indicators"]["sma_2"][-1] == expected
+    scraper.analytics_results.clear()
+
+
+@pytest.mark.asyncio
+async def test_analytics_results_bounded(monkeypatch):
+    """Une cle par periode demandee : les plus anciennes sont evincees"""
+    monkeypatch.setattr(scraper.analytics_results, "max_entries", 2)
+    scraper.analytics_results.clear()
+    with patch("scraper.get_history_series", return_value=_series([10.0, 11.0, 12.0])):
+        for day in range(1, 6):
+            await scraper.get_analytics("ATW", f"2024-01-0{day}", "2024-01-31")
+    assert len(scraper.analytics_results.stats()["entries"]) == 2
+    assert not any(key.startswith("analytics:") for key in scraper.snapshots.stats()["entries"])
+    scraper.analytics_results.clear()
@@ -0,0 +1,180 @@
+"""
+Tests du cache partage (backend Redis) avec un faux Redis local
+"""
+import asyncio
+import time
+
+import pytest
+
+import cache
+from cache import RedisBackend, SnapshotCache
+from http_client import UpstreamUnavailable
+from snapshot import MarketSnapshot
+
+fakeredis = pytest.importorskip("fakeredis")
+
+STOCKS = [{"ticker": "ATW", "name": "Attijariwafa Bank", "sector": "Banques", "variation_pct": "0.52"}]
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def _worker(server):
+    """Un cache par worker, tous relies au meme (faux) Redis"""
+    cache = SnapshotCache(ttl=60, backend=RedisBackend(fakeredis.FakeAsyncRedis(server=server)))
+    cache.register("market", MarketSnapshot.dump, MarketSnapshot.load)
+    return cache
+
+
+@pytest.mark.asyncio
+async def test_second_worker_reads_shared_value(server):
+    """Le second worker lit le snapshot publie par le premier, sans upstream"""
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return MarketSnapshot(STOCKS)
+
+    first, second = _worker(server), _worker(server)
+    snap = await first.get_or_fetch("market", fetch)
+    shared = await second.get_or_fetch("market", fetch)
+    assert len(calls) == 1
+    assert isinstance(shared, MarketSnapshot)
+    assert shared.etag == snap.etag
+    assert shared.fetched_at == snap.fetched_at
+    assert second.stats()["shared_hits"] == 1
+    assert 0 < second.expires_in("market") <= 60
+
+
+@pytest.mark.asyncio
+async def test_distributed_lock_single_refresh(server):
+    """Plusieurs workers simultanes : un seul rafraichit la cle"""
+    calls = []
+
+    async def slow_fetch():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return ["row"]
+
+    workers = [_worker(server) for _ in range(5)]
+    results = await asyncio.gather(*(w.get_or_fetch("build_id", slow_fetch) for w in workers))
+    assert len(calls) == 1
+    assert results == [["row"]] * 5
+
+
+@pytest.mark.asyncio
+async def test_failed_fetch_not_replayed_by_waiting_workers(server):
+    """Upstream en panne : les workers en attente ne rejouent pas l'appel
+    apres le detenteur du verrou, ils renvoient aussitot son resultat vide"""
+    calls = []
+
+    async def failing_fetch():
+        calls.append(1)
+        await asyncio.sleep(0.2)
+        return None
+
+    workers = [_worker(server) for _ in range(3)]
+    start = time.monotonic()
+    results = await asyncio.gather(*(w.get_or_fetch("market", failing_fetch) for w in workers))
+    assert results == [None] * 3
+    assert len(calls) == 1
+    assert time.monotonic() - start < 0.4
+
+
+@pytest.mark.asyncio
+async def test_failed_fetch_raised_in_waiting_workers(server):
+    """Fetch en exception chez le detenteur du verrou : les workers en attente
+    levent UpstreamUnavailable plutot que de renvoyer un resultat vide"""
+    calls = []
+
+    async def raising_fetch():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        raise RuntimeError("page en echec")
+
+    workers = [_worker(server) for _ in range(3)]
+    results = await asyncio.gather(*(w.get_or_fetch("history:1", raising_fetch) for w in workers),
+                                   return_exceptions=True)
+    assert len(calls) == 1
+    assert sorted(type(r).__name__ for r in results) == ["RuntimeError", "UpstreamUnavailable", "UpstreamUnavailable"]
+
+
+@pytest.mark.asyncio
+async def test_wait_for_lock_holder_is_bounded(server, monkeypatch):
+    """Detenteur du verrou bloque : l'attente s'arrete a CACHE_LOCK_WAIT"""
+    monkeypatch.setattr(cache, "CACHE_LOCK_WAIT", 0.2)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return ["row"]
+
+    worker = _worker(server)
+    assert await worker.backend.acquire("market") is not None
+    start = time.monotonic()
+    with pytest.raises(UpstreamUnavailable):
+        await worker.get_or_fetch("market", fetch)
+    assert 0.2 <= time.monotonic() - start < 0.5
+    assert calls == []
+
+
+@pytest.mark.asyncio
+async def test_lock_released_after_fetch(server):
+    cache = _worker(server)
+
+    async def fetch():
+        return ["row"]
+
+    await cache.get_or_fetch("k", fetch)
+    assert await cache.backend.acquire("k") is not None
+
+
+@pytest.mark.asyncio
+async def test_lease_granted_to_one_worker(server):
+    first, second = _worker(server), _worker(server)
+    assert await first.lease("poller", 10)
+    assert not await second.lease("poller", 10)
+
+
+@pytest.mark.asyncio
+async def test_redis_failure_falls_back_to_fetch():
+    """Redis indisponible : le cache se comporte comme un cache memoire"""
+    class BrokenRedis:
+        def __getattr__(self, name):
+            raise ConnectionError("redis down")
+
+    cache = SnapshotCache(ttl=60, backend=RedisBackend(BrokenRedis()))
+
+    async def fetch():
+        return ["row"]
+
+    assert await cache.get_or_fetch("k", fetch) == ["row"]
+    assert await cache.get_or_fetch("k", fetch) == ["row"]
+    assert cache.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_history_page_failed_in_other_worker_not_marked_covered(server, tmp_path, monkeypatch):
+    """Page d'historique en echec chez le worker qui tient le verrou : l'autre
+    worker leve IncompleteHistory et la plage reste a recuperer"""
+    import history_store
+    import scraper
+
+    store = history_store.HistoryStore(str(tmp_path / "history.db"))
+    monkeypatch.setattr(history_store, "_default", store)
+    monkeypatch.setattr(scraper, "snapshots", _worker(server))
+
+    async def failing_page():
+        await asyncio.sleep(0.1)
+        raise scraper.IncompleteHistory("page offset=0: 503")
+
+    holder = asyncio.ensure_future(
+        _worker(server).get_or_fetch("history:511:2020-01-01:2020-12-31:0", failing_page, local=False))
+    await asyncio.sleep(0.02)
+    with pytest.raises(scraper.IncompleteHistory):
+        await scraper.get_history_series("ATW", "2020-01-01", "2020-12-31", symbol_id="511")
+    with pytest.raises(scraper.IncompleteHistory):
+        await holder
+    assert store.missing_ranges("ATW", "2020-01-01", "2020-12-31") == [("2020-01-01", "2020-12-31")]
@@ -0,0 +1,85 @@
+"""
+Tests de l'archive de fin de seance (ecriture CSV.gz, relecture, planification)
+"""
+import gzip
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+
+import eod
+import poller
+
+
+@pytest.fixture(autouse=True)
+def eod_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(eod, "EOD_DIR", str(tmp_path))
+    eod._load.cache_clear()
+    return tmp_path
+
+
+@pytest.mark.asyncio
+@patch("scraper._fetch_indices", return_value=[{"code": "MASI", "name": "MASI", "value": 13245.67}])
+@patch("scraper._fetch_market_live", return_value=[
+    {"ticker": "ATW", "name": "Attijariwafa Bank", "sector": "Banques", "last_price": 485.0, "qty_traded": "258"},
+    {"ticker": "IAM", "name": "Maroc Telecom", "sector": "Telecoms", "last_price": None},
+])
+async def test_archive_then_read(mock_market, mock_indices, eod_dir):
+    assert await eod.archive("2026-10-14") is True
+    with gzip.open(eod_dir / "2026-10-14.market.csv.gz", "rt") as f:
+        assert f.readline().strip() == ",".join(eod.COLUMNS["market"])
+    rows = eod.read("2026-10-14")
+    assert [r.ticker for r in rows] == ["ATW", "IAM"]
+    assert rows[0].last_price == 485.0 and rows[0].qty_traded == 258
+    assert rows[1].last_price is None
+    assert eod.read("2026-10-14", "indices")[0].value == 13245.67
+    assert eod.status()["last_archive"] == "2026-10-14"
+
+
+@pytest.mark.asyncio
+@patch("scraper._fetch_indices", return_value=[{"code": "MASI"}])
+@patch("scraper._fetch_market_live", return_value=[])
+async def test_archive_skipped_without_data(mock_market, mock_indices):
+    assert await eod.archive("2026-10-14") is False
+    assert eod.read("2026-10-14") is None
+
+
+def test_range_reads_archived_days_in_order():
+    for day in ("2026-10-15", "2026-10-13", "2026-10-14"):
+        eod.write(day, "market", [{"ticker": "ATW", "last_price": 480.0}])
+    assert eod.days("2026-10-14", "2026-10-31") == ["2026-10-14", "2026-10-15"]
+    assert [day for day, _ in eod.iter_range("2026-10-01", "2026-10-14")] == ["2026-10-13", "2026-10-14"]
+    with pytest.raises(ValueError):
+        eod.days("14/10/2026")
+
+
+def test_next_capture_skips_weekend():
+    friday_evening = datetime(2026, 10, 16, 17, 0, tzinfo=poller.BVC_TZ)
+    monday_capture = datetime.combine(datetime(2026, 10, 19).date(), eod.EOD_TIME, tzinfo=poller.BVC_TZ)
+    assert eod.seconds_until_next(friday_evening) == (monday_capture - friday_evening).total_seconds()
+
+
+def test_corrupt_archive_is_missing(eod_dir):
+    """Archive tronquee : traitee comme absente (404), sans erreur 500"""
+    eod.write("2026-10-14", "market", [{"ticker": "ATW", "last_price": 480.0}])
+    data = (eod_dir / "2026-10-14.market.csv.gz").read_bytes()
+    (eod_dir / "2026-10-14.market.csv.gz").write_bytes(data[:len(data) // 2])
+    assert eod.read("2026-10-14") is None
+    assert list(eod.iter_range("2026-10-01", "2026-10-31")) == []
+
+
+def test_concurrent_writes_use_distinct_tmp_files(eod_dir, monkeypatch):
+    """Deux workers archivant la meme seance n'ecrivent pas le meme fichier temporaire"""
+    tmp_files = []
+    replace = eod.os.replace
+
+    def record(src, dst):
+        tmp_files.append(src)
+        replace(src, dst)
+
+    monkeypatch.setattr(eod.os, "replace", record)
+    eod.write("2026-10-14", "market", [{"ticker": "ATW"}])
+    eod.write("2026-10-14", "market", [{"ticker": "IAM"}])
+    assert len(set(tmp_files)) == 2
+    assert sorted(p.name for p in eod_dir.iterdir()) == ["2026-10-14.market.csv.gz"]
+    assert [r.ticker for r in eod.read("2026-10-14")] == ["IAM"]
@@ -0,0 +1,153 @@
+"""
+Tests du store local d'historique OHLCV et du gap-fill incremental
+"""
+import time
+from unittest.mock import patch
+
+import pytest
+
+import history_store
+import scraper
+from history_store import HistoryStore
+from http_client import RateLimiter
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = HistoryStore(str(tmp_path / "history.sqlite"))
+    monkeypatch.setattr(history_store, "_default", store)
+    return store
+
+
+def _row(day, close=100.0):
+    return {"date": day, "open": close, "close": close, "last": close, "high": close,
+            "low": close, "volume": 1000.0, "qty": 10, "trades": 3, "market_cap": 1e9}
+
+
+def test_missing_ranges_empty_store(store):
+    assert store.missing_ranges("ATW", "2024-01-01", "2024-01-31") == [("2024-01-01", "2024-01-31")]
+
+
+def test_missing_ranges_around_coverage(store):
+    """Seules les dates non couvertes sont renvoyees"""
+    store.save("ATW", [_row("2024-01-10")], "2024-01-10", "2024-01-20")
+    assert store.missing_ranges("ATW", "2024-01-01", "2024-01-31") == [
+        ("2024-01-01", "2024-01-09"),
+        ("2024-01-21", "2024-01-31"),
+    ]
+    assert store.missing_ranges("ATW", "2024-01-12", "2024-01-15") == []
+    assert store.missing_ranges("IAM", "2024-01-12", "2024-01-15") == [("2024-01-12", "2024-01-15")]
+
+
+def test_adjacent_coverage_is_merged(store):
+    store.save("ATW", [], "2024-01-01", "2024-01-10")
+    store.save("ATW", [], "2024-01-11", "2024-01-20")
+    assert store._coverage("ATW") == [(history_store._day("2024-01-01"), history_store._day("2024-01-20"))]
+
+
+def test_incomplete_fetch_not_marked_covered(store):
+    """Une pagination interrompue ne doit pas etre consideree comme couverte"""
+    store.save("ATW", [_row("2024-01-10")], "2024-01-01", "2024-01-31", complete=False)
+    assert store.missing_ranges("ATW", "2024-01-01", "2024-01-31") == [("2024-01-01", "2024-01-31")]
+    assert len(store.rows("ATW", "2024-01-01", "2024-01-31")) == 1
+
+
+def _fake_pages(*pages):
+    calls = []
+
+    async def iter_pages(symbol_id, start, end):
+        calls.append((start, end))
+        for page in pages:
+            yield page
+
+    return iter_pages, calls
+
+
+@pytest.mark.asyncio
+@patch("scraper.get_symbol_id", return_value="511")
+async def test_historical_only_fetches_gaps(mock_symbol, store, monkeypatch):
+    """Un second appel sur une periode passee est servi sans upstream"""
+    iter_pages, calls = _fake_pages([_row("2024-01-03", 101.0), _row("2024-01-02", 100.0)])
+    monkeypatch.setattr(scraper, "_iter_history_pages", iter_pages)
+    first = await scraper.get_historical("atw", "2024-01-01", "2024-01-05")
+    second = await scraper.get_historical("ATW", "2024-01-02", "2024-01-03")
+    assert calls == [("2024-01-01", "2024-01-05")]
+    assert [r["close"] for r in first] == [101.0, 100.0]
+    assert second == first
+
+
+@pytest.mark.asyncio
+@patch("scraper.get_symbol_id", return_value="511")
+async def test_iter_historical_interleaves_store_and_upstream(mock_symbol, store, monkeypatch):
+    """Les blocs stockes et les pages upstream sont produits du plus recent au plus ancien"""
+    store.save("ATW", [_row("2024-01-02")], "2024-01-01", "2024-01-05")
+    iter_pages, calls = _fake_pages([_row("2024-01-09")], [_row("2024-01-08")])
+    monkeypatch.setattr(scraper, "_iter_history_pages", iter_pages)
+    chunks = await scraper.iter_historical("ATW", "2024-01-01", "2024-01-10")
+    dates = [[r["date"][:10] for r in chunk] async for chunk in chunks]
+    assert calls == [("2024-01-06", "2024-01-10")]
+    assert dates == [["2024-01-09"], ["2024-01-08"], ["2024-01-02"]]
+
+
+@pytest.mark.asyncio
+@patch("scraper.get_symbol_id", return_value="511")
+async def test_interrupted_history_is_not_returned(mock_symbol, store, monkeypatch):
+    """Une pagination interrompue leve une erreur au lieu de tronquer le resultat"""
+    async def failing_pages(symbol_id, start, end):
+        yield [_row("2024-01-03")]
+        raise scraper.IncompleteHistory("page offset=250")
+
+    monkeypatch.setattr(scraper, "_iter_history_pages", failing_pages)
+    with pytest.raises(scraper.IncompleteHistory):
+        await scraper.get_historical("ATW", "2024-01-01", "2024-01-05")
+    assert store.missing_ranges("ATW", "2024-01-01", "2024-01-05") == [("2024-01-01", "2024-01-05")]
+
+
+@pytest.mark.asyncio
+async def test_batch_flags_incomplete_ticker(store, monkeypatch):
+    async def fake_index():
+        return {"build_id": "b", "tickers": {"ATW": "511", "IAM": "512"}, "names": {}}
+
+    async def pages(symbol_id, start, end):
+        yield [_row("2024-01-02")]
+        if symbol_id == "512":
+            raise scraper.IncompleteHistory("page offset=250")
+
+    monkeypatch.setattr(scraper, "get_symbol_index", fake_index)
+    monkeypatch.setattr(scraper, "_iter_history_pages", pages)
+    batch, _ = await scraper.iter_historical_batch(["ATW", "IAM"], "2024-01-01", "2024-01-05")
+    received = [(ticker, chunk is None) async for ticker, chunk in batch]
+    assert ("IAM", True) in received
+    assert ("ATW", True) not in received
+
+
+def test_iter_rows_chunks(store):
+    store.save("ATW", [_row(f"2024-01-{d:02d}") for d in range(1, 8)], "2024-01-01", "2024-01-07")
+    chunks = list(store.iter_rows("ATW", "2024-01-01", "2024-01-07", chunk_size=3))
+    assert [len(c) for c in chunks] == [3, 3, 1]
+    assert chunks[0][0]["date"].startswith("2024-01-07")
+
+
+@pytest.mark.asyncio
+async def test_batch_resolves_index_once_and_reports_missing(store, monkeypatch):
+    """Les ids sont resolus une fois, les tickers inconnus sont signales"""
+    async def fake_index():
+        return {"build_id": "b", "tickers": {"ATW": "511", "IAM": "512"}, "names": {}}
+
+    iter_pages, calls = _fake_pages([_row("2024-01-02")])
+    monkeypatch.setattr(scraper, "get_symbol_index", fake_index)
+    monkeypatch.setattr(scraper, "_iter_history_pages", iter_pages)
+    batch, missing = await scraper.iter_historical_batch(["atw", "iam", "xxx"], "2024-01-01", "2024-01-05")
+    received = {ticker: chunk async for ticker, chunk in batch}
+    assert missing == ["XXX"]
+    assert set(received) == {"ATW", "IAM"}
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_spaces_calls():
+    limiter = RateLimiter(rate=50)
+    start = time.monotonic()
+    for _ in range(4):
+        await limiter.wait()
+    assert time.monotonic() - start >= 3 / 50 * 0.9
@@ -0,0 +1,65 @@
+"""
+Tests de la couche de resilience upstream (retries, delai, disjoncteur)
+"""
+import asyncio
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+import http_client
+from http_client import CircuitBreaker, UpstreamUnavailable
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(http_client, "_breakers", {})
+    monkeypatch.setattr(http_client, "RETRY_BACKOFF", 0)
+
+
+@pytest.mark.asyncio
+async def test_retry_after_transient_error():
+    responses = [httpx.Response(503), httpx.ConnectError("reset"), httpx.Response(200)]
+    with patch("http_client.get", side_effect=responses) as mock_get:
+        r = await http_client.fetch("market", "https://bvc/ticker")
+    assert r.status_code == 200
+    assert mock_get.call_count == 3
+    assert http_client.breakers_status()["market"]["consecutive_failures"] == 0
+
+
+@pytest.mark.asyncio
+async def test_client_errors_not_retried():
+    with patch("http_client.get", return_value=httpx.Response(404)) as mock_get:
+        assert (await http_client.fetch("market", "https://bvc/ticker")).status_code == 404
+    assert mock_get.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_deadline_bounds_latency():
+    async def hanging(*args):
+        await asyncio.sleep(10)
+
+    with patch("http_client.get", side_effect=hanging):
+        with pytest.raises(UpstreamUnavailable):
+            await asyncio.wait_for(http_client.fetch("market", "https://bvc/ticker", deadline=0.05), 1)
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_fails_fast(monkeypatch):
+    """Apres BREAKER_FAILURES echecs, plus aucun appel upstream jusqu'au reset"""
+    monkeypatch.setitem(http_client._breakers, "indices", CircuitBreaker("indices", failures=2, reset=60))
+    with patch("http_client.get", return_value=httpx.Response(502)) as mock_get:
+        for _ in range(3):
+            with pytest.raises(UpstreamUnavailable):
+                await http_client.fetch("indices", "https://bvc/indices", retries=0)
+    assert mock_get.call_count == 2
+    assert http_client.breakers_status()["indices"]["state"] == "open"
+
+
+def test_half_open_single_probe():
+    cb = CircuitBreaker("history", failures=1, reset=0)
+    cb.failure()
+    assert cb.state == "half_open"
+    assert cb.allow() and not cb.allow()
+    cb.success()
+    assert cb.state == "closed" and cb.allow()
@@ -0,0 +1,112 @@
+"""
+Tests de l'enregistreur intraday (ticks par seance, memmap, barres)
+"""
+import numpy as np
+import pytest
+
+import intraday
+import poller
+from intraday import IntradayStore
+from snapshot import MarketSnapshot
+
+DAY = "2026-10-14"
+# 2026-10-14 10:00:00 heure de Casablanca (UTC+1)
+T0 = 1791968400.0
+
+
+def _snap(offset, **prices):
+    rows = [{"ticker": t, "last_price": p, "volume": v, "qty_traded": q, "nb_trades": n}
+            for t, (p, v, q, n) in prices.items()]
+    return MarketSnapshot(rows, T0 + offset)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = IntradayStore(str(tmp_path / "intraday"))
+    yield store
+    store.close()
+
+
+def test_only_changed_rows_are_recorded(store):
+    assert store.record(_snap(0, ATW=(500, 0, 0, 0), IAM=(100, 0, 0, 0)), DAY) == 2
+    assert store.record(_snap(10, ATW=(500, 0, 0, 0), IAM=(100, 0, 0, 0)), DAY) == 0
+    assert store.record(_snap(20, ATW=(501.1, 5011, 10, 1), IAM=(100, 0, 0, 0)), DAY) == 1
+    ticks, previous = store.ticks("atw", DAY)
+    assert ticks["last_price"].tolist() == pytest.approx([500, 501.1])
+    assert ticks["ts"].tolist() == [T0 * 1000, (T0 + 20) * 1000]
+    assert previous is None
+    assert store.ticks("IAM", DAY)[0]["ts"].tolist() == [T0 * 1000]
+    assert store.ticks("BCP", DAY) is None
+    assert store.ticks("ATW", "2026-10-13") is None
+
+
+def test_recording_resumes_after_restart(tmp_path):
+    """Un nouveau processus reprend les tickers et derniers cours du fichier"""
+    first = IntradayStore(str(tmp_path))
+    first.record(_snap(0, ATW=(500, 0, 0, 0)), DAY)
+    first.close()
+    with open(tmp_path / f"{DAY}.ticks", "ab") as f:
+        f.write(b"\x00" * 7)   # ecriture interrompue
+    second = IntradayStore(str(tmp_path))
+    assert second.record(_snap(10, ATW=(500, 0, 0, 0), IAM=(90, 0, 0, 0)), DAY) == 1
+    second.close()
+    assert len(second.ticks("ATW", DAY)[0]) == 1
+    assert len(second.ticks("IAM", DAY)[0]) == 1
+
+
+def test_workers_taking_turns_share_the_session(tmp_path):
+    """Deux workers enregistrent la seance a tour de role (bail du poller) :
+    chacun repart des derniers cours et numeros de tickers ecrits par l'autre"""
+    first, second = IntradayStore(str(tmp_path)), IntradayStore(str(tmp_path))
+    assert first.record(_snap(0, ATW=(100, 0, 0, 0)), DAY) == 1
+    assert second.record(_snap(10, ATW=(100, 0, 0, 0), IAM=(90, 0, 0, 0)), DAY) == 1
+    assert first.record(_snap(20, ATW=(101, 0, 0, 0), BCP=(250, 0, 0, 0)), DAY) == 2
+    assert second.record(_snap(30, ATW=(100, 0, 0, 0), IAM=(90, 0, 0, 0), BCP=(250, 0, 0, 0)), DAY) == 1
+    first.close()
+    second.close()
+    assert (tmp_path / f"{DAY}.symbols").read_text().split() == ["ATW", "IAM", "BCP"]
+    assert first.ticks("ATW", DAY)[0]["last_price"].tolist() == [100, 101, 100]
+    assert first.ticks("IAM", DAY)[0]["last_price"].tolist() == [90]
+    assert first.ticks("BCP", DAY)[0]["last_price"].tolist() == [250]
+
+
+def test_time_range_uses_binary_search_bounds(store):
+    for i in range(10):
+        store.record(_snap(i * 60, ATW=(500 + i, 0, 0, 0)), DAY)
+    start = intraday.to_ms(DAY, "10:03", poller.BVC_TZ)
+    end = intraday.to_ms(DAY, "10:05", poller.BVC_TZ)
+    ticks, previous = store.ticks("ATW", DAY, start, end)
+    assert ticks["last_price"].tolist() == [503, 504, 505]
+    assert previous["last_price"] == 502
+
+
+def test_reads_see_ticks_appended_after_caching(store):
+    store.record(_snap(0, ATW=(500, 0, 0, 0)), DAY)
+    assert len(store.ticks("ATW", DAY)[0]) == 1
+    store.record(_snap(10, ATW=(501, 0, 0, 0)), DAY)
+    assert len(store.ticks("ATW", DAY)[0]) == 2
+
+
+def test_minute_bars_from_cumulative_volume(store):
+    store.record(_snap(0, ATW=(500, 1000, 2, 1)), DAY)
+    store.record(_snap(20, ATW=(505, 3000, 6, 2)), DAY)
+    store.record(_snap(40, ATW=(498, 3500, 7, 3)), DAY)
+    store.record(_snap(70, ATW=(499, 4500, 9, 5)), DAY)
+    ticks, previous = store.ticks("ATW", DAY)
+    bars = intraday.bar_rows(ticks, previous, 1)
+    assert [b["ticks"] for b in bars] == [3, 1]
+    assert bars[0]["time"] == "2026-10-14T09:00:00Z"
+    assert (bars[0]["open"], bars[0]["high"], bars[0]["low"], bars[0]["close"]) == (500, 505, 498, 498)
+    assert [b["volume"] for b in bars] == [3500, 1000]
+    assert [b["qty"] for b in bars] == [7, 2]
+    assert [b["trades"] for b in bars] == [3, 2]
+
+
+def test_tick_rows_keep_missing_values():
+    ticks = np.zeros(1, dtype=intraday.TICK_DTYPE)
+    ticks["ts"] = T0 * 1000
+    ticks["bid_price"] = np.nan
+    [row] = intraday.tick_rows(ticks)
+    assert row["time"] == "2026-10-14T09:00:00Z"
+    assert row["bid_price"] is None
+    assert row["qty_traded"] == 0
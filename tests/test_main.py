@@ -2,12 +2,21 @@
 Tests unitaires pour l'API Bourse de Casablanca
 Utilise TestClient de FastAPI (httpx en backend)
 """
+import json
 import pytest
 from unittest.mock import patch, MagicMock
 from fastapi.testclient import TestClient
 
 # Import de l'application
+import eod
+import history_store
+import http_client
+import intraday
+import main
+import warmup
 from main import app
+from records import HistorySeries
+from snapshot import IndexSnapshot, MarketSnapshot
 
 client = TestClient(app)
 
@@ -34,6 +43,15 @@ def test_health():
     assert data["status"] == "ok"
 
 
+def test_readiness_follows_warmup(monkeypatch):
+    """/health repond toujours ; /health/ready attend la fin du prechauffage"""
+    monkeypatch.setitem(warmup._state, "ready", False)
+    assert client.get("/health").status_code == 200
+    assert client.get("/health/ready").status_code == 503
+    monkeypatch.setitem(warmup._state, "ready", True)
+    assert client.get("/health/ready").json()["ready"] is True
+
+
 def test_docs_available():
     """Test que la documentation Swagger est accessible"""
     response = client.get("/docs")
@@ -105,7 +123,7 @@ MOCK_INDICES = [
 ]
 
 
-@patch("scraper.get_market_live", return_value=MOCK_STOCKS)
+@patch("scraper.get_market_snapshot", return_value=MarketSnapshot(MOCK_STOCKS))
 def test_market_endpoint(mock_scraper):
     """Test de l'endpoint /api/v1/market"""
     response = client.get("/api/v1/market")
@@ -117,14 +135,62 @@ def test_market_endpoint(mock_scraper):
     assert data["data"][0]["ticker"] == "ATW"
 
 
-@patch("scraper.get_market_live", return_value=[])
+@patch("scraper.get_market_snapshot", return_value=None)
 def test_market_empty(mock_scraper):
     """Test quand le marché ne retourne rien (503)"""
     response = client.get("/api/v1/market")
     assert response.status_code == 503
 
 
-@patch("scraper.get_market_live", return_value=MOCK_STOCKS)
+@patch("scraper.get_market_snapshot", return_value=MarketSnapshot(MOCK_STOCKS))
+def test_market_etag_not_modified(mock_scraper):
+    """If-None-Match sur l'ETag courant -> 304 sans corps"""
+    first = client.get("/api/v1/market")
+    etag = first.headers["etag"]
+    assert "last-modified" in first.headers
+    assert first.headers["cache-control"].startswith("public, max-age=")
+    second = client.get("/api/v1/market", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.content == b""
+    assert client.get("/api/v1/market", headers={"If-None-Match": '"autre"'}).status_code == 200
+
+
+@patch("scraper.get_market_snapshot", return_value=MarketSnapshot(MOCK_STOCKS))
+def test_market_compressed_body(mock_scraper, monkeypatch):
+    """Corps precalcule renvoye compresse selon Accept-Encoding"""
+    monkeypatch.setattr(main, "COMPRESS_MIN_SIZE", 0)
+    gzipped = client.get("/api/v1/market", headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert gzipped.json()["count"] == 2
+    plain = client.get("/api/v1/market", headers={"Accept-Encoding": "gzip;q=0"})
+    assert "content-encoding" not in plain.headers
+    assert plain.content == MarketSnapshot(MOCK_STOCKS).body
+    monkeypatch.setattr(main, "COMPRESS_MIN_SIZE", 10 ** 6)
+    assert "content-encoding" not in client.get("/api/v1/market").headers
+
+
+@patch("scraper.get_market_snapshot", return_value=MarketSnapshot(MOCK_STOCKS))
+def test_screener_endpoint(mock_scraper):
+    """Filtre, tri et projection ; requete invalide rejetee (422)"""
+    response = client.get("/api/v1/screener?filter=volume:gt:100000&sort=-capitalisation&fields=ticker,volume")
+    assert response.status_code == 200
+    assert response.json() == {"count": 1, "stale": False, "data": [{"ticker": "ATW", "volume": 125430.0}]}
+    data = client.get("/api/v1/screener?sort=-capitalisation&limit=1").json()["data"]
+    assert data[0]["ticker"] == "IAM"
+    assert data[0]["sector"] == "Telecoms"
+    assert client.get("/api/v1/screener?filter=price:gt:1").status_code == 422
+
+
+@patch("scraper.get_index_snapshot", return_value=IndexSnapshot(MOCK_INDICES))
+def test_indices_if_modified_since(mock_scraper):
+    last_modified = client.get("/api/v1/indices").headers["last-modified"]
+    response = client.get("/api/v1/indices", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+    stale = client.get("/api/v1/indices", headers={"If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"})
+    assert stale.status_code == 200
+
+
+@patch("scraper.get_market_snapshot", return_value=MarketSnapshot(MOCK_STOCKS))
 def test_stock_by_ticker_found(mock_scraper):
     """Test de la recherche d'une action par ticker"""
     response = client.get("/api/v1/stocks/ATW")
@@ -134,14 +200,41 @@ def test_stock_by_ticker_found(mock_scraper):
     assert data["name"] == "Attijariwafa Bank"
 
 
-@patch("scraper.get_market_live", return_value=MOCK_STOCKS)
+@patch("scraper.get_market_snapshot", return_value=MarketSnapshot(MOCK_STOCKS))
 def test_stock_by_ticker_not_found(mock_scraper):
     """Test quand le ticker n'existe pas (404)"""
     response = client.get("/api/v1/stocks/UNKNOWN")
     assert response.status_code == 404
 
 
-@patch("scraper.get_indices", return_value=MOCK_INDICES)
+@patch("scraper.get_market_snapshot", return_value=MarketSnapshot(MOCK_STOCKS))
+def test_stock_by_name(mock_scraper):
+    """Recherche par nom, insensible a la casse et aux espaces"""
+    response = client.get("/api/v1/stocks/maroc%20%20telecom")
+    assert response.status_code == 200
+    assert response.json()["ticker"] == "IAM"
+
+
+@patch("scraper.get_market_snapshot", return_value=MarketSnapshot(MOCK_STOCKS))
+def test_multi_stocks(mock_scraper):
+    """Plusieurs tickers resolus en un seul appel"""
+    response = client.get("/api/v1/stocks?tickers=iam,ATW,XXX")
+    assert response.status_code == 200
+    data = response.json()
+    assert [s["ticker"] for s in data["data"]] == ["IAM", "ATW"]
+    assert data["missing"] == ["XXX"]
+    assert data["stale"] is False
+
+
+@patch("scraper.get_index_snapshot", return_value=IndexSnapshot(MOCK_INDICES))
+def test_index_by_code(mock_scraper):
+    response = client.get("/api/v1/indices/masi")
+    assert response.status_code == 200
+    assert response.json()["name"] == "MASI"
+    assert client.get("/api/v1/indices/XXX").status_code == 404
+
+
+@patch("scraper.get_index_snapshot", return_value=IndexSnapshot(MOCK_INDICES))
 def test_indices_endpoint(mock_scraper):
     """Test de l'endpoint /api/v1/indices"""
     response = client.get("/api/v1/indices")
@@ -152,7 +245,7 @@ def test_indices_endpoint(mock_scraper):
     assert data["data"][0]["name"] == "MASI"
 
 
-@patch("scraper.get_market_live", return_value=MOCK_STOCKS)
+@patch("scraper.get_market_snapshot", return_value=MarketSnapshot(MOCK_STOCKS))
 def test_top_gainers(mock_scraper):
     """Test des top gainers"""
     response = client.get("/api/v1/top/gainers")
@@ -165,7 +258,7 @@ def test_top_gainers(mock_scraper):
     assert "ATW" in tickers
 
 
-@patch("scraper.get_market_live", return_value=MOCK_STOCKS)
+@patch("scraper.get_market_snapshot", return_value=MarketSnapshot(MOCK_STOCKS))
 def test_top_losers(mock_scraper):
     """Test des top losers"""
     response = client.get("/api/v1/top/losers")
@@ -176,7 +269,7 @@ def test_top_losers(mock_scraper):
     assert "IAM" in tickers
 
 
-@patch("scraper.get_market_live", return_value=MOCK_STOCKS)
+@patch("scraper.get_market_snapshot", return_value=MarketSnapshot(MOCK_STOCKS))
 def test_top_active(mock_scraper):
     """Test des actions les plus actives"""
     response = client.get("/api/v1/top/active")
@@ -185,7 +278,7 @@ def test_top_active(mock_scraper):
     assert "count" in data
 
 
-@patch("scraper.get_market_live", return_value=MOCK_STOCKS)
+@patch("scraper.get_market_snapshot", return_value=MarketSnapshot(MOCK_STOCKS))
 def test_market_summary(mock_scraper):
     """Test du résumé du marché"""
     response = client.get("/api/v1/market/summary")
@@ -199,7 +292,221 @@ def test_market_summary(mock_scraper):
     assert data["losers"] == 1
 
 
+@patch("scraper.get_market_snapshot", return_value=None)
+def test_market_summary_unavailable(mock_scraper):
+    """Resume indisponible quand l'upstream ne repond pas (503)"""
+    response = client.get("/api/v1/market/summary")
+    assert response.status_code == 503
+
+
+@patch("scraper.get_index_snapshot", return_value=IndexSnapshot(
+    [{"category": "Indices sectoriels", "name": "BANQUES", "code": "BANK", "value": 15000.0, "variation_pct": "0.4"}]))
+@patch("scraper.get_market_snapshot", return_value=MarketSnapshot(MOCK_STOCKS))
+def test_sectors_endpoints(mock_market, mock_indices):
+    """Agregats par secteur, avec l'indice sectoriel correspondant"""
+    data = client.get("/api/v1/sectors").json()
+    assert data["count"] == 2
+    assert [s["sector"] for s in data["data"]] == ["Telecoms", "Banques"]
+    banks = client.get("/api/v1/sectors/banques").json()
+    assert banks["advancers"] == 1
+    assert banks["variation_pct"] == 0.52
+    assert banks["top_gainers"][0]["ticker"] == "ATW"
+    assert banks["index"] == {"code": "BANK", "value": 15000.0, "variation_pct": 0.4}
+    assert client.get("/api/v1/sectors/telecoms").json()["index"] is None
+    assert client.get("/api/v1/sectors/mines").status_code == 404
+
+
+@patch("scraper.get_index_snapshot", return_value=None)
+@patch("scraper.get_market_snapshot", return_value=None)
+def test_sectors_unavailable(mock_market, mock_indices):
+    assert client.get("/api/v1/sectors").status_code == 503
+    assert client.get("/api/v1/sectors/banques").status_code == 503
+
+
+@patch("scraper.get_index_snapshot", return_value=IndexSnapshot(MOCK_INDICES).as_stale())
+@patch("scraper.get_market_snapshot", return_value=MarketSnapshot(MOCK_STOCKS).as_stale())
+def test_stale_flag_on_lookups_and_top_lists(mock_market, mock_indices):
+    """Dernier snapshot connu (upstream indisponible) : stale sur toutes les reponses qui en derivent"""
+    assert client.get("/api/v1/top/gainers").json()["stale"] is True
+    assert client.get("/api/v1/top/trades").json()["stale"] is True
+    assert client.get("/api/v1/stocks?tickers=ATW").json()["stale"] is True
+    assert client.get("/api/v1/stocks/ATW").json()["stale"] is True
+    assert client.get("/api/v1/indices/MASI").json()["stale"] is True
+
+
+@patch("scraper.get_market_snapshot", return_value=MarketSnapshot(MOCK_STOCKS))
+def test_top_capitalisation_and_sector(mock_scraper):
+    """Classements par capitalisation, globalement et par secteur"""
+    data = client.get("/api/v1/top/capitalisation").json()
+    assert [s["ticker"] for s in data["data"]] == ["IAM", "ATW"]
+    data = client.get("/api/v1/top/capitalisation?sector=banques").json()
+    assert [s["ticker"] for s in data["data"]] == ["ATW"]
+
+
 def test_historical_missing_params():
     """Test historique sans paramètres obligatoires (422)"""
     response = client.get("/api/v1/historical/ATW")
     assert response.status_code == 422
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Historique (JSON et streaming)
+# ─────────────────────────────────────────────────────────────────────────────
+
+MOCK_HISTORY = [
+    {"date": "2024-01-03T00:00:00", "open": 480.0, "close": 485.0, "last": 485.0, "high": 487.0,
+     "low": 479.0, "volume": 125430.0, "qty": 258, "trades": 45, "market_cap": 86700000000.0},
+    {"date": "2024-01-02T00:00:00", "open": 478.0, "close": 480.0, "last": 480.0, "high": 481.0,
+     "low": 477.0, "volume": 98000.0, "qty": 204, "trades": 38, "market_cap": 86000000000.0},
+]
+
+
+async def _mock_chunks(*args):
+    async def chunks():
+        for row in MOCK_HISTORY:
+            yield [row]
+    return chunks()
+
+
+@patch("scraper.get_historical", return_value=MOCK_HISTORY)
+def test_historical_json(mock_scraper):
+    response = client.get("/api/v1/historical/atw?from_date=2024-01-01&to_date=2024-01-05")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["ticker"] == "ATW"
+    assert data["count"] == 2
+
+
+@patch("scraper.iter_historical", side_effect=_mock_chunks)
+def test_historical_ndjson_stream(mock_scraper):
+    """format=ndjson : une ligne JSON par seance"""
+    response = client.get("/api/v1/historical/ATW?from_date=2024-01-01&to_date=2024-01-05&format=ndjson")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = response.text.strip().split("\n")
+    assert len(lines) == 2
+    assert json.loads(lines[0])["close"] == 485.0
+
+
+@patch("scraper.iter_historical", side_effect=_mock_chunks)
+def test_historical_csv_stream(mock_scraper):
+    """format=csv : en-tete + une ligne par seance"""
+    response = client.get("/api/v1/historical/ATW?from_date=2024-01-01&to_date=2024-01-05&format=csv")
+    assert response.status_code == 200
+    lines = response.text.strip().split("\r\n")
+    assert lines[0].startswith("date,open,close")
+    assert len(lines) == 3
+
+
+@patch("scraper.iter_historical", return_value=None)
+def test_historical_stream_unknown_ticker(mock_scraper):
+    response = client.get("/api/v1/historical/XXX?from_date=2024-01-01&to_date=2024-01-05&format=ndjson")
+    assert response.status_code == 404
+
+
+@patch("scraper.get_symbol_index", side_effect=http_client.UpstreamUnavailable("index des symboles indisponible"))
+def test_historical_without_symbol_index_is_unavailable(mock_index, tmp_path, monkeypatch):
+    """Index des symboles irrecuperable : 503, pas 'historique introuvable'"""
+    monkeypatch.setattr(history_store, "_default", history_store.HistoryStore(str(tmp_path / "history.db")))
+    response = client.get("/api/v1/historical/ATW?from_date=2024-01-01&to_date=2024-01-05")
+    assert response.status_code == 503
+
+
+def test_historical_invalid_format():
+    response = client.get("/api/v1/historical/ATW?from_date=2024-01-01&to_date=2024-01-05&format=xml")
+    assert response.status_code == 422
+
+
+async def _mock_batch(tickers, from_date, to_date):
+    async def chunks():
+        yield "ATW", MOCK_HISTORY[:1]
+        yield "IAM", MOCK_HISTORY[1:]
+        yield "ATW", MOCK_HISTORY[1:]
+    return chunks(), ["UNKNOWN"]
+
+
+@patch("scraper.iter_historical_batch", side_effect=_mock_batch)
+def test_historical_batch_json(mock_scraper):
+    """Historique multi-titres regroupe par ticker"""
+    response = client.get("/api/v1/historical?tickers=ATW,IAM,UNKNOWN&from_date=2024-01-01&to_date=2024-01-05")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["count"] == 2
+    assert len(data["data"]["ATW"]) == 2
+    assert data["missing"] == ["UNKNOWN"]
+
+
+@patch("scraper.iter_historical_batch", side_effect=_mock_batch)
+def test_historical_batch_csv_stream(mock_scraper):
+    response = client.get("/api/v1/historical?tickers=all&from_date=2024-01-01&to_date=2024-01-05&format=csv")
+    assert response.status_code == 200
+    lines = response.text.strip().split("\r\n")
+    assert lines[0].startswith("ticker,date")
+    assert lines[1].startswith("ATW,")
+    assert len(lines) == 4
+
+
+@patch("scraper.get_history_series", return_value=HistorySeries.from_rows(MOCK_HISTORY))
+def test_analytics_endpoint(mock_scraper):
+    response = client.get("/api/v1/analytics/ATW?from_date=2024-01-01&to_date=2024-01-05"
+                          "&interval=W&indicators=sma:2")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["count"] == 1
+    assert data["data"][0]["sessions"] == 2
+    assert data["data"][0]["close"] == 485.0
+    assert data["indicators"] == {"sma_2": [None]}
+    assert client.get("/api/v1/analytics/ATW?from_date=2024-01-01&to_date=2024-01-05"
+                      "&indicators=macd").status_code == 422
+
+
+def test_intraday_endpoint(tmp_path, monkeypatch):
+    """Ticks bruts, barres et fenetre horaire depuis l'enregistrement de la seance"""
+    store = intraday.IntradayStore(str(tmp_path))
+    monkeypatch.setattr(intraday, "_default", store)
+    t0 = 1791968400.0   # 2026-10-14 10:00 heure de Casablanca
+    for i, price in enumerate((500.0, 502.0, 501.0)):
+        store.record(MarketSnapshot([{"ticker": "ATW", "last_price": price, "volume": 1000.0 * (i + 1)}],
+                                    t0 + i * 40), "2026-10-14")
+    raw = client.get("/api/v1/intraday/ATW?date=2026-10-14&interval=raw").json()
+    assert [t["last_price"] for t in raw["data"]] == [500.0, 502.0, 501.0]
+    bars = client.get("/api/v1/intraday/ATW?date=2026-10-14&interval=1m").json()["data"]
+    assert [(b["open"], b["close"], b["volume"]) for b in bars] == [(500.0, 502.0, 2000.0), (501.0, 501.0, 1000.0)]
+    window = client.get("/api/v1/intraday/ATW?date=2026-10-14&start=10:01&end=10:02&interval=raw").json()
+    assert window["count"] == 1
+    assert client.get("/api/v1/intraday/IAM?date=2026-10-14").status_code == 404
+    assert client.get("/api/v1/intraday/ATW?date=2026-10-14&start=25h").status_code == 422
+
+
+def test_eod_endpoints(tmp_path, monkeypatch):
+    """Une seance archivee en JSON ou fichier brut, et plusieurs en CSV"""
+    monkeypatch.setattr(eod, "EOD_DIR", str(tmp_path))
+    eod.write("2026-10-13", "market", MOCK_STOCKS[:1])
+    eod.write("2026-10-14", "market", MOCK_STOCKS)
+    data = client.get("/api/v1/eod/2026-10-14").json()
+    assert data["count"] == 2
+    assert data["data"][0]["ticker"] == "ATW"
+    assert data["data"][0]["variation_pct"] == 0.52
+    raw = client.get("/api/v1/eod/2026-10-14?format=csv.gz")
+    assert raw.headers["content-type"] == "application/gzip"
+    assert raw.content[:2] == b"\x1f\x8b"
+    assert client.get("/api/v1/eod/2026-10-15").status_code == 404
+    assert client.get("/api/v1/eod/2026-10-14?kind=indices").status_code == 404
+    assert client.get("/api/v1/eod/hier").status_code == 422
+
+    lines = client.get("/api/v1/eod?from_date=2026-10-01&to_date=2026-10-31").text.splitlines()
+    assert lines[0].startswith("date,ticker,name")
+    assert [line.split(",")[:2] for line in lines[1:]] == [
+        ["2026-10-13", "ATW"], ["2026-10-14", "ATW"], ["2026-10-14", "IAM"]]
+    assert client.get("/api/v1/eod?from_date=2025-01-01&to_date=2025-01-31").status_code == 404
+
+
+@patch("scraper.get_market_snapshot", return_value=MarketSnapshot(MOCK_STOCKS))
+def test_metrics_endpoint(mock_scraper):
+    """Exposition Prometheus : latence par gabarit de route, cache"""
+    client.get("/api/v1/stocks/ATW")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'bvc_http_request_seconds_count{method="GET",route="/api/v1/stocks/{ticker}",status="200"}' in response.text
+    assert "bvc_cache_lookups_total" in response.text
@@ -0,0 +1,31 @@
+"""
+Tests des logs structures et de l'instrumentation du scraper
+"""
+import json
+import logging
+
+import pytest
+from prometheus_client import REGISTRY
+
+from observability import JsonFormatter, timed
+
+
+def test_json_log_line_carries_extra_fields():
+    record = logging.LogRecord("scraper", logging.WARNING, "scraper.py", 1, "marche live indisponible", (), None)
+    record.error = "timeout"
+    line = json.loads(JsonFormatter().format(record))
+    assert line["level"] == "warning"
+    assert line["msg"] == "marche live indisponible"
+    assert line["error"] == "timeout"
+
+
+@pytest.mark.asyncio
+async def test_timed_records_duration_and_errors():
+    @timed("test_fetch")
+    async def failing():
+        raise RuntimeError("upstream")
+
+    with pytest.raises(RuntimeError):
+        await failing()
+    assert REGISTRY.get_sample_value("bvc_scraper_call_seconds_count", {"function": "test_fetch"}) == 1
+    assert REGISTRY.get_sample_value("bvc_scraper_errors_total", {"function": "test_fetch"}) == 1
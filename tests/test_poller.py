@@ -0,0 +1,87 @@
+"""
+Tests du poller de fond (horaires de seance, publication des snapshots)
+"""
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+
+import intraday
+import poller
+import scraper
+from cache import snapshots
+
+
+@pytest.fixture(autouse=True)
+def reset_state(tmp_path, monkeypatch):
+    monkeypatch.setattr(intraday, "_default", intraday.IntradayStore(str(tmp_path / "intraday")))
+    snapshots.clear()
+    poller._state.update(last_success=None, last_error=None, consecutive_failures=0, next_interval=None)
+    yield
+    snapshots.clear()
+
+
+def _at(*args):
+    return datetime(*args, tzinfo=poller.BVC_TZ)
+
+
+def test_market_hours():
+    """Seance du lundi au vendredi, 09:30-15:30"""
+    assert poller.market_is_open(_at(2026, 10, 14, 10, 0))      # mercredi
+    assert not poller.market_is_open(_at(2026, 10, 14, 16, 0))  # apres la cloture
+    assert not poller.market_is_open(_at(2026, 10, 17, 10, 0))  # samedi
+
+
+def test_next_interval_fast_during_session():
+    assert poller.next_interval(_at(2026, 10, 14, 10, 0)) == poller.POLL_INTERVAL_OPEN
+
+
+def test_next_interval_waits_for_monday_when_paused(monkeypatch):
+    """En pause, le poller dort jusqu'a l'ouverture suivante"""
+    monkeypatch.setattr(poller, "POLL_INTERVAL_CLOSED", 0)
+    saturday_noon = _at(2026, 10, 17, 12, 0)
+    monday_open = _at(2026, 10, 19, 9, 30)
+    assert poller.next_interval(saturday_noon) == (monday_open - saturday_noon).total_seconds()
+
+
+@pytest.mark.asyncio
+@patch("scraper._fetch_indices", return_value=[{"code": "MASI"}])
+@patch("scraper._fetch_market_live", return_value=[{"ticker": "ATW"}])
+async def test_poll_publishes_snapshots(mock_market, mock_indices):
+    """Un cycle reussi alimente le cache lu par get_market_live/get_indices"""
+    await poller.poll_once()
+    assert [s.ticker for s in await scraper.get_market_live()] == ["ATW"]
+    assert [i.code for i in await scraper.get_indices()] == ["MASI"]
+    assert mock_market.call_count == 1
+    assert poller.status()["last_success"] is not None
+
+
+@pytest.mark.asyncio
+@patch("scraper._fetch_indices", return_value=[])
+@patch("scraper._fetch_market_live", return_value=[])
+async def test_poll_counts_consecutive_failures(mock_market, mock_indices):
+    await poller.poll_once()
+    await poller.poll_once()
+    assert poller.status()["consecutive_failures"] == 2
+
+
+@pytest.mark.asyncio
+@patch("scraper._fetch_indices", return_value=[{"code": "MASI"}])
+@patch("scraper._fetch_market_live", return_value=[{"ticker": "ATW", "last_price": 500.0}])
+async def test_poll_records_ticks_during_session(mock_market, mock_indices, monkeypatch):
+    """En seance, chaque snapshot publie est ajoute a l'enregistrement intraday"""
+    monkeypatch.setattr(poller, "market_is_open", lambda now=None: True)
+    await poller.poll_once()
+    store = intraday.default_store()
+    [day] = store.days()
+    ticks, _ = store.ticks("ATW", day)
+    assert ticks["last_price"].tolist() == [500.0]
+
+
+@pytest.mark.asyncio
+@patch("scraper._fetch_indices", return_value=[{"code": "MASI"}])
+@patch("scraper._fetch_market_live", return_value=[{"ticker": "ATW", "last_price": 500.0}])
+async def test_poll_records_nothing_outside_session(mock_market, mock_indices, monkeypatch):
+    monkeypatch.setattr(poller, "market_is_open", lambda now=None: False)
+    await poller.poll_once()
+    assert intraday.default_store().days() == []
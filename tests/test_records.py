@@ -0,0 +1,44 @@
+"""
+Tests des enregistrements types (parsing a l'ingestion, colonnes d'historique)
+"""
+import numpy as np
+
+from records import HistorySeries, StockQuote, to_int
+
+
+def test_stock_quote_parsed_once():
+    quote = StockQuote.from_dict({"ticker": "ATW", "last_price": "485.5", "volume": "",
+                                  "nb_trades": "45", "qty_traded": "258.0", "status": 1})
+    assert quote.last_price == 485.5
+    assert quote.volume is None
+    assert (quote.nb_trades, quote.qty_traded) == (45, 258)
+    assert quote.status == "1"
+    assert StockQuote.from_dict(quote.to_dict()) == quote
+    assert not hasattr(quote, "__dict__")
+
+
+def test_to_int_invalid():
+    assert to_int("n/a") is None
+    assert to_int(None) is None
+    assert to_int("nan") is None
+
+
+def _rows(n):
+    return [{"date": f"2024-01-{d:02d}", "open": "100", "close": 100.0 + d, "last": 100.0 + d, "high": 110.0,
+             "low": 90.0, "volume": "1000", "qty": 10, "trades": None, "market_cap": 1e9}
+            for d in range(1, n + 1)]
+
+
+def test_history_series_columns():
+    series = HistorySeries.concat([HistorySeries.from_rows(_rows(3)), HistorySeries.from_rows(_rows(2))])
+    assert len(series) == 5
+    assert series["close"].dtype == np.float64
+    assert float(series["close"][:3].mean()) == 102.0
+    assert series.dates[0] == np.datetime64("2024-01-01")
+    assert series.nbytes() == 5 * 8 * 10
+
+
+def test_history_series_rows_roundtrip():
+    rows = list(HistorySeries.from_rows(_rows(2)).rows())
+    assert rows[1] == {"date": "2024-01-02", "open": 100.0, "close": 102.0, "last": 102.0, "high": 110.0,
+                       "low": 90.0, "volume": 1000.0, "qty": 10, "trades": None, "market_cap": 1e9}
@@ -0,0 +1,278 @@
+"""
+Tests unitaires du scraper et du cache des snapshots
+(aucun appel reseau : les fetchs upstream sont mockes)
+"""
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+import scraper
+import screener
+from cache import SnapshotCache, snapshots
+from snapshot import MarketSnapshot
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    snapshots.clear()
+    yield
+    snapshots.clear()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Cache TTL
+# ─────────────────────────────────────────────────────────────────────────────
+
+@pytest.mark.asyncio
+async def test_cache_hit_and_miss():
+    """Le second appel est servi par le cache"""
+    cache = SnapshotCache(ttl=60)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return ["row"]
+
+    assert await cache.get_or_fetch("k", fetch) == ["row"]
+    assert await cache.get_or_fetch("k", fetch) == ["row"]
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert "k" in stats["entries"]
+
+
+@pytest.mark.asyncio
+async def test_cache_expires_after_ttl():
+    """Une entree plus vieille que le TTL declenche un nouveau fetch"""
+    cache = SnapshotCache(ttl=0)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return ["row"]
+
+    await cache.get_or_fetch("k", fetch)
+    await cache.get_or_fetch("k", fetch)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_cache_bounded_evicts_least_recently_read():
+    cache = SnapshotCache(ttl=60, max_entries=2)
+
+    async def fetch():
+        return ["row"]
+
+    await cache.get_or_fetch("a", fetch)
+    await cache.get_or_fetch("b", fetch)
+    await cache.get_or_fetch("a", fetch)
+    await cache.get_or_fetch("c", fetch)
+    assert list(cache.stats()["entries"]) == ["a", "c"]
+
+
+@pytest.mark.asyncio
+async def test_cache_does_not_store_empty_results():
+    """Un echec upstream ([]) n'est pas mis en cache"""
+    cache = SnapshotCache(ttl=60)
+
+    async def empty():
+        return []
+
+    async def rows():
+        return ["row"]
+
+    assert await cache.get_or_fetch("k", empty) == []
+    assert await cache.get_or_fetch("k", rows) == ["row"]
+
+
+@pytest.mark.asyncio
+async def test_cache_coalesces_concurrent_misses():
+    """N appels simultanes ne declenchent qu'un seul fetch upstream"""
+    cache = SnapshotCache(ttl=60)
+    calls = []
+
+    async def slow_fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return ["row"]
+
+    results = await asyncio.gather(*(cache.get_or_fetch("k", slow_fetch) for _ in range(10)))
+    assert len(calls) == 1
+    assert results == [["row"]] * 10
+
+
+@pytest.mark.asyncio
+async def test_cache_stale_while_revalidate():
+    """Juste apres expiration, l'ancienne valeur est servie et rafraichie en arriere-plan"""
+    cache = SnapshotCache(ttl=0)
+    cache.set("k", ["old"])
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        return ["new"]
+
+    assert await cache.get_or_fetch("k", fetch, swr=60) == ["old"]
+    await asyncio.sleep(0.05)
+    assert cache.peek("k") == ["new"]
+    assert cache.stats()["stale_hits"] == 1
+
+
+@pytest.mark.asyncio
+@patch("scraper._fetch_market_live", return_value=[])
+async def test_market_snapshot_served_stale_when_upstream_down(mock_fetch, monkeypatch):
+    """Upstream en echec : dernier snapshot connu, marque stale"""
+    monkeypatch.setattr(scraper, "CACHE_STALE_WHILE_REVALIDATE", 0)
+    last = MarketSnapshot([{"ticker": "ATW"}])
+    snapshots.set("market", last, ttl=0)
+    snapshot = await scraper.get_market_snapshot()
+    assert snapshot.stale and not last.stale
+    assert snapshot.stocks is last.stocks
+    assert b'"stale":true' in snapshot.body and snapshot.etag != last.etag
+    assert (await scraper.get_market_summary())["stale"] is True
+
+
+@pytest.mark.asyncio
+@patch("scraper._fetch_market_live", return_value=[{"ticker": "ATW"}])
+async def test_market_live_is_cached(mock_fetch):
+    """get_market_live ne refait pas d'appel upstream tant que le cache est frais"""
+    await scraper.get_market_live()
+    await scraper.get_market_live()
+    assert mock_fetch.call_count == 1
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Index des symboles
+# ─────────────────────────────────────────────────────────────────────────────
+
+SYMBOLS = {
+    "https://bvc/symbol/1": ("ATW", "Attijariwafa Bank", 511),
+    "https://bvc/symbol/2": ("IAM", "Maroc Telecom", 512),
+}
+
+
+@pytest.fixture
+def symbol_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper, "SYMBOL_INDEX_PATH", str(tmp_path / "symbols.json"))
+    monkeypatch.setattr(scraper, "_symbol_index", {"build_id": None, "tickers": {}, "names": {}})
+    monkeypatch.setattr(scraper, "_fetch_symbol_urls", _fake_symbol_urls)
+    monkeypatch.setattr(scraper, "_fetch_symbol", _fake_symbol)
+    return tmp_path / "symbols.json"
+
+
+async def _fake_symbol_urls(build_id):
+    return list(SYMBOLS)
+
+
+async def _fake_symbol(url, slots):
+    return SYMBOLS.get(url)
+
+
+@pytest.mark.asyncio
+@patch("scraper.get_build_id", return_value="build-1")
+async def test_symbol_id_by_ticker_and_name(mock_build, symbol_index):
+    """Resolution O(1) par ticker ou par nom, insensible a la casse"""
+    assert await scraper.get_symbol_id("atw") == "511"
+    assert await scraper.get_symbol_id("Maroc Telecom") == "512"
+    assert await scraper.get_symbol_id("UNKNOWN") is None
+
+
+@pytest.mark.asyncio
+@patch("scraper.get_build_id", return_value="build-1")
+async def test_symbol_index_persisted_and_reused(mock_build, symbol_index, monkeypatch):
+    """L'index est persiste et recharge sans appel upstream tant que le buildId ne change pas"""
+    await scraper.get_symbol_id("ATW")
+    assert symbol_index.exists()
+    monkeypatch.setattr(scraper, "_symbol_index", {"build_id": None, "tickers": {}, "names": {}})
+    monkeypatch.setattr(scraper, "_build_symbol_index", None)
+    assert await scraper.get_symbol_id("IAM") == "512"
+
+
+@pytest.mark.asyncio
+async def test_symbol_index_rebuilt_on_new_build_id(symbol_index):
+    """Un nouveau buildId declenche la reconstruction de l'index"""
+    with patch("scraper.get_build_id", return_value="build-1"):
+        await scraper.get_symbol_id("ATW")
+    with patch("scraper.get_build_id", return_value="build-2"):
+        assert (await scraper.get_symbol_index())["build_id"] == "build-2"
+
+
+@pytest.mark.asyncio
+async def test_incomplete_symbol_index_not_published(symbol_index, monkeypatch):
+    """Fiche symbole en echec : l'index partiel n'est ni persiste ni marque du
+    buildId, l'index precedent est garde et la reconstruction reessayee"""
+    async def flaky_symbol(url, slots):
+        return None if url.endswith("/2") else SYMBOLS.get(url)
+
+    monkeypatch.setattr(scraper, "_symbol_index_retry", {"at": 0.0})
+    monkeypatch.setattr(scraper, "_fetch_symbol", flaky_symbol)
+    with patch("scraper.get_build_id", return_value="build-1"):
+        index = await scraper.get_symbol_index()
+        assert index["build_id"] is None and index["tickers"] == {"ATW": "511"}
+        assert not symbol_index.exists()
+        monkeypatch.setattr(scraper, "_fetch_symbol", _fake_symbol)
+        monkeypatch.setattr(scraper, "SYMBOL_INDEX_RETRY", 0)
+        monkeypatch.setattr(scraper, "_symbol_index_retry", {"at": 0.0})
+        assert await scraper.get_symbol_id("IAM") == "512"
+    assert scraper._symbol_index["build_id"] == "build-1"
+    assert symbol_index.exists()
+
+    monkeypatch.setattr(scraper, "_fetch_symbol", flaky_symbol)
+    with patch("scraper.get_build_id", return_value="build-2"):
+        index = await scraper.get_symbol_index()
+    assert index["build_id"] == "build-1"
+    assert index["tickers"] == {"ATW": "511", "IAM": "512"}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Snapshot du marche (classements precalcules)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _stock(ticker, variation, volume, sector="Banques"):
+    return {"ticker": ticker, "name": ticker, "sector": sector, "variation_pct": variation,
+            "volume": volume, "capitalisation": "1000", "nb_trades": "3"}
+
+
+def _top(snap, ranking, limit, sector=None):
+    return screener.top(ranking, limit, snap, sector)
+
+
+def test_snapshot_rankings_parse_once():
+    """Valeurs str/float/None melangees : classements et resume coherents"""
+    snap = MarketSnapshot([
+        _stock("A", "1.5", "100"),
+        _stock("B", -2.0, None),
+        _stock("C", "0", "300", sector="Telecoms"),
+        _stock("D", "n/a", "200"),
+        _stock("E", "3.1", "50"),
+    ])
+    assert [s.ticker for s in _top(snap, "gainers", 10)] == ["E", "A"]
+    assert [s.ticker for s in _top(snap, "losers", 10)] == ["B"]
+    assert [s.ticker for s in _top(snap, "active", 2)] == ["C", "D"]
+    assert [s.ticker for s in _top(snap, "active", 10)] == ["C", "D", "A", "E"]
+    assert [s.ticker for s in _top(snap, "active", 10, sector="telecoms")] == ["C"]
+    assert snap.summary["gainers"] == 2
+    assert snap.summary["stable"] == 1
+    assert snap.summary["total_volume_mad"] == 650.0
+
+
+def test_snapshot_sector_aggregates():
+    """Agregats par secteur : breadth, volumes et variation ponderee par la
+    capitalisation de la veille"""
+    snap = MarketSnapshot([
+        {**_stock("A", "10", "100"), "capitalisation": "1100"},   # veille : 1000
+        {**_stock("B", "-50", "50"), "capitalisation": "500"},    # veille : 1000
+        _stock("C", "0", "300", sector="Telecoms"),
+        _stock("D", None, "200"),
+    ])
+    banks = snap.sector("banques")
+    assert (banks["instruments"], banks["advancers"], banks["decliners"], banks["unchanged"]) == (3, 1, 1, 0)
+    assert banks["volume_mad"] == 350.0
+    assert banks["trades"] == 9
+    assert banks["capitalisation_mad"] == 2600.0
+    assert banks["variation_pct"] == -20.0    # (1100 + 500) / (1000 + 1000) - 1
+    assert [m["ticker"] for m in banks["top_gainers"]] == ["A"]
+    assert [m["ticker"] for m in banks["top_losers"]] == ["B"]
+    assert [g["sector"] for g in snap.sector_list] == ["Banques", "Telecoms"]
+    assert snap.sector("Mines") is None
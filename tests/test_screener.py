@@ -0,0 +1,80 @@
+"""
+Tests du screener (compilation des requetes, filtres / tri / projection
+sur les colonnes du snapshot)
+"""
+import pytest
+
+import screener
+from snapshot import MarketSnapshot
+
+
+def _stock(ticker, sector, variation, volume, cap):
+    return {"ticker": ticker, "name": f"Societe {ticker}", "sector": sector,
+            "variation_pct": variation, "volume": volume, "capitalisation": cap}
+
+
+SNAP = MarketSnapshot([
+    _stock("ATW", "Banques", 2.5, 3e6, 9e10),
+    _stock("BCP", "Banques", 3.1, 5e5, 5e10),
+    _stock("CIH", "Banques", -1.0, 2e6, 1e10),
+    _stock("IAM", "Télécoms", 0.0, 4e6, None),
+    _stock("CSR", "Agroalimentaire", None, None, 2e10),
+])
+
+
+def _tickers(filters=None, sort=None, limit=50):
+    return [row.ticker for row in screener.run(screener.compile_plan(filters, sort, None, limit), SNAP)]
+
+
+def test_filters_are_combined():
+    assert _tickers("sector:eq:banques,variation_pct:gt:2,volume:gt:1000000") == ["ATW"]
+    assert _tickers("sector:in:Banques|Telecoms,variation_pct:gte:0") == ["ATW", "BCP", "IAM"]
+    assert _tickers("sector:ne:Banques") == ["IAM", "CSR"]
+    assert _tickers("capitalisation:set") == ["ATW", "BCP", "CIH", "CSR"]
+
+
+def test_missing_values_never_match_comparisons():
+    assert _tickers("variation_pct:lt:100") == ["ATW", "BCP", "CIH", "IAM"]
+
+
+def test_sort_puts_missing_values_last():
+    assert _tickers(sort="-capitalisation") == ["ATW", "BCP", "CSR", "CIH", "IAM"]
+    assert _tickers(sort="capitalisation") == ["CIH", "CSR", "BCP", "ATW", "IAM"]
+    assert _tickers(sort="-ticker", limit=2) == ["IAM", "CSR"]
+
+
+def test_projection():
+    plan = screener.compile_plan("ticker:eq:atw", None, "ticker,variation_pct", 10)
+    assert screener.run(plan, SNAP) == [{"ticker": "ATW", "variation_pct": 2.5}]
+
+
+def test_plans_are_cached_per_query():
+    assert screener.compile_plan("volume:gt:1", "-volume", None, 5) is \
+        screener.compile_plan("volume:gt:1", "-volume", None, 5)
+    assert screener.ranking_plan("gainers", 10, "Banques") is screener.ranking_plan("gainers", 10, "Banques")
+
+
+def test_top_lists_ranked_once_per_snapshot(monkeypatch):
+    """Classement calcule au premier appel, puis simples tranches"""
+    snap = MarketSnapshot(SNAP.rows())
+    assert [r.ticker for r in screener.top("gainers", 1, snap)] == ["BCP"]
+    assert [r.ticker for r in screener.top("gainers", 10, snap, "banques")] == ["BCP", "ATW"]
+    monkeypatch.setattr(screener, "select", None)
+    assert [r.ticker for r in screener.top("gainers", 10, snap)] == ["BCP", "ATW"]
+    assert [r.ticker for r in screener.top("gainers", 1, snap, "Banques")] == ["BCP"]
+    assert screener.top("gainers", 10, snap, "Mines") == []
+    assert set(snap.rankings) == {("gainers", None), ("gainers", "BANQUES")}
+
+
+@pytest.mark.parametrize("filters, sort, fields", [
+    ("isin:eq:MA0001", None, None),
+    ("volume:gt:abc", None, None),
+    ("volume:in:1|2", None, None),
+    ("sector:gt:B", None, None),
+    ("volume:gt", None, None),
+    (None, "-isin", None),
+    (None, None, "ticker,isin"),
+])
+def test_invalid_queries(filters, sort, fields):
+    with pytest.raises(ValueError):
+        screener.compile_plan(filters, sort, fields, 10)
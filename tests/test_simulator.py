@@ -0,0 +1,65 @@
+"""
+Tests du simulateur BVC des benchmarks (format des payloads, pagination,
+compteurs d'appels)
+"""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks import simulator
+
+client = TestClient(simulator.app)
+HISTORY = "/api/proxy/fr/api/bourse_data/instrument_history"
+
+
+@pytest.fixture(autouse=True)
+def no_latency(monkeypatch):
+    monkeypatch.setitem(simulator.state, "latency_ms", 0)
+    monkeypatch.setitem(simulator.state, "jitter_ms", 0)
+    monkeypatch.setitem(simulator.state, "failure_rate", 0)
+    client.post("/_config")
+
+
+def test_payloads_are_deterministic():
+    assert simulator.generate(5, seed=1) == simulator.generate(5, seed=1)
+    assert simulator.generate(5, seed=1) != simulator.generate(5, seed=2)
+
+
+def test_listing_points_to_symbol_pages():
+    r = client.get(f"/_next/data/{simulator.BUILD_ID}/fr/live-market/marche-actions-listing.json")
+    widget = r.json()["pageProps"]["node"]["field_vactory_paragraphs"][0]["field_vactory_component"]
+    hrefs = [item["relationships"]["symbol"]["links"]["related"]["href"]
+             for item in json.loads(widget["widget_data"])["extra_field"]["collection"]["data"]["data"]]
+    assert len(hrefs) == simulator.SIM_INSTRUMENTS
+    symbol = client.get(hrefs[0].replace("http://testserver", "")).json()["data"]["attributes"]
+    assert symbol["symbol"] == "S000"
+
+
+def test_history_filters_and_pages():
+    symbol_id = next(iter(simulator.PAYLOADS["symbols"]))
+    params = {
+        "filter[filter-historique-instrument-emetteur][condition][value]": symbol_id,
+        "filter[filter-date-start-vh][condition][value]": "2000-01-01",
+        "filter[filter-date-end-vh][condition][value]": "2100-01-01",
+        "page[limit]": 50,
+    }
+    first = client.get(HISTORY, params={**params, "page[offset]": 0}).json()["data"]
+    second = client.get(HISTORY, params={**params, "page[offset]": 50}).json()["data"]
+    assert len(first) == len(second) == 50
+    assert first[-1]["attributes"]["created"] > second[0]["attributes"]["created"]
+
+    day = first[3]["attributes"]["created"][:10]
+    params.update({"filter[filter-date-start-vh][condition][value]": day,
+                   "filter[filter-date-end-vh][condition][value]": day})
+    assert len(client.get(HISTORY, params=params).json()["data"]) == 1
+
+
+def test_stats_count_calls_and_failures():
+    client.get("/api/proxy/fr/api/bourse/dashboard/ticker")
+    client.get("/fr")
+    assert client.get("/_stats").json() == {"total": 2, "calls": {"market": 1, "home": 1}}
+
+    client.post("/_config", params={"failure_rate": 1})
+    assert client.get("/api/proxy/fr/api/bourse/dashboard/grouped_index_watch").status_code == 503
+    assert client.get("/_stats").json()["total"] == 1
@@ -0,0 +1,92 @@
+"""
+Tests du flux push (diff entre snapshots, broadcaster, WebSocket)
+"""
+import asyncio
+import copy
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+import stream
+from main import app
+from snapshot import MarketSnapshot
+from stream import Broadcaster, diff
+
+STOCKS = [
+    {"ticker": "ATW", "name": "Attijariwafa Bank", "sector": "Banques", "last_price": 485.0, "volume": "100"},
+    {"ticker": "IAM", "name": "Maroc Telecom", "sector": "Telecoms", "last_price": 112.5, "volume": "50"},
+]
+
+
+def _moved(price):
+    stocks = copy.deepcopy(STOCKS)
+    stocks[0]["last_price"] = price
+    return MarketSnapshot(stocks)
+
+
+def test_diff_only_changed_fields():
+    changes = diff(MarketSnapshot(STOCKS), _moved(490.0))
+    assert changes == {"ATW": {"last_price": 490.0}}
+
+
+def test_diff_new_ticker_sent_whole():
+    first = MarketSnapshot(STOCKS[:1])
+    added = diff(first, MarketSnapshot(STOCKS))["IAM"]
+    assert added["name"] == "Maroc Telecom"
+    assert added["volume"] == 50.0
+
+
+@pytest.mark.asyncio
+async def test_broadcaster_one_diff_filtered_per_subscriber():
+    """Un seul diff par snapshot, filtre par ticker/secteur pour chaque abonne"""
+    broadcaster = Broadcaster()
+    with patch("scraper.get_market_snapshot", return_value=MarketSnapshot(STOCKS)):
+        banks = await broadcaster.subscribe(sector="banques")
+        telecoms = await broadcaster.subscribe(tickers=["IAM"])
+    try:
+        assert [r["ticker"] for r in (await banks.get())["data"]] == ["ATW"]
+        assert [r["ticker"] for r in (await telecoms.get())["data"]] == ["IAM"]
+        broadcaster.publish(MarketSnapshot(STOCKS))
+        broadcaster.publish(_moved(490.0))
+        assert (await banks.get())["data"] == {"ATW": {"last_price": 490.0}}
+        assert telecoms.queue.empty()
+    finally:
+        broadcaster.unsubscribe(banks)
+        broadcaster.unsubscribe(telecoms)
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_resynced(monkeypatch):
+    monkeypatch.setattr(stream, "STREAM_QUEUE_SIZE", 1)
+    broadcaster = Broadcaster()
+    with patch("scraper.get_market_snapshot", return_value=MarketSnapshot(STOCKS)):
+        sub = await broadcaster.subscribe()
+    try:
+        broadcaster.publish(MarketSnapshot(STOCKS))
+        broadcaster.publish(_moved(490.0))
+        message = await asyncio.wait_for(sub.get(), 1)
+        assert message["type"] == "snapshot"
+        assert message["data"][0]["last_price"] == 490.0
+    finally:
+        broadcaster.unsubscribe(sub)
+
+
+def test_websocket_snapshot_then_delta(monkeypatch):
+    monkeypatch.setattr(stream, "STREAM_INTERVAL", 0.01)
+    monkeypatch.setattr(stream.broadcaster, "last", None)
+    snapshots = [MarketSnapshot(STOCKS), _moved(490.0)]
+
+    async def next_snapshot():
+        return snapshots[0] if len(snapshots) == 1 else snapshots.pop(0)
+
+    with patch("scraper.get_market_snapshot", side_effect=next_snapshot):
+        with TestClient(app).websocket_connect("/api/v1/stream?tickers=ATW") as ws:
+            first = ws.receive_json()
+            assert first["type"] == "snapshot"
+            assert first["stale"] is False
+            assert [r["ticker"] for r in first["data"]] == ["ATW"]
+            delta = ws.receive_json()
+            assert delta == {"type": "delta", "fetched_at": delta["fetched_at"],
+                             "data": {"ATW": {"last_price": 490.0}}}
+    monkeypatch.setattr(stream.broadcaster, "last", None)
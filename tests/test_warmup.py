@@ -0,0 +1,53 @@
+"""
+Tests du prechauffage au demarrage (chargements paralleles, disponibilite)
+"""
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+import warmup
+
+
+@pytest.fixture(autouse=True)
+def reset_state(monkeypatch):
+    monkeypatch.setattr(warmup, "_state", {"task": None, "ready": False, "duration": None, "components": {}})
+
+
+@pytest.mark.asyncio
+@patch("scraper.get_index_snapshot", return_value=None)
+@patch("scraper.get_market_snapshot", return_value=["snapshot"])
+@patch("scraper.get_symbol_index", side_effect=RuntimeError("listing indisponible"))
+@patch("scraper.get_build_id", return_value="abc123")
+async def test_warmup_loads_components_concurrently(*mocks):
+    assert not warmup.ready()
+    await warmup.run()
+    status = warmup.status()
+    assert status["ready"] is True
+    assert status["components"] == {"build_id": "ok", "symbol_index": "error", "market": "ok", "indices": "empty"}
+    assert all(m.call_count == 1 for m in mocks)
+
+
+@pytest.mark.asyncio
+async def test_warmup_timeout_still_marks_ready(monkeypatch):
+    """Un upstream trop lent ne bloque pas la disponibilite au-dela de WARMUP_TIMEOUT"""
+    async def slow():
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(warmup, "WARMUP_TIMEOUT", 0.01)
+    with patch("scraper.get_build_id", side_effect=slow), \
+            patch("scraper.get_symbol_index", return_value={"tickers": {"ATW": "1"}}), \
+            patch("scraper.get_market_snapshot", side_effect=slow), \
+            patch("scraper.get_index_snapshot", side_effect=slow):
+        await warmup.run()
+    assert warmup.ready()
+    assert warmup.status()["components"]["symbol_index"] == "ok"
+    assert warmup.status()["components"]["market"] == "pending"
+
+
+@pytest.mark.asyncio
+async def test_warmup_disabled_is_ready_immediately(monkeypatch):
+    monkeypatch.setattr(warmup, "WARMUP_ENABLED", False)
+    warmup.start()
+    assert warmup.ready()
+    assert warmup._state["task"] is None
@@ -0,0 +1,79 @@
+"""
+Prechauffage au demarrage : buildId, index des symboles et premier snapshot
+du marche (et des indices) recuperes en parallele des le lancement, hors du
+chemin des requetes. /health reste un test de vie ; /health/ready indique si
+le prechauffage est termine (sonde de disponibilite).
+"""
+import asyncio
+import logging
+import os
+import time
+
+import scraper
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+# Au-dela, l'instance est declaree prete quand meme (les caches se rempliront a la demande)
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "30"))
+
+log = logging.getLogger(__name__)
+
+_state = {"task": None, "ready": False, "duration": None, "components": {}}
+
+# Composant -> fonction du scraper qui le charge en cache (resultat vide = echec)
+COMPONENTS = {
+    "build_id": "get_build_id",
+    "symbol_index": "get_symbol_index",
+    "market": "get_market_snapshot",
+    "indices": "get_index_snapshot",
+}
+
+
+async def _load(name: str, function: str):
+    try:
+        result = await getattr(scraper, function)()
+        if name == "symbol_index":
+            result = result["tickers"]
+        _state["components"][name] = "ok" if result else "empty"
+    except Exception as e:
+        _state["components"][name] = "error"
+        log.warning("prechauffage incomplet", extra={"component": name, "error": str(e)})
+
+
+async def run():
+    """Charge tous les composants en parallele (borne par WARMUP_TIMEOUT), puis marque l'instance prete"""
+    start = time.perf_counter()
+    _state["components"] = {name: "pending" for name in COMPONENTS}
+    try:
+        await asyncio.wait_for(asyncio.gather(*(_load(n, f) for n, f in COMPONENTS.items())), WARMUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        log.warning("prechauffage interrompu (delai depasse)", extra={"timeout": WARMUP_TIMEOUT})
+    _state["duration"] = round(time.perf_counter() - start, 3)
+    _state["ready"] = True
+    log.info("prechauffage termine", extra={"duration": _state["duration"], **_state["components"]})
+
+
+def start():
+    """Lance le prechauffage en tache de fond (l'instance repond deja aux tests de vie)"""
+    if not WARMUP_ENABLED:
+        _state["ready"] = True
+    elif _state["task"] is None:
+        _state["task"] = asyncio.ensure_future(run())
+
+
+async def stop():
+    task, _state["task"] = _state["task"], None
+    if task is not None and not task.done():
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+def ready() -> bool:
+    return _state["ready"]
+
+
+def status():
+    """Etat du prechauffage pour /health et /health/ready"""
+    return {"ready": _state["ready"], "duration": _state["duration"], "components": dict(_state["components"])}